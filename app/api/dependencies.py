@@ -0,0 +1,249 @@
+import os
+import time
+import threading
+from typing import Dict, Any, Optional, TYPE_CHECKING
+
+from app.config import settings
+from app.rag.job_queue import JobQueue, IngestionWorker
+
+if TYPE_CHECKING:
+    from app.rag.document_processor import DocumentProcessor
+    from app.rag.embeddings import EmbeddingsManager
+    from app.rag.rag_pipeline import RAGPipeline
+    from app.rag.cache import AnswerCache
+
+class Components:
+    """
+    Process-wide RAG components, built on first use
+    
+    Building them loads torch, the embedding model and Chroma, so nothing
+    heavy is imported until initialize() runs: either from the background
+    warm-up started in the app lifespan, or from the first request that
+    needs a component.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        
+        self.embeddings_manager: Optional["EmbeddingsManager"] = None
+        self.document_processor: Optional["DocumentProcessor"] = None
+        self.answer_cache: Optional["AnswerCache"] = None
+        self.rag_pipeline: Optional["RAGPipeline"] = None
+        self.lexical_index = None
+        self.ingestion_worker: Optional[IngestionWorker] = None
+        self._job_queue: Optional[JobQueue] = None
+        self._job_queue_lock = threading.Lock()
+    
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+    
+    @property
+    def job_queue(self) -> JobQueue:
+        """The ingestion job queue; cheap to open, so it does not wait for the model"""
+        if self._job_queue is None:
+            with self._job_queue_lock:
+                if self._job_queue is None:
+                    self._job_queue = JobQueue(settings.JOB_DB_PATH)
+        return self._job_queue
+    
+    def initialize(self) -> None:
+        """Build all components once; safe to call from several threads"""
+        if self._ready.is_set():
+            return
+        with self._lock:
+            if self._ready.is_set():
+                return
+            start = time.perf_counter()
+            try:
+                self._build()
+            except Exception as e:
+                self.error = str(e)
+                raise
+            self.error = None
+            self.load_seconds = time.perf_counter() - start
+            self._ready.set()
+            print(f"RAG components loaded in {self.load_seconds:.1f}s")
+    
+    def _build(self) -> None:
+        from app.rag.document_processor import DocumentProcessor
+        from app.rag.embeddings import EmbeddingsManager
+        from app.rag.retriever import DocumentRetriever
+        from app.rag.rag_pipeline import RAGPipeline
+        from app.rag.cache import AnswerCache
+        from app.rag.lexical_index import BM25Index
+        from app.rag.llm import create_llm
+        from app.rag.context_builder import ContextBuilder, TokenCounter
+        from app.rag.reranker import CrossEncoderReranker
+        
+        embeddings_manager = EmbeddingsManager(
+            embedding_model_name=settings.EMBEDDING_MODEL_NAME,
+            vector_store_path=settings.VECTOR_STORE_DIR,
+            encode_workers=settings.ENCODE_WORKERS,
+            query_cache_size=settings.QUERY_CACHE_SIZE,
+            query_cache_spill_path=settings.QUERY_CACHE_SPILL_PATH or None,
+            batch_max_size=settings.QUERY_BATCH_MAX_SIZE,
+            batch_max_wait_ms=settings.QUERY_BATCH_MAX_WAIT_MS,
+            embedding_backend=settings.EMBEDDING_BACKEND,
+            embedding_options=settings.embedding_options,
+            vector_store_backend=settings.VECTOR_STORE_BACKEND,
+            vector_store_options=settings.vector_store_options,
+            chunk_cache_path=settings.chunk_cache_path,
+            chunk_cache_max_entries=settings.CHUNK_EMBEDDING_CACHE_MAX_ENTRIES,
+            embedding_server_socket=settings.EMBEDDING_SERVER_SOCKET or None,
+            index_version_path=settings.INDEX_VERSION_PATH
+        )
+        
+        document_processor = DocumentProcessor(
+            chunk_size=settings.CHUNK_SIZE,
+            chunk_overlap=settings.CHUNK_OVERLAP,
+            raw_dir=settings.RAW_DATA_DIR,
+            processed_dir=settings.PROCESSED_DATA_DIR,
+            chunking_strategy=settings.CHUNKING_STRATEGY
+        )
+        
+        lexical_index = None
+        if settings.HYBRID_SEARCH_ENABLED:
+            lexical_index = BM25Index.load_or_build(
+                processed_dir=settings.PROCESSED_DATA_DIR,
+                index_path=settings.LEXICAL_INDEX_PATH
+            )
+            embeddings_manager.add_listener(lexical_index.on_vector_store_change)
+        
+        retriever = DocumentRetriever(
+            embeddings_manager,
+            lexical_index=lexical_index,
+            hybrid_candidates=settings.HYBRID_CANDIDATES,
+            rrf_k=settings.RRF_K,
+            min_score=settings.RETRIEVAL_MIN_SCORE,
+            mode=settings.RETRIEVAL_MODE,
+            mmr_lambda=settings.MMR_LAMBDA,
+            mmr_fetch_k=settings.MMR_FETCH_K
+        )
+        
+        answer_cache = None
+        if settings.ANSWER_CACHE_ENABLED:
+            answer_cache = AnswerCache(
+                max_size=settings.ANSWER_CACHE_MAX_SIZE,
+                ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+                similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD
+            )
+        
+        reranker = None
+        if settings.RERANK_ENABLED:
+            reranker = CrossEncoderReranker(
+                model_name=settings.RERANK_MODEL,
+                batch_size=settings.RERANK_BATCH_SIZE,
+                cache_size=settings.RERANK_CACHE_SIZE
+            )
+        
+        llm = create_llm(
+            settings.LLM_BACKEND,
+            model_name=settings.MODEL_NAME,
+            temperature=settings.TEMPERATURE,
+            max_tokens=settings.MAX_TOKENS,
+            base_url=settings.LLM_BASE_URL,
+            api_key=settings.LLM_API_KEY,
+            fake_latency_ms=settings.FAKE_LLM_LATENCY_MS,
+            fake_tokens_per_sec=settings.FAKE_LLM_TOKENS_PER_SEC,
+            fake_response_tokens=settings.FAKE_LLM_RESPONSE_TOKENS,
+            fake_failure_rate=settings.FAKE_LLM_FAILURE_RATE
+        )
+        
+        rag_pipeline = RAGPipeline(
+            retriever=retriever,
+            model_name=settings.MODEL_NAME,
+            temperature=settings.TEMPERATURE,
+            max_tokens=settings.MAX_TOKENS,
+            answer_cache=answer_cache,
+            llm_concurrency=settings.LLM_MAX_CONCURRENCY,
+            llm_max_retries=settings.LLM_MAX_RETRIES,
+            llm_retry_backoff=settings.LLM_RETRY_BACKOFF_SECONDS,
+            llm=llm,
+            context_builder=ContextBuilder(
+                TokenCounter(settings.MODEL_NAME),
+                token_budget=settings.CONTEXT_TOKEN_BUDGET
+            ),
+            reranker=reranker,
+            rerank_candidates=settings.RERANK_CANDIDATES,
+            rerank_top_n=settings.RERANK_TOP_N
+        )
+        
+        # Uploaded PDFs are extracted and embedded by worker processes
+        ingestion_worker = IngestionWorker(
+            self.job_queue,
+            document_processor,
+            embeddings_manager,
+            max_workers=settings.INGEST_JOB_WORKERS,
+            batch_size=settings.EMBED_BATCH_SIZE,
+            torch_threads=settings.INGEST_JOB_TORCH_THREADS,
+            nice=settings.INGEST_JOB_NICE,
+            lease_seconds=settings.INGEST_JOB_LEASE_SECONDS
+        )
+        ingestion_worker.start()
+        
+        self.embeddings_manager = embeddings_manager
+        self.document_processor = document_processor
+        self.lexical_index = lexical_index
+        self.answer_cache = answer_cache
+        self.rag_pipeline = rag_pipeline
+        self.ingestion_worker = ingestion_worker
+    
+    def start_warmup(self) -> threading.Thread:
+        """Initialize in a background thread so the server can start serving /health"""
+        def warmup():
+            try:
+                self.initialize()
+            except Exception as e:
+                print(f"Error warming up RAG components: {str(e)}")
+        
+        thread = threading.Thread(target=warmup, name="rag-warmup", daemon=True)
+        thread.start()
+        return thread
+    
+    def status(self) -> Dict[str, Any]:
+        """Readiness details for the /ready endpoint"""
+        if self.is_ready:
+            # The pid tells uvicorn workers apart (see benchmarks/bench_worker_memory.py)
+            return {"status": "ready", "load_seconds": self.load_seconds, "pid": os.getpid()}
+        if self.error:
+            return {"status": "error", "detail": self.error}
+        return {"status": "loading"}
+    
+    def notify_job_enqueued(self) -> None:
+        """Start ingesting a new job, loading components first if needed"""
+        if self.ingestion_worker is not None:
+            self.ingestion_worker.notify()
+        elif not self.is_ready:
+            self.start_warmup()
+    
+    def shutdown(self) -> None:
+        """Stop the ingestion worker, save pending index and cache changes and release executor threads"""
+        if self.ingestion_worker is not None:
+            self.ingestion_worker.stop()
+        if self.lexical_index is not None:
+            self.lexical_index.flush()
+        if self.embeddings_manager is not None:
+            self.embeddings_manager.close()
+
+components = Components()
+
+# FastAPI dependencies. They are sync so that the first, slow initialize()
+# runs in the threadpool instead of on the event loop.
+def get_rag_pipeline() -> "RAGPipeline":
+    components.initialize()
+    return components.rag_pipeline
+
+def get_embeddings_manager() -> "EmbeddingsManager":
+    components.initialize()
+    return components.embeddings_manager
+
+def get_document_processor() -> "DocumentProcessor":
+    components.initialize()
+    return components.document_processor
+
+def get_job_queue() -> JobQueue:
+    return components.job_queue
@@ -1,51 +1,54 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional, Tuple, Literal
 import os
-import shutil
+import json
+import time
+import hashlib
+import tempfile
 
 from app.config import settings
-from app.rag.document_processor import DocumentProcessor
-from app.rag.embeddings import EmbeddingsManager
-from app.rag.retriever import DocumentRetriever
-from app.rag.rag_pipeline import RAGPipeline
+from app.api.dependencies import (
+    components,
+    get_rag_pipeline,
+    get_embeddings_manager,
+    get_document_processor,
+    get_job_queue
+)
+from app.utils.helpers import format_sse, format_ndjson, load_manifest
+from app.utils.telemetry import span, record_span, log_sampled
 
 # Initialize router
 router = APIRouter()
 
-# Initialize RAG components
-embeddings_manager = EmbeddingsManager(
-    embedding_model_name=settings.EMBEDDING_MODEL_NAME,
-    vector_store_path=settings.VECTOR_STORE_DIR
-)
-
-document_processor = DocumentProcessor(
-    chunk_size=settings.CHUNK_SIZE,
-    chunk_overlap=settings.CHUNK_OVERLAP,
-    raw_dir=settings.RAW_DATA_DIR,
-    processed_dir=settings.PROCESSED_DATA_DIR
-)
-
-retriever = DocumentRetriever(embeddings_manager)
-
-rag_pipeline = RAGPipeline(
-    retriever=retriever,
-    model_name=settings.MODEL_NAME,
-    temperature=settings.TEMPERATURE,
-    max_tokens=settings.MAX_TOKENS
-)
+# Read size for streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 # Request/Response models
 class ChatRequest(BaseModel):
     """Chat request model"""
     message: str
     source_filter: Optional[str] = None
+    min_score: Optional[float] = None
+    retrieval_mode: Optional[Literal["similarity", "mmr"]] = None
+
+class BatchChatItem(BaseModel):
+    """One question of a batch chat request"""
+    message: str
+    source_filter: Optional[str] = None
+
+class BatchChatRequest(BaseModel):
+    """Batch chat request model"""
+    questions: List[BatchChatItem]
 
 class ChatResponse(BaseModel):
     """Chat response model"""
     response: str
     sources: List[Dict[str, Any]]
+    usage: Optional[Dict[str, Any]] = None
+    timings: Optional[Dict[str, float]] = None
 
 class DocumentResponse(BaseModel):
     """Document response model"""
@@ -53,97 +56,351 @@ class DocumentResponse(BaseModel):
     filename: str
     chunk_count: int
     status: str
+    job_id: Optional[str] = None
+    sha256: Optional[str] = None
+
+class JobResponse(BaseModel):
+    """Ingestion job status model"""
+    id: str
+    filename: str
+    document_id: str
+    sha256: Optional[str] = None
+    state: str
+    progress: float
+    chunk_count: Optional[int] = None
+    error: Optional[str] = None
+    attempts: int
+    timings: Dict[str, float]
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
 
 # Routes
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, rag_pipeline=Depends(get_rag_pipeline)):
     """Generate response with RAG pipeline"""
     try:
-        result = rag_pipeline.generate_response(
-            query=request.message,
-            k=settings.RETRIEVER_K,
-            source_filter=request.source_filter
+        with span("total"):
+            result = await rag_pipeline.agenerate_response(
+                query=request.message,
+                k=settings.RETRIEVER_K,
+                source_filter=request.source_filter,
+                min_score=request.min_score,
+                retrieval_mode=request.retrieval_mode
+            )
+        log_sampled(
+            "chat",
+            settings.CHAT_LOG_SAMPLE_RATE,
+            query_chars=len(request.message),
+            sources=[source["metadata"].get("chunk_id") for source in result["sources"]],
+            usage=result.get("usage"),
+            timings=result.get("timings")
         )
-        print(f"Chat response: {result}")
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest, rag_pipeline=Depends(get_rag_pipeline)):
+    """Stream sources, then LLM tokens, as server-sent events"""
+    async def event_stream():
+        try:
+            async for event in rag_pipeline.astream_response(
+                query=request.message,
+                k=settings.RETRIEVER_K,
+                source_filter=request.source_filter,
+                min_score=request.min_score,
+                retrieval_mode=request.retrieval_mode
+            ):
+                if event["event"] == "done":
+                    record_span("total", event["data"]["total_ms"] / 1000)
+                    log_sampled(
+                        "chat_stream",
+                        settings.CHAT_LOG_SAMPLE_RATE,
+                        query_chars=len(request.message),
+                        **event["data"]
+                    )
+                yield format_sse(event["event"], event["data"])
+        except Exception as e:
+            yield format_sse("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest, rag_pipeline=Depends(get_rag_pipeline)):
+    """
+    Answer a list of questions, streamed back as NDJSON
+    
+    Each line is one result with the question's index in the request, in
+    completion order. A line with an "error" key means that question failed.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="questions must not be empty")
+    if len(request.questions) > settings.CHAT_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.CHAT_BATCH_MAX_SIZE} questions per batch"
+        )
+    
+    async def result_stream():
+        start = time.perf_counter()
+        try:
+            async for item in rag_pipeline.agenerate_batch(
+                queries=[question.message for question in request.questions],
+                k=settings.RETRIEVER_K,
+                source_filters=[question.source_filter for question in request.questions]
+            ):
+                yield format_ndjson(item)
+        except Exception as e:
+            yield format_ndjson({"error": str(e)})
+        log_sampled(
+            "chat_batch",
+            settings.CHAT_LOG_SAMPLE_RATE,
+            questions=len(request.questions),
+            total_ms=(time.perf_counter() - start) * 1000
+        )
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
 @router.post("/upload", response_model=DocumentResponse)
 async def upload_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    document_id: Optional[str] = Form(None)
+    document_id: Optional[str] = Form(None),
+    job_queue=Depends(get_job_queue)
 ):
-    """Upload document and process it in the background"""
-    if not file.filename.lower().endswith(".pdf"):
+    """Upload document and queue it for ingestion by the worker processes"""
+    filename = os.path.basename(file.filename or "")
+    if not filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
     # Save file to raw directory
-    file_path = os.path.join(settings.RAW_DATA_DIR, file.filename)
+    file_path = os.path.join(settings.RAW_DATA_DIR, filename)
+    tmp_path = None
     
     try:
         # Create directory if it doesn't exist
         os.makedirs(settings.RAW_DATA_DIR, exist_ok=True)
         
-        # Save uploaded file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Stream the upload to a temp file next to the target, hashing as we go
+        max_bytes = settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024
+        tmp_path, sha256, size = await save_upload(file, settings.RAW_DATA_DIR, max_bytes)
         
-        # Process document in background
-        background_tasks.add_task(process_document, file.filename)
+        # Same content already indexed (under any name): nothing to do
+        indexed = find_indexed_document(sha256)
+        if indexed is not None:
+            indexed_filename, entry = indexed
+            log_sampled("upload_skipped", 1.0, filename=filename, indexed_filename=indexed_filename, sha256=sha256)
+            return {
+                "document_id": os.path.splitext(indexed_filename)[0],
+                "filename": indexed_filename,
+                "chunk_count": entry.get("chunk_count", 0),
+                "status": "processed",
+                "sha256": sha256
+            }
         
-        # Add status tracking
-        print(f"Started background processing of {file.filename}")
+        # Same content already queued or being processed
+        pending = job_queue.find_pending(sha256)
+        if pending is not None:
+            return {
+                "document_id": pending["document_id"],
+                "filename": pending["filename"],
+                "chunk_count": 0,
+                "status": pending["state"],
+                "job_id": pending["id"],
+                "sha256": sha256
+            }
+        
+        # Atomically replace any previous version of the file
+        os.replace(tmp_path, file_path)
+        tmp_path = None
+        
+        # Queue the document; chunks are keyed by the filename's document ID
+        job = job_queue.enqueue(filename, os.path.splitext(filename)[0], sha256=sha256)
+        components.notify_job_enqueued()
+        log_sampled("upload_queued", 1.0, job_id=job["id"], filename=filename, size_bytes=size)
         
         return {
-            "document_id": document_id or os.path.splitext(file.filename)[0],
-            "filename": file.filename,
-            "chunk_count": 0,  # Will be updated after processing
-            "status": "processing"
+            "document_id": document_id or job["document_id"],
+            "filename": filename,
+            "chunk_count": 0,  # Available from /jobs/{job_id} once processed
+            "status": job["state"],
+            "job_id": job["id"],
+            "sha256": sha256
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        if os.path.exists(file_path):
-            os.remove(file_path)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, job_queue=Depends(get_job_queue)):
+    """Return the state, progress and timings of an ingestion job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
 
 @router.get("/documents", response_model=List[Dict[str, Any]])
-async def list_documents():
-    """List all processed documents"""
+async def list_documents(request: Request, response: Response, job_queue=Depends(get_job_queue)):
+    """
+    List documents with their ingestion status and chunk count
+    
+    The list carries an ETag; clients that send it back in If-None-Match
+    get an empty 304 while nothing has changed.
+    """
     try:
+        manifest = load_manifest(settings.PROCESSED_DATA_DIR)
+        jobs = job_queue.latest_by_document()
+        
         documents = []
         # List files in raw directory
         if os.path.exists(settings.RAW_DATA_DIR):
             for filename in os.listdir(settings.RAW_DATA_DIR):
                 if filename.lower().endswith(".pdf"):
                     doc_id = os.path.splitext(filename)[0]
+                    job = jobs.get(doc_id)
+                    entry = manifest.get(filename)
+                    if job is not None and job["state"] != "done":
+                        status = job["state"]
+                    elif entry is not None or is_document_processed(doc_id):
+                        status = "processed"
+                    else:
+                        status = "pending"
                     documents.append({
                         "document_id": doc_id,
                         "filename": filename,
-                        "status": "processed" if is_document_processed(doc_id) else "pending"
+                        "status": status,
+                        "chunk_count": entry.get("chunk_count", 0) if entry else 0,
+                        "job_id": job["id"] if job else None
                     })
+        documents.sort(key=lambda doc: doc["filename"])
+        
+        payload = json.dumps(documents, sort_keys=True).encode("utf-8")
+        etag = f'"{hashlib.sha256(payload).hexdigest()[:32]}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
         return documents
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.delete("/documents/{document_id}", response_model=Dict[str, Any])
+async def delete_document(
+    document_id: str,
+    embeddings_manager=Depends(get_embeddings_manager),
+    document_processor=Depends(get_document_processor)
+):
+    """Delete a document's chunks, files and manifest entry"""
+    try:
+        # Vector store deletes, the lexical index save and file removal all block
+        deleted_chunks, filenames = await run_in_threadpool(
+            remove_document_data, document_id, embeddings_manager, document_processor
+        )
+        
+        if not deleted_chunks and not filenames:
+            raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+        
+        return {
+            "document_id": document_id,
+            "deleted_chunks": deleted_chunks,
+            "status": "deleted"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/stats", response_model=Dict[str, Any])
+async def get_stats():
+    """Return cache, query encoding and ingestion job statistics"""
+    jobs = components.job_queue.counts()
+    if not components.is_ready:
+        return {"answer_cache": None, "embeddings": None, "jobs": jobs, "ready": False}
+    answer_cache = components.answer_cache
+    embeddings_manager = components.embeddings_manager
+    reranker = components.rag_pipeline.reranker
+    return {
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "embeddings": embeddings_manager.stats(),
+        "reranker": reranker.stats() if reranker else None,
+        "jobs": jobs
+    }
+
 # Helper functions
 def is_document_processed(doc_id: str) -> bool:
     """Check if document has been processed"""
     chunks_path = os.path.join(settings.PROCESSED_DATA_DIR, f"{doc_id}_chunks.json")
     return os.path.exists(chunks_path)
 
-async def process_document(filename: str):
-    """Process document and add to vector store"""
+async def save_upload(file: UploadFile, directory: str, max_bytes: int) -> Tuple[str, str, int]:
+    """
+    Stream an upload into a temp file in directory, computing its SHA-256
+    
+    The temp file is in the target directory so it can be renamed into
+    place atomically. Raises 413 as soon as the upload exceeds max_bytes.
+    
+    Returns:
+        Temp file path, hex SHA-256 and size in bytes
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+    
+    def write(out, block: bytes) -> None:
+        digest.update(block)
+        out.write(block)
+    
     try:
-        # Process PDF
-        chunks = document_processor.process_pdf(filename)
-        if not chunks:
-            return
-        
-        # Save chunks
-        document_processor.save_chunks({filename: chunks})
-        
-        # Add to vector store
-        embeddings_manager.add_documents(chunks)
-    except Exception as e:
-        print(f"Error processing document {filename}: {str(e)}")
\ No newline at end of file
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = await file.read(UPLOAD_CHUNK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File exceeds the {max_bytes // (1024 * 1024)} MB upload limit"
+                    )
+                await run_in_threadpool(write, out, block)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+def find_indexed_document(sha256: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Return (filename, manifest entry) of a PDF indexed with this content and current chunking params"""
+    params = {
+        "chunk_size": settings.CHUNK_SIZE,
+        "chunk_overlap": settings.CHUNK_OVERLAP,
+        "chunking_strategy": settings.CHUNKING_STRATEGY,
+    }
+    for filename, entry in load_manifest(settings.PROCESSED_DATA_DIR).items():
+        if entry.get("sha256") != sha256:
+            continue
+        if any(entry.get(key) != value for key, value in params.items()):
+            continue
+        if os.path.exists(os.path.join(settings.RAW_DATA_DIR, filename)):
+            return filename, entry
+    return None
+
+def remove_document_data(document_id: str, embeddings_manager, document_processor) -> Tuple[int, List[str]]:
+    """Delete a document's chunks and files; returns the chunk count and removed PDF filenames"""
+    deleted_chunks = embeddings_manager.delete_document(document_id)
+    
+    filenames = []
+    if os.path.exists(settings.RAW_DATA_DIR):
+        filenames = [
+            filename for filename in os.listdir(settings.RAW_DATA_DIR)
+            if filename.lower().endswith(".pdf") and os.path.splitext(filename)[0] == document_id
+        ]
+    for filename in filenames:
+        document_processor.remove_document(filename)
+    return deleted_chunks, filenames
\ No newline at end of file
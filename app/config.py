@@ -1,4 +1,5 @@
 import os
+from typing import Any, Dict, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -13,25 +14,163 @@ class Settings(BaseSettings):
     MODEL_NAME: str = os.getenv("MODEL_NAME", "gpt-3.5-turbo")
     TEMPERATURE: float = float(os.getenv("TEMPERATURE", "0.1"))
     MAX_TOKENS: int = int(os.getenv("MAX_TOKENS", "1024"))
+    # "openai", "local" (OpenAI-compatible server, e.g. llama.cpp or vLLM) or "fake" (offline)
+    LLM_BACKEND: str = os.getenv("LLM_BACKEND", "openai")
+    LLM_BASE_URL: str = os.getenv("LLM_BASE_URL", "http://localhost:8080/v1")
+    LLM_API_KEY: str = os.getenv("LLM_API_KEY", "")
+    FAKE_LLM_LATENCY_MS: float = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+    FAKE_LLM_TOKENS_PER_SEC: float = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "50"))
+    FAKE_LLM_RESPONSE_TOKENS: int = int(os.getenv("FAKE_LLM_RESPONSE_TOKENS", "40"))
+    FAKE_LLM_FAILURE_RATE: float = float(os.getenv("FAKE_LLM_FAILURE_RATE", "0"))
+    
+    # LLM fan-out for /chat/batch
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    LLM_RETRY_BACKOFF_SECONDS: float = float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "0.5"))
+    CHAT_BATCH_MAX_SIZE: int = int(os.getenv("CHAT_BATCH_MAX_SIZE", "500"))
+    
+    # Startup settings: load the embedding model and indexes in the background
+    # right after startup instead of on the first request
+    WARMUP_ON_STARTUP: bool = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+    
+    # Telemetry: stage histograms on /metrics and sampled JSON logs of chat requests
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    CHAT_LOG_SAMPLE_RATE: float = float(os.getenv("CHAT_LOG_SAMPLE_RATE", "0.05"))
     
     # Embedding settings
     EMBEDDING_MODEL_NAME: str = os.getenv(
         "EMBEDDING_MODEL_NAME", 
         "keepitreal/vietnamese-sbert"
     )
+    # "torch" (sentence-transformers) or "onnx" (ONNX Runtime; export the model
+    # with scripts/export_onnx.py first). ONNX_THREADS=0 uses all cores.
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "torch")
+    ONNX_MODEL_DIR: str = os.getenv("ONNX_MODEL_DIR", os.path.join(os.getenv("DATA_DIR", "data"), "onnx"))
+    ONNX_QUANTIZED: bool = os.getenv("ONNX_QUANTIZED", "true").lower() == "true"
+    ONNX_THREADS: int = int(os.getenv("ONNX_THREADS", "0"))
+    ONNX_BATCH_SIZE: int = int(os.getenv("ONNX_BATCH_SIZE", "32"))
+    # Unix socket of scripts/embedding_server.py: API workers (and upload jobs)
+    # send texts there instead of each loading the model; empty = in process
+    EMBEDDING_SERVER_SOCKET: str = os.getenv("EMBEDDING_SERVER_SOCKET", "")
+    EMBEDDING_SERVER_MAX_BATCH_SIZE: int = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH_SIZE", "64"))
+    EMBEDDING_SERVER_MAX_WAIT_MS: float = float(os.getenv("EMBEDDING_SERVER_MAX_WAIT_MS", "5"))
+    
+    # Vector store: "chroma" or "numpy" (memory-mapped vectors searched in
+    # process: exact below HNSW_THRESHOLD chunks, an hnswlib graph above it)
+    VECTOR_STORE_BACKEND: str = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+    HNSW_THRESHOLD: int = int(os.getenv("HNSW_THRESHOLD", "10000"))
+    HNSW_M: int = int(os.getenv("HNSW_M", "16"))
+    HNSW_EF_CONSTRUCTION: int = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+    HNSW_EF_SEARCH: int = int(os.getenv("HNSW_EF_SEARCH", "64"))
     
     # RAG settings
     RETRIEVER_K: int = int(os.getenv("RETRIEVER_K", "3"))
     
+    # Retrieval mode ("similarity" or "mmr") and score cutoff (chunks whose
+    # cosine similarity to the question is lower are dropped; unset keeps all)
+    RETRIEVAL_MODE: str = os.getenv("RETRIEVAL_MODE", "similarity")
+    RETRIEVAL_MIN_SCORE: Optional[float] = (
+        float(os.getenv("RETRIEVAL_MIN_SCORE")) if os.getenv("RETRIEVAL_MIN_SCORE") else None
+    )
+    MMR_LAMBDA: float = float(os.getenv("MMR_LAMBDA", "0.5"))
+    MMR_FETCH_K: int = int(os.getenv("MMR_FETCH_K", "20"))
+    
+    # Cross-encoder reranking (retrieve RERANK_CANDIDATES, keep RERANK_TOP_N)
+    RERANK_ENABLED: bool = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+    RERANK_MODEL: str = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+    RERANK_CANDIDATES: int = int(os.getenv("RERANK_CANDIDATES", "30"))
+    RERANK_TOP_N: int = int(os.getenv("RERANK_TOP_N", "3"))
+    RERANK_BATCH_SIZE: int = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+    RERANK_CACHE_SIZE: int = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+    
+    # Prompt context settings (tokens of retrieved text sent to the LLM)
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+    
+    # Hybrid retrieval settings (BM25 + vector, fused with reciprocal rank fusion)
+    HYBRID_SEARCH_ENABLED: bool = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+    HYBRID_CANDIDATES: int = int(os.getenv("HYBRID_CANDIDATES", "20"))
+    RRF_K: int = int(os.getenv("RRF_K", "60"))
+    
+    # Answer cache settings
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_MAX_SIZE: int = int(os.getenv("ANSWER_CACHE_MAX_SIZE", "1000"))
+    ANSWER_CACHE_TTL_SECONDS: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+    
+    # Concurrency settings
+    ENCODE_WORKERS: int = int(os.getenv("ENCODE_WORKERS", "2"))
+    
+    # Query embedding settings
+    QUERY_CACHE_SIZE: int = int(os.getenv("QUERY_CACHE_SIZE", "10000"))
+    QUERY_CACHE_SPILL_PATH: str = os.getenv("QUERY_CACHE_SPILL_PATH", "")
+    QUERY_BATCH_MAX_SIZE: int = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+    QUERY_BATCH_MAX_WAIT_MS: float = float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", "5"))
+    
     # Data paths
     DATA_DIR: str = os.getenv("DATA_DIR", "data")
     RAW_DATA_DIR: str = os.path.join(DATA_DIR, "raw")
     PROCESSED_DATA_DIR: str = os.path.join(DATA_DIR, "processed")
     VECTOR_STORE_DIR: str = os.path.join(DATA_DIR, "vectorstore")
+    LEXICAL_INDEX_PATH: str = os.path.join(PROCESSED_DATA_DIR, "lexical_index.pkl")
+    # Counter bumped on every vector store change, so each uvicorn worker
+    # invalidates its answer cache and reloads its BM25 index
+    INDEX_VERSION_PATH: str = os.path.join(DATA_DIR, "index_version")
+    
+    # Chunk embeddings cached by (model, SHA-256 of the text), so rebuilding the
+    # collection only embeds new text; least recently used entries are evicted
+    CHUNK_EMBEDDING_CACHE_ENABLED: bool = os.getenv("CHUNK_EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    CHUNK_EMBEDDING_CACHE_PATH: str = os.path.join(DATA_DIR, "embedding_cache.sqlite")
+    CHUNK_EMBEDDING_CACHE_MAX_ENTRIES: int = int(os.getenv("CHUNK_EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
     
     # RAG pipeline settings
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1000"))
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))
+    # "recursive" (character splitter) or "regulation" (Chương/Điều/Khoản boundaries)
+    CHUNKING_STRATEGY: str = os.getenv("CHUNKING_STRATEGY", "recursive")
+    
+    # Ingestion settings
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+    EMBED_BATCH_SIZE: int = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+    
+    # Uploads larger than this are rejected with 413
+    MAX_UPLOAD_SIZE_MB: int = int(os.getenv("MAX_UPLOAD_SIZE_MB", "50"))
+    
+    # Upload ingestion job queue (SQLite-backed, drained by worker processes)
+    JOB_DB_PATH: str = os.path.join(DATA_DIR, "jobs.sqlite")
+    INGEST_JOB_WORKERS: int = int(os.getenv("INGEST_JOB_WORKERS", "1"))
+    INGEST_JOB_TORCH_THREADS: int = int(os.getenv("INGEST_JOB_TORCH_THREADS", "1"))
+    INGEST_JOB_NICE: int = int(os.getenv("INGEST_JOB_NICE", "10"))
+    # A running job whose API process stops renewing it for this long is requeued
+    INGEST_JOB_LEASE_SECONDS: float = float(os.getenv("INGEST_JOB_LEASE_SECONDS", "60"))
+    
+    @property
+    def embedding_options(self) -> Dict[str, Any]:
+        """Options of the selected embedding backend for create_embedding_model"""
+        if self.EMBEDDING_BACKEND == "onnx":
+            return {
+                "model_dir": self.ONNX_MODEL_DIR,
+                "quantized": self.ONNX_QUANTIZED,
+                "threads": self.ONNX_THREADS,
+                "batch_size": self.ONNX_BATCH_SIZE
+            }
+        return {}
+    
+    @property
+    def chunk_cache_path(self) -> Optional[str]:
+        """Chunk embedding cache file, or None when the cache is disabled"""
+        return self.CHUNK_EMBEDDING_CACHE_PATH if self.CHUNK_EMBEDDING_CACHE_ENABLED else None
+    
+    @property
+    def vector_store_options(self) -> Dict[str, Any]:
+        """Options of the selected vector store backend for create_vector_store"""
+        if self.VECTOR_STORE_BACKEND == "numpy":
+            return {
+                "hnsw_threshold": self.HNSW_THRESHOLD,
+                "hnsw_m": self.HNSW_M,
+                "hnsw_ef_construction": self.HNSW_EF_CONSTRUCTION,
+                "hnsw_ef_search": self.HNSW_EF_SEARCH
+            }
+        return {}
     
     class Config:
         env_file = ".env"
@@ -1,15 +1,36 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
 
 from app.config import settings
 from app.api.routes import router as api_router
+from app.api.dependencies import components
+from app.utils.telemetry import TimingMiddleware, render_metrics
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create required directories and warm up RAG components in the background"""
+    os.makedirs(settings.RAW_DATA_DIR, exist_ok=True)
+    os.makedirs(settings.PROCESSED_DATA_DIR, exist_ok=True)
+    os.makedirs(settings.VECTOR_STORE_DIR, exist_ok=True)
+    
+    # Warm up now, or anyway when ingestion jobs are waiting from a previous run
+    counts = components.job_queue.counts()
+    if settings.WARMUP_ON_STARTUP or counts["queued"] or counts["extracting"] or counts["embedding"]:
+        components.start_warmup()
+    
+    yield
+    
+    components.shutdown()
 
 # Create FastAPI app
 app = FastAPI(
     title="University Regulations RAG Chatbot API",
     description="API for RAG-based chatbot for university regulations",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -19,8 +40,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Timing"],
 )
 
+# Trace each request's stages into the X-Timing header and /metrics
+if settings.METRICS_ENABLED:
+    app.add_middleware(TimingMiddleware)
+
 # Include API routes
 app.include_router(
     api_router,
@@ -36,17 +62,23 @@ async def root():
         "status": "active"
     }
 
-# Health check endpoint
+# Health check endpoint (liveness: the process is serving requests)
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
-# Create required directories
-@app.on_event("startup")
-async def startup_event():
-    os.makedirs(settings.RAW_DATA_DIR, exist_ok=True)
-    os.makedirs(settings.PROCESSED_DATA_DIR, exist_ok=True)
-    os.makedirs(settings.VECTOR_STORE_DIR, exist_ok=True)
+# Readiness endpoint (embedding model, vector store and indexes are loaded)
+@app.get("/ready")
+async def ready_check():
+    status = components.status()
+    if status["status"] != "ready":
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+# Prometheus metrics endpoint (stage latency and token histograms)
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
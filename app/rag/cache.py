@@ -0,0 +1,158 @@
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+def normalize_query(query: str) -> str:
+    """Normalize a question for exact-match lookups"""
+    query = unicodedata.normalize("NFC", query).lower()
+    return " ".join(query.split()).rstrip(" ?.!")
+
+class AnswerCache:
+    """
+    Two-layer cache for RAG answers
+    
+    The first layer matches the normalized query exactly; the second compares
+    the query embedding against cached entries with the same source filter and
+    k, using cosine similarity. Entries expire after a TTL, the least recently
+    used entry is evicted when the cache is full, and everything is dropped
+    when the vector store's index version changes.
+    """
+    
+    def __init__(
+        self,
+        max_size: int = 1000,
+        ttl_seconds: float = 3600,
+        similarity_threshold: float = 0.95
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        
+        self._entries: "OrderedDict[Tuple[str, Optional[str], int], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._index_version: Optional[int] = None
+        
+        # Counters
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    
+    def _check_version(self, index_version: int) -> None:
+        """Drop all entries if the index changed since they were cached"""
+        if self._index_version != index_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._index_version = index_version
+    
+    def _is_expired(self, entry: Dict[str, Any]) -> bool:
+        return time.monotonic() - entry["created_at"] > self.ttl_seconds
+    
+    def get_exact(
+        self,
+        query: str,
+        source_filter: Optional[str],
+        k: int,
+        index_version: int
+    ) -> Optional[Dict[str, Any]]:
+        """Look up an answer by normalized query; misses are not counted here"""
+        key = (normalize_query(query), source_filter, k)
+        with self._lock:
+            self._check_version(index_version)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._is_expired(entry):
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return dict(entry["result"])
+    
+    def get_semantic(
+        self,
+        embedding: List[float],
+        source_filter: Optional[str],
+        k: int,
+        index_version: int
+    ) -> Optional[Dict[str, Any]]:
+        """Look up the most similar cached question; counts a miss if none qualifies"""
+        query_vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._check_version(index_version)
+            
+            # Expire stale entries and collect candidates with the same filter and k
+            keys, vectors = [], []
+            for key, entry in list(self._entries.items()):
+                if self._is_expired(entry):
+                    del self._entries[key]
+                    self.expirations += 1
+                elif key[1] == source_filter and key[2] == k:
+                    keys.append(key)
+                    vectors.append(entry["embedding"])
+            
+            if keys:
+                # Embeddings are normalized, so the dot product is the cosine
+                scores = np.stack(vectors) @ query_vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.semantic_hits += 1
+                    return dict(self._entries[keys[best]]["result"])
+            
+            self.misses += 1
+            return None
+    
+    def set(
+        self,
+        query: str,
+        source_filter: Optional[str],
+        k: int,
+        index_version: int,
+        embedding: List[float],
+        result: Dict[str, Any]
+    ) -> None:
+        """Store an answer, evicting the least recently used entries if full"""
+        key = (normalize_query(query), source_filter, k)
+        with self._lock:
+            # The index changed while this answer was being generated
+            if self._index_version is not None and index_version != self._index_version:
+                return
+            self._index_version = index_version
+            self._entries[key] = {
+                "result": dict(result),
+                "embedding": np.asarray(embedding, dtype=np.float32),
+                "created_at": time.monotonic()
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self) -> None:
+        """Remove all cached answers"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss counters"""
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
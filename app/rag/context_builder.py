@@ -0,0 +1,206 @@
+from typing import List, Dict, Any, Optional, Tuple
+
+# Characters per token when tiktoken is unavailable; conservative for
+# Vietnamese, which tokenizes to fewer characters per token than English
+CHARS_PER_TOKEN_ESTIMATE = 3
+
+# Shortest suffix/prefix match accepted as an overlap between two chunks
+MIN_OVERLAP_CHARS = 10
+
+class TokenCounter:
+    """Count tokens with tiktoken, or estimate from length if it is unavailable"""
+    
+    def __init__(self, model_name: str = "gpt-3.5-turbo"):
+        self.encoding = None
+        try:
+            import tiktoken
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken unavailable ({str(e)}); estimating {CHARS_PER_TOKEN_ESTIMATE} characters per token")
+    
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return -(-len(text) // CHARS_PER_TOKEN_ESTIMATE)
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text to at most max_tokens tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text)[:max_tokens])
+        return text[:max_tokens * CHARS_PER_TOKEN_ESTIMATE]
+
+def chunk_position(doc: Dict[str, Any]) -> Optional[Tuple[str, int]]:
+    """(document, chunk index) parsed from a stable chunk ID, if it has one"""
+    chunk_id = doc["metadata"].get("chunk_id", "")
+    prefix, _, rest = chunk_id.rpartition("_chunk_")
+    index = rest.split("_", 1)[0]
+    if not prefix or not index.isdigit():
+        return None
+    return doc["metadata"].get("document_id", prefix), int(index)
+
+def overlap_length(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is a prefix of right"""
+    if len(right) < MIN_OVERLAP_CHARS:
+        return 0
+    probe = right[:MIN_OVERLAP_CHARS]
+    pos = left.find(probe, max(len(left) - len(right), 0))
+    while pos != -1:
+        if right.startswith(left[pos:]):
+            return len(left) - pos
+        pos = left.find(probe, pos + 1)
+    return 0
+
+def join_chunks(left: str, right: str) -> str:
+    """Join two consecutive chunks of a document without repeating shared text"""
+    # Regulation chunks of one article each repeat the article heading
+    left_heading, _, _ = left.partition("\n")
+    right_heading, newline, right_body = right.partition("\n")
+    if newline and right_heading == left_heading:
+        right = right_body
+    
+    if right in left:
+        return left
+    overlap = overlap_length(left, right)
+    return left + right[overlap:] if overlap else f"{left}\n{right}"
+
+class ContextBuilder:
+    """
+    Build the prompt context from retrieved chunks within a token budget
+    
+    Consecutive chunks of the same document are merged into one block
+    without their overlapping text, blocks contained in other blocks are
+    dropped, and blocks are packed in retrieval order (best first) until
+    the budget is used; a block that does not fit is truncated if enough
+    budget is left, otherwise skipped.
+    """
+    
+    def __init__(
+        self,
+        token_counter: Optional[TokenCounter] = None,
+        token_budget: int = 2000,
+        min_partial_tokens: int = 64
+    ):
+        self.token_counter = token_counter or TokenCounter()
+        self.token_budget = token_budget
+        self.min_partial_tokens = min_partial_tokens
+    
+    def _merge(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Group consecutive chunks of a document into blocks ranked by their best chunk"""
+        blocks: List[Dict[str, Any]] = []
+        by_position: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        
+        for rank, doc in enumerate(documents):
+            position = chunk_position(doc)
+            if position is not None and position in by_position:
+                continue  # Same chunk retrieved twice
+            block = {"rank": rank, "chunks": [(position, doc)]}
+            blocks.append(block)
+            if position is not None:
+                by_position[position] = block
+        
+        # Fold each block into the block holding the previous chunk of its document
+        for block in sorted(blocks, key=lambda b: b["chunks"][0][0] or ("", -1)):
+            position = block["chunks"][0][0]
+            if position is None:
+                continue
+            previous = by_position.get((position[0], position[1] - 1))
+            if previous is None or previous is block:
+                continue
+            previous["chunks"].extend(block["chunks"])
+            previous["rank"] = min(previous["rank"], block["rank"])
+            for chunk_position_, _ in block["chunks"]:
+                by_position[chunk_position_] = previous
+            block["chunks"] = []
+        
+        merged = []
+        for block in sorted((b for b in blocks if b["chunks"]), key=lambda b: b["rank"]):
+            docs = [doc for _, doc in block["chunks"]]
+            text = docs[0]["text"]
+            for doc in docs[1:]:
+                text = join_chunks(text, doc["text"])
+            
+            metadata = dict(docs[0]["metadata"])
+            pages = [
+                page for doc in docs
+                for page in (doc["metadata"].get("page_start"), doc["metadata"].get("page_end"))
+                if page is not None
+            ]
+            if pages:
+                metadata["page_start"], metadata["page_end"] = min(pages), max(pages)
+            if len(docs) > 1:
+                metadata["chunk_ids"] = [doc["metadata"].get("chunk_id") for doc in docs]
+            merged.append({"text": text, "metadata": metadata, "chunk_count": len(docs)})
+        return merged
+    
+    @staticmethod
+    def _dedupe(blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop blocks whose text already appears in a better-ranked or longer block"""
+        kept = []
+        for i, block in enumerate(blocks):
+            text = " ".join(block["text"].split())
+            duplicate = any(
+                text in " ".join(other["text"].split())
+                for j, other in enumerate(blocks)
+                if j != i and (len(other["text"]) > len(block["text"]) or (j < i and other["text"] == block["text"]))
+            )
+            if not duplicate:
+                kept.append(block)
+        return kept
+    
+    @staticmethod
+    def _header(i: int, block: Dict[str, Any]) -> str:
+        source = block["metadata"].get("source", "Unknown source")
+        return f"\n\nTRÍCH DẪN #{i} (Nguồn: {source}):\n"
+    
+    def build(self, documents: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Merge, deduplicate and pack retrieved chunks into a context string
+        
+        Args:
+            documents: Retrieved chunks, best first
+        
+        Returns:
+            Context string, the blocks it contains (as sources with text and
+            metadata, in citation order) and usage counts
+        """
+        blocks = self._dedupe(self._merge(documents))
+        
+        parts, used = [], []
+        remaining = self.token_budget
+        truncated = 0
+        for block in blocks:
+            header = self._header(len(used) + 1, block)
+            header_tokens = self.token_counter.count(header)
+            text_tokens = self.token_counter.count(block["text"])
+            available = remaining - header_tokens
+            
+            text = block["text"]
+            if text_tokens > available:
+                # Always keep some context; otherwise only truncate into a useful amount of space
+                if available < self.min_partial_tokens and used:
+                    continue
+                text = self.token_counter.truncate(text, available)
+                if not text:
+                    continue
+                text_tokens = self.token_counter.count(text)
+                truncated += 1
+            
+            parts.append(header + text)
+            used.append({"text": text, "metadata": block["metadata"]})
+            remaining -= header_tokens + text_tokens
+            if remaining <= 0:
+                break
+        
+        usage = {
+            "context_tokens": self.token_budget - remaining,
+            "token_budget": self.token_budget,
+            "retrieved_chunks": len(documents),
+            "context_blocks": len(used),
+            "truncated_blocks": truncated,
+        }
+        return "".join(parts), used, usage
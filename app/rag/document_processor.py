@@ -1,7 +1,198 @@
 import os
+import re
+import json
+import bisect
+import unicodedata
 import fitz  # PyMuPDF
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, List, Dict, Any, Optional, Iterable, Iterator, Tuple
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app.utils.helpers import MANIFEST_FILENAME, sha256_file, make_chunk_id, load_manifest
+
+CHUNKING_STRATEGIES = ("recursive", "regulation")
+
+# Structure of Vietnamese regulations: "Chương II", "Điều 14. Tên điều", "1. Khoản ..."
+CHAPTER_PATTERN = re.compile(r"^chương\s+([ivxlcdm]+|\d+)\b[.:]?\s*(.*)$", re.IGNORECASE)
+ARTICLE_PATTERN = re.compile(r"^điều\s+(\d+)\s*[.:]\s*(.*)$", re.IGNORECASE)
+CLAUSE_PATTERN = re.compile(r"^(?:khoản\s+)?(\d+)\s*[.)]\s+", re.IGNORECASE)
+
+# A buffered line: (text, page number, document offset)
+Line = Tuple[str, int, int]
+
+def _process_pdf_in_worker(config: Dict[str, Any], pdf_filename: str) -> List[Dict[str, Any]]:
+    """Process one PDF in a pool worker with its own DocumentProcessor"""
+    return DocumentProcessor(**config).process_pdf(pdf_filename)
+
+class RegulationTextSplitter:
+    """
+    Split Vietnamese regulations on Chương / Điều / Khoản boundaries
+    
+    An article that fits in chunk_size becomes a single chunk. Longer articles
+    are split between clauses, and each piece is prefixed with the article
+    heading so it stands on its own. Clauses that are still too long fall back
+    to the recursive character splitter. Only the current article is buffered.
+    """
+    
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        # Fallback splitters for long clauses, by the room left after the article heading
+        self._fallback_splitters: Dict[int, RecursiveCharacterTextSplitter] = {}
+        # Flush text without any headings before it grows unbounded
+        self.max_unit_size = 20 * chunk_size
+
+    def iter_chunks(
+        self,
+        pages: Iterable[Tuple[int, str]],
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Chunk a stream of page blocks on article and clause boundaries"""
+        metadata = metadata or {}
+        chapter: Dict[str, Any] = {}
+        article: Dict[str, Any] = {}
+        expect_chapter_title = False
+        unit: List[Line] = []
+        unit_size = 0
+        offset = 0
+        
+        for page_number, page_text in pages:
+            for raw_line in unicodedata.normalize("NFC", page_text).splitlines(keepends=True):
+                line_offset = offset
+                offset += len(raw_line)
+                line = raw_line.strip()
+                if not line:
+                    continue
+                
+                chapter_match = CHAPTER_PATTERN.match(line)
+                article_match = ARTICLE_PATTERN.match(line)
+                if chapter_match or article_match or unit_size > self.max_unit_size:
+                    yield from self._split_unit(unit, {**metadata, **chapter, **article})
+                    unit, unit_size = [], 0
+                
+                if chapter_match:
+                    title = chapter_match.group(2).strip()
+                    chapter = {"chapter": chapter_match.group(1).upper()}
+                    if title:
+                        chapter["chapter_title"] = title
+                    # The title is often on the line after "Chương II"
+                    expect_chapter_title = not title
+                    article = {}
+                    continue
+                
+                if expect_chapter_title and not article_match:
+                    chapter["chapter_title"] = line
+                    expect_chapter_title = False
+                    continue
+                expect_chapter_title = False
+                
+                if article_match:
+                    article = {"article": int(article_match.group(1))}
+                    if article_match.group(2).strip():
+                        article["article_title"] = article_match.group(2).strip()
+                
+                unit.append((line, page_number, line_offset))
+                unit_size += len(line) + 1
+        
+        yield from self._split_unit(unit, {**metadata, **chapter, **article})
+
+    def _make_chunk(
+        self,
+        text: str,
+        lines: List[Line],
+        metadata: Dict[str, Any],
+        clauses: List[int],
+        start_shift: int = 0
+    ) -> Dict[str, Any]:
+        chunk_metadata = {
+            **metadata,
+            "page_start": lines[0][1],
+            "page_end": lines[-1][1],
+            "start_index": lines[0][2] + start_shift,
+        }
+        if clauses:
+            chunk_metadata["clause_start"] = min(clauses)
+            chunk_metadata["clause_end"] = max(clauses)
+        return {"text": text, "metadata": chunk_metadata}
+
+    def _fallback_splitter(self, prefix_length: int) -> RecursiveCharacterTextSplitter:
+        """Recursive splitter whose pieces still fit in chunk_size once the prefix is added"""
+        # Headings longer than 3/4 of a chunk would leave almost no room; let those overflow
+        size = max(self.chunk_size - prefix_length, self.chunk_size // 4, 1)
+        splitter = self._fallback_splitters.get(size)
+        if splitter is None:
+            splitter = self._fallback_splitters[size] = RecursiveCharacterTextSplitter(
+                chunk_size=size,
+                chunk_overlap=min(self.chunk_overlap, size // 2),
+                length_function=len,
+                add_start_index=True,
+            )
+        return splitter
+
+    def _split_unit(self, unit: List[Line], metadata: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Turn one buffered article (or preamble) into chunks"""
+        if not unit:
+            return
+        
+        text = "\n".join(line for line, _, _ in unit)
+        if len(text) <= self.chunk_size:
+            yield self._make_chunk(text, unit, metadata, [])
+            return
+        
+        # Keep the article heading as a prefix for every piece
+        heading = unit[0] if ARTICLE_PATTERN.match(unit[0][0]) else None
+        prefix = f"{heading[0]}\n" if heading else ""
+        body = unit[1:] if heading else unit
+        
+        # Group lines into clauses
+        groups: List[Tuple[Optional[int], List[Line]]] = []
+        for line in body:
+            clause_match = CLAUSE_PATTERN.match(line[0])
+            if clause_match or not groups:
+                groups.append((int(clause_match.group(1)) if clause_match else None, []))
+            groups[-1][1].append(line)
+        
+        # Pack whole clauses into chunks
+        current: List[Line] = []
+        current_clauses: List[int] = []
+        current_size = len(prefix)
+        for clause, lines in groups:
+            clause_text = "\n".join(line for line, _, _ in lines)
+            clause_numbers = [clause] if clause is not None else []
+            
+            if current and current_size + len(clause_text) + 1 > self.chunk_size:
+                yield self._make_chunk(
+                    prefix + "\n".join(line for line, _, _ in current),
+                    current, metadata, current_clauses
+                )
+                current, current_clauses, current_size = [], [], len(prefix)
+            
+            if len(prefix) + len(clause_text) > self.chunk_size:
+                # A single clause too long for one chunk; each piece keeps the lines it overlaps
+                line_offsets: List[int] = []  # offset in clause_text where each line starts
+                position = 0
+                for line, _, _ in lines:
+                    line_offsets.append(position)
+                    position += len(line) + 1
+                for piece in self._fallback_splitter(len(prefix)).create_documents([clause_text]):
+                    start = piece.metadata["start_index"]
+                    end = start + max(len(piece.page_content), 1)
+                    first = max(bisect.bisect_right(line_offsets, start) - 1, 0)
+                    last = max(bisect.bisect_right(line_offsets, end - 1) - 1, 0)
+                    yield self._make_chunk(
+                        prefix + piece.page_content, lines[first:last + 1], metadata, clause_numbers,
+                        start_shift=start - line_offsets[first]
+                    )
+                continue
+            
+            current.extend(lines)
+            current_clauses.extend(clause_numbers)
+            current_size += len(clause_text) + 1
+        
+        if current:
+            yield self._make_chunk(
+                prefix + "\n".join(line for line, _, _ in current),
+                current, metadata, current_clauses
+            )
 
 class DocumentProcessor:
     """Process PDF documents and chunk them for RAG system"""
@@ -11,12 +202,19 @@ class DocumentProcessor:
         chunk_size: int = 1000,
         chunk_overlap: int = 200,
         raw_dir: str = "data/raw",
-        processed_dir: str = "data/processed"
+        processed_dir: str = "data/processed",
+        chunking_strategy: str = "recursive"
     ):
+        if chunking_strategy not in CHUNKING_STRATEGIES:
+            raise ValueError(
+                f"Unknown chunking strategy {chunking_strategy!r}, expected one of {CHUNKING_STRATEGIES}"
+            )
+        
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.raw_dir = raw_dir
         self.processed_dir = processed_dir
+        self.chunking_strategy = chunking_strategy
         
         # Create directories if they don't exist
         os.makedirs(self.raw_dir, exist_ok=True)
@@ -27,67 +225,256 @@ class DocumentProcessor:
             chunk_size=self.chunk_size,
             chunk_overlap=self.chunk_overlap,
             length_function=len,
+            add_start_index=True,
+        )
+        self.regulation_splitter = RegulationTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
         )
 
+    def iter_pages(
+        self,
+        pdf_path: str,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> Iterator[Tuple[int, str]]:
+        """Yield (page number, text) for each page, starting at 1
+        
+        progress, if given, is called with (pages done, total pages) after each page.
+        """
+        with fitz.open(pdf_path) as doc:
+            for page_num in range(len(doc)):
+                yield page_num + 1, doc.load_page(page_num).get_text()
+                if progress is not None:
+                    progress(page_num + 1, len(doc))
+
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extract text content from a PDF file"""
-        text = ""
         try:
-            doc = fitz.open(pdf_path)
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text += page.get_text()
-            doc.close()
-            return text
+            return "".join(text for _, text in self.iter_pages(pdf_path))
         except Exception as e:
             print(f"Error extracting text from {pdf_path}: {str(e)}")
             return ""
 
+    def iter_chunks(
+        self,
+        pages: Iterable[Tuple[int, str]],
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Chunk a stream of page blocks incrementally
+        
+        Only the text after the last emitted chunk is buffered, so memory stays
+        bounded by roughly one page plus one chunk regardless of document size.
+        Each chunk carries page_start/page_end and its character offset in the
+        document (start_index). With the "regulation" strategy, chunks follow
+        article and clause boundaries instead.
+        """
+        if self.chunking_strategy == "regulation":
+            yield from self.regulation_splitter.iter_chunks(pages, metadata)
+            return
+        
+        metadata = metadata or {}
+        buffer = ""
+        buffer_offset = 0  # document offset of buffer[0]
+        page_offsets: List[int] = []  # document offset where each buffered page starts
+        page_numbers: List[int] = []
+        
+        def make_chunk(text: str, start: int) -> Dict[str, Any]:
+            end = start + max(len(text), 1)
+            first = max(bisect.bisect_right(page_offsets, start) - 1, 0)
+            last = max(bisect.bisect_right(page_offsets, end - 1) - 1, 0)
+            return {
+                "text": text,
+                "metadata": {
+                    **metadata,
+                    "page_start": page_numbers[first],
+                    "page_end": page_numbers[last],
+                    "start_index": start,
+                }
+            }
+        
+        for page_number, page_text in pages:
+            page_offsets.append(buffer_offset + len(buffer))
+            page_numbers.append(page_number)
+            buffer += page_text
+            
+            # Wait for several chunks' worth of text so re-splitting the
+            # carried-over tail stays a small fraction of the work
+            if len(buffer) < 8 * self.chunk_size:
+                continue
+            
+            # Emit all but the last chunk, which may continue on the next page
+            splits = self.text_splitter.create_documents([buffer])
+            for split in splits[:-1]:
+                yield make_chunk(split.page_content, buffer_offset + split.metadata["start_index"])
+            
+            keep_from = splits[-1].metadata["start_index"] if splits else len(buffer)
+            buffer = buffer[keep_from:]
+            buffer_offset += keep_from
+            
+            # Drop pages that end before the buffered text
+            first_kept = max(bisect.bisect_right(page_offsets, buffer_offset) - 1, 0)
+            del page_offsets[:first_kept]
+            del page_numbers[:first_kept]
+        
+        for split in self.text_splitter.create_documents([buffer]):
+            yield make_chunk(split.page_content, buffer_offset + split.metadata["start_index"])
+
     def chunk_text(self, text: str, metadata: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """Split text into chunks with metadata"""
         chunks = self.text_splitter.create_documents([text], [metadata or {}])
         return [{"text": chunk.page_content, "metadata": chunk.metadata} for chunk in chunks]
 
-    def process_pdf(self, pdf_filename: str) -> List[Dict[str, Any]]:
+    def process_pdf(
+        self,
+        pdf_filename: str,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> List[Dict[str, Any]]:
         """Process a PDF file and return chunked documents with metadata"""
         pdf_path = os.path.join(self.raw_dir, pdf_filename)
         
         # Extract metadata from filename
         doc_id = os.path.splitext(pdf_filename)[0]
         
-        # Extract text from PDF
-        text = self.extract_text_from_pdf(pdf_path)
-        if not text:
-            return []
-        
         # Create metadata
         metadata = {
             "source": pdf_filename,
             "document_id": doc_id,
         }
         
-        # Chunk text
-        chunks = self.chunk_text(text, metadata)
-        
-        # Add page numbers and chunk IDs
-        for i, chunk in enumerate(chunks):
-            chunk["metadata"]["chunk_id"] = f"{doc_id}_chunk_{i}"
+        # Stream pages from the PDF into the chunker; chunks carry page numbers
+        chunks = []
+        try:
+            for i, chunk in enumerate(self.iter_chunks(self.iter_pages(pdf_path, progress), metadata)):
+                chunk["metadata"]["chunk_id"] = make_chunk_id(doc_id, i, chunk["text"])
+                chunks.append(chunk)
+        except Exception as e:
+            print(f"Error extracting text from {pdf_path}: {str(e)}")
+            return []
         
         return chunks
 
-    def process_all_pdfs(self) -> Dict[str, List[Dict[str, Any]]]:
-        """Process all PDFs in the raw directory"""
+    def list_pdfs(self) -> List[str]:
+        """List PDF filenames in the raw directory"""
+        return sorted(
+            filename for filename in os.listdir(self.raw_dir)
+            if filename.lower().endswith(".pdf")
+        )
+
+    def worker_config(self) -> Dict[str, Any]:
+        """Constructor arguments for recreating this processor in a worker process"""
+        return {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "raw_dir": self.raw_dir,
+            "processed_dir": self.processed_dir,
+            "chunking_strategy": self.chunking_strategy,
+        }
+
+    def process_all_pdfs(
+        self,
+        filenames: Optional[List[str]] = None,
+        workers: int = 1
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Process PDFs in the raw directory
+        
+        Args:
+            filenames: PDFs to process (defaults to every PDF in the raw directory)
+            workers: Number of processes for extraction and chunking
+            
+        Returns:
+            Dictionary mapping filename to its chunks
+        """
+        if filenames is None:
+            filenames = self.list_pdfs()
         all_chunks = {}
         
-        for filename in os.listdir(self.raw_dir):
-            if filename.lower().endswith(".pdf"):
+        if workers <= 1 or len(filenames) <= 1:
+            for filename in filenames:
                 print(f"Processing {filename}...")
                 chunks = self.process_pdf(filename)
                 if chunks:
                     all_chunks[filename] = chunks
+            return all_chunks
+        
+        config = self.worker_config()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_process_pdf_in_worker, config, filename): filename
+                for filename in filenames
+            }
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    chunks = future.result()
+                except Exception as e:
+                    print(f"Error processing {filename}: {str(e)}")
+                    continue
+                print(f"Processed {filename}")
+                if chunks:
+                    all_chunks[filename] = chunks
         
         return all_chunks
 
+    def chunking_params(self) -> Dict[str, Any]:
+        """Parameters that change the chunks produced for a given PDF"""
+        return {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "chunking_strategy": self.chunking_strategy,
+        }
+
+    def load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """Load the ingestion manifest (content hash and chunking params per file)"""
+        return load_manifest(self.processed_dir)
+
+    def save_manifest(self, manifest: Dict[str, Dict[str, Any]]) -> None:
+        """Atomically write the ingestion manifest"""
+        manifest_path = os.path.join(self.processed_dir, MANIFEST_FILENAME)
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+    def manifest_entry(self, pdf_filename: str, chunk_count: int = 0) -> Dict[str, Any]:
+        """Build the manifest entry for a PDF in its current state"""
+        pdf_path = os.path.join(self.raw_dir, pdf_filename)
+        stat = os.stat(pdf_path)
+        return {
+            "sha256": sha256_file(pdf_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            **self.chunking_params(),
+            "chunk_count": chunk_count,
+        }
+
+    def find_changed_pdfs(
+        self,
+        manifest: Dict[str, Dict[str, Any]],
+        filenames: Optional[List[str]] = None
+    ) -> List[str]:
+        """Return PDFs whose content hash or chunking params differ from the manifest"""
+        if filenames is None:
+            filenames = self.list_pdfs()
+        params = self.chunking_params()
+        
+        changed = []
+        for filename in filenames:
+            entry = manifest.get(filename)
+            if entry is None or any(entry.get(key) != value for key, value in params.items()):
+                changed.append(filename)
+                continue
+            
+            # Only hash files whose size or mtime moved since the last run
+            pdf_path = os.path.join(self.raw_dir, filename)
+            stat = os.stat(pdf_path)
+            if (entry.get("size"), entry.get("mtime")) == (stat.st_size, stat.st_mtime):
+                continue
+            if entry.get("sha256") != sha256_file(pdf_path):
+                changed.append(filename)
+        return changed
+
     def save_chunks(self, chunks: Dict[str, List[Dict[str, Any]]]) -> None:
         """Save processed chunks to disk"""
         import json
@@ -99,4 +486,18 @@ class DocumentProcessor:
             )
             
             with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(doc_chunks, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+                json.dump(doc_chunks, f, ensure_ascii=False, indent=2)
+
+    def remove_document(self, pdf_filename: str) -> None:
+        """Remove a PDF, its saved chunks and its manifest entry"""
+        doc_id = os.path.splitext(pdf_filename)[0]
+        for path in (
+            os.path.join(self.raw_dir, pdf_filename),
+            os.path.join(self.processed_dir, f"{doc_id}_chunks.json"),
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+        
+        manifest = self.load_manifest()
+        if manifest.pop(pdf_filename, None) is not None:
+            self.save_manifest(manifest)
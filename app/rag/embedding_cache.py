@@ -0,0 +1,155 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Callable, Dict, List, Any, Optional
+
+import numpy as np
+
+# Keys per SELECT, below SQLite's limit on bound parameters
+LOOKUP_BATCH = 500
+
+def text_hash(text: str) -> str:
+    """SHA-256 of a chunk text, the content address of its embedding"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class ChunkEmbeddingCache:
+    """
+    Persistent chunk embeddings keyed by model and SHA-256 of the chunk text
+    
+    Lets a rebuilt collection (new chunk overlap, a wiped vector store,
+    a re-ingested corpus) reuse the vectors of every chunk whose text is
+    byte-identical to one embedded before, so only new text reaches the
+    model. Entries record when they were last used; once the cache holds
+    more than max_entries, the least recently used are evicted down to 90%
+    and the freed pages are returned to the file system.
+    """
+    
+    def __init__(self, path: str, model_name: str, max_entries: int = 200000):
+        self.path = path
+        self.model_name = model_name
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # Must be set before the first table is created to take effect
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, embedding BLOB NOT NULL, "
+            "last_used REAL NOT NULL, PRIMARY KEY (model, hash)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunk_embeddings_last_used ON chunk_embeddings (last_used)")
+        self._db.commit()
+        self._entries = self._db.execute("SELECT COUNT(*) FROM chunk_embeddings").fetchone()[0]
+        
+        # Counters (per unique text looked up)
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+    
+    def get_many(self, texts: List[str]) -> Dict[str, List[float]]:
+        """Return the cached embeddings of the given texts, keyed by text"""
+        by_hash = {text_hash(text): text for text in texts}
+        hashes = list(by_hash)
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for start in range(0, len(hashes), LOOKUP_BATCH):
+                batch = hashes[start:start + LOOKUP_BATCH]
+                rows = self._db.execute(
+                    f"SELECT hash, embedding FROM chunk_embeddings WHERE model = ? "
+                    f"AND hash IN ({','.join('?' * len(batch))})",
+                    [self.model_name, *batch]
+                ).fetchall()
+                for key, blob in rows:
+                    found[by_hash[key]] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    now = time.time()
+                    self._db.executemany(
+                        "UPDATE chunk_embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                        [(now, self.model_name, key) for key, _ in rows]
+                    )
+            self._db.commit()
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+    
+    def put_many(self, embeddings: Dict[str, List[float]]) -> None:
+        """Cache embeddings keyed by text, then evict if over max_entries"""
+        if not embeddings:
+            return
+        now = time.time()
+        with self._lock:
+            cursor = self._db.executemany(
+                "INSERT OR REPLACE INTO chunk_embeddings (model, hash, embedding, last_used) VALUES (?, ?, ?, ?)",
+                [
+                    (self.model_name, text_hash(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for text, vector in embeddings.items()
+                ]
+            )
+            self._db.commit()
+            # Replaced rows are counted too; compaction recounts before evicting
+            self._entries += max(cursor.rowcount, 0)
+            if self._entries > self.max_entries:
+                self._compact_locked()
+    
+    def embed(
+        self,
+        texts: List[str],
+        encode_batch: Callable[[List[str]], List[List[float]]],
+        batch_size: Optional[int] = None
+    ) -> List[List[float]]:
+        """Embed texts, calling encode_batch only for unique texts not in the cache"""
+        embeddings = self.get_many(texts)
+        misses = [text for text in dict.fromkeys(texts) if text not in embeddings]
+        batch_size = batch_size or len(misses) or 1
+        for start in range(0, len(misses), batch_size):
+            batch = misses[start:start + batch_size]
+            vectors = dict(zip(batch, encode_batch(batch)))
+            self.put_many(vectors)
+            embeddings.update(vectors)
+        return [embeddings[text] for text in texts]
+    
+    def compact(self) -> int:
+        """Evict least recently used entries over max_entries and return how many were removed"""
+        with self._lock:
+            return self._compact_locked()
+    
+    def _compact_locked(self) -> int:
+        self._entries = self._db.execute("SELECT COUNT(*) FROM chunk_embeddings").fetchone()[0]
+        if self._entries <= self.max_entries:
+            return 0
+        # Evict down to 90% so the next few inserts do not trigger another pass
+        excess = self._entries - int(self.max_entries * 0.9)
+        cursor = self._db.execute(
+            "DELETE FROM chunk_embeddings WHERE (model, hash) IN "
+            "(SELECT model, hash FROM chunk_embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+        self._db.commit()
+        # Each step of the pragma frees one page, so it has to be fetched to the end
+        self._db.execute("PRAGMA incremental_vacuum").fetchall()
+        removed = max(cursor.rowcount, 0)
+        self._entries -= removed
+        self.evicted += removed
+        return removed
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+            "size_mb": os.path.getsize(self.path) / 1e6 if os.path.exists(self.path) else 0.0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+    
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
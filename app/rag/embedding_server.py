@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import signal
+import socket
+import struct
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from app.rag.query_encoder import BatchingQueryEncoder
+
+# Every message is a 4-byte big-endian length followed by the payload.
+# Requests are JSON ({"op": "info"} or {"op": "embed", "texts": [...]});
+# an embed reply is a JSON header ({"count", "dim"}) followed by the
+# float32 vectors as one binary frame, errors are a JSON {"error"} header.
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_BYTES = 256 * 1024 * 1024
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame of {length} bytes exceeds {MAX_FRAME_BYTES}")
+    return await reader.readexactly(length)
+
+def _frame(payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+class EmbeddingServer:
+    """
+    Serve one embedding model to the API workers of this machine
+    
+    Each uvicorn worker would otherwise load its own copy of the model.
+    Here a single process holds it and listens on a Unix socket; texts from
+    all connections are micro-batched (max_batch_size texts or max_wait_ms,
+    whichever comes first) and encoded one batch at a time.
+    """
+    
+    def __init__(
+        self,
+        model: Embeddings,
+        socket_path: str,
+        model_key: str,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5
+    ):
+        self.model = model
+        self.socket_path = socket_path
+        self.model_key = model_key
+        
+        # One encoding thread: the model parallelizes each batch itself
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-server")
+        self.encoder = BatchingQueryEncoder(
+            encode_batch=model.embed_documents,
+            executor=self.executor,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms
+        )
+        self.connections = 0
+        self.requests = 0
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    request = json.loads(await _read_frame(reader))
+                except asyncio.IncompleteReadError:
+                    break
+                self.requests += 1
+                try:
+                    if request.get("op") == "info":
+                        writer.write(_frame(json.dumps(self.info()).encode("utf-8")))
+                    elif request.get("op") == "embed":
+                        texts = request["texts"]
+                        vectors = await asyncio.gather(*(self.encoder.encode(text) for text in texts))
+                        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+                        header = {"count": matrix.shape[0], "dim": matrix.shape[1]}
+                        writer.write(_frame(json.dumps(header).encode("utf-8")) + _frame(matrix.tobytes()))
+                    else:
+                        raise ValueError(f"Unknown op {request.get('op')!r}")
+                except Exception as e:
+                    writer.write(_frame(json.dumps({"error": str(e)}).encode("utf-8")))
+                await writer.drain()
+        finally:
+            self.connections -= 1
+            writer.close()
+    
+    def info(self) -> Dict[str, Any]:
+        """Model and batching metrics, returned for the info op"""
+        return {
+            "model_key": self.model_key,
+            "pid": os.getpid(),
+            "connections": self.connections,
+            "requests": self.requests,
+            "batching": self.encoder.stats()
+        }
+    
+    def _claim_socket(self) -> None:
+        """Remove a socket file left by a server that is no longer running"""
+        if not os.path.exists(self.socket_path):
+            os.makedirs(os.path.dirname(self.socket_path) or ".", exist_ok=True)
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.remove(self.socket_path)
+                return
+        raise RuntimeError(f"An embedding server is already listening on {self.socket_path}")
+    
+    async def serve(self) -> None:
+        """Listen on the socket until SIGINT or SIGTERM"""
+        self._claim_socket()
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        print(f"Embedding server for {self.model_key} listening on {self.socket_path}")
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            self.executor.shutdown(wait=False)
+
+class RemoteEmbeddings(Embeddings):
+    """
+    Embeddings computed by an EmbeddingServer over its Unix socket
+    
+    Each thread keeps its own connection. The server's model key is checked
+    on connect, so vectors of a different model never reach the vector
+    store or the caches. Connecting waits up to connect_timeout seconds for
+    the server to start.
+    """
+    
+    def __init__(
+        self,
+        socket_path: str,
+        model_key: Optional[str] = None,
+        connect_timeout: float = 30,
+        timeout: float = 300
+    ):
+        self.socket_path = socket_path
+        self.model_key = model_key
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self._local = threading.local()
+    
+    def _connect(self) -> socket.socket:
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(
+                        f"No embedding server on {self.socket_path}; start it with scripts/embedding_server.py"
+                    )
+                time.sleep(0.1)
+        
+        info, _ = self._exchange(sock, {"op": "info"})
+        if self.model_key and info["model_key"] != self.model_key:
+            sock.close()
+            raise ValueError(
+                f"Embedding server serves {info['model_key']!r}, expected {self.model_key!r}"
+            )
+        return sock
+    
+    @staticmethod
+    def _recv_exactly(sock: socket.socket, length: int) -> bytes:
+        buffer = bytearray()
+        while len(buffer) < length:
+            chunk = sock.recv(min(length - len(buffer), 1 << 20))
+            if not chunk:
+                raise ConnectionResetError("Embedding server closed the connection")
+            buffer.extend(chunk)
+        return bytes(buffer)
+    
+    def _recv_frame(self, sock: socket.socket) -> bytes:
+        (length,) = FRAME_HEADER.unpack(self._recv_exactly(sock, FRAME_HEADER.size))
+        return self._recv_exactly(sock, length)
+    
+    def _exchange(self, sock: socket.socket, request: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[bytes]]:
+        sock.sendall(_frame(json.dumps(request, ensure_ascii=False).encode("utf-8")))
+        header = json.loads(self._recv_frame(sock))
+        if "error" in header:
+            raise RuntimeError(f"Embedding server error: {header['error']}")
+        payload = self._recv_frame(sock) if request["op"] == "embed" else None
+        return header, payload
+    
+    def _socket(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = self._local.sock = self._connect()
+        return sock
+    
+    def _request(self, request: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[bytes]]:
+        sock = self._socket()
+        try:
+            return self._exchange(sock, request)
+        except (ConnectionResetError, BrokenPipeError, ConnectionRefusedError):
+            # Reconnect once, e.g. after the server was restarted
+            sock.close()
+            self._local.sock = None
+            return self._exchange(self._socket(), request)
+        except OSError:
+            # Timed out: the reply may still arrive on this socket, so drop it
+            # without resending the request
+            sock.close()
+            self._local.sock = None
+            raise
+    
+    def info(self) -> Dict[str, Any]:
+        """Model key and batching metrics of the server"""
+        return self._request({"op": "info"})[0]
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        header, payload = self._request({"op": "embed", "texts": texts})
+        return np.frombuffer(payload, dtype=np.float32).reshape(header["count"], header["dim"]).tolist()
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -1,7 +1,52 @@
 import os
-from typing import List, Dict, Any, Optional
-from langchain_community.vectorstores import Chroma
+import asyncio
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, List, Dict, Any, Optional
 from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+from app.rag.cache import normalize_query
+from app.rag.query_encoder import QueryEmbeddingCache, BatchingQueryEncoder
+from app.rag.vector_store import VectorStore, create_vector_store
+from app.rag.embedding_cache import ChunkEmbeddingCache
+from app.rag.index_version import IndexVersion
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "remote")
+
+def create_embedding_model(model_name: str, backend: str = "torch", **options: Any) -> Embeddings:
+    """
+    Load the embedding model used for both chunks and queries
+    
+    Args:
+        model_name: sentence-transformers model name
+        backend: "torch" (sentence-transformers), "onnx" (the same model
+            exported by scripts/export_onnx.py, run with ONNX Runtime) or
+            "remote" (a model served by scripts/embedding_server.py)
+        options: Backend options; for "onnx": model_dir, quantized,
+            threads and batch_size; for "remote": socket_path and model_key
+    """
+    if backend == "onnx":
+        from app.rag.onnx_embeddings import OnnxEmbeddings
+        return OnnxEmbeddings(**options)
+    if backend == "remote":
+        from app.rag.embedding_server import RemoteEmbeddings
+        return RemoteEmbeddings(**options)
+    if backend != "torch":
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"normalize_embeddings": True}
+    )
+
+def embedding_model_key(model_name: str, backend: str = "torch", **options: Any) -> str:
+    """Identifies the vectors a model produces, so caches and servers can tell models apart"""
+    if backend == "onnx":
+        variant = "onnx-int8" if options.get("quantized", True) else "onnx"
+        return f"{model_name}:{variant}"
+    return model_name
 
 class EmbeddingsManager:
     """Manage document embeddings and vector store"""
@@ -10,47 +55,342 @@ class EmbeddingsManager:
         self,
         embedding_model_name: str = "keepitreal/vietnamese-sbert",
         vector_store_path: str = "data/vectorstore",
-        collection_name: str = "university_regulations"
+        collection_name: str = "university_regulations",
+        encode_workers: int = 2,
+        query_cache_size: int = 10000,
+        query_cache_spill_path: Optional[str] = None,
+        batch_max_size: int = 32,
+        batch_max_wait_ms: float = 5,
+        embedding_backend: str = "torch",
+        embedding_options: Optional[Dict[str, Any]] = None,
+        vector_store_backend: str = "chroma",
+        vector_store_options: Optional[Dict[str, Any]] = None,
+        chunk_cache_path: Optional[str] = None,
+        chunk_cache_max_entries: int = 200000,
+        embedding_server_socket: Optional[str] = None,
+        index_version_path: Optional[str] = None
     ):
+        self.embedding_model_name = embedding_model_name
+        self.embedding_backend = embedding_backend
+        self.embedding_options = embedding_options or {}
         self.vector_store_path = vector_store_path
         self.collection_name = collection_name
+        self.vector_store_backend = vector_store_backend
+        self.vector_store_options = vector_store_options or {}
+        self.embedding_server_socket = embedding_server_socket
         
         # Create directory if it doesn't exist
         os.makedirs(self.vector_store_path, exist_ok=True)
         
-        # Initialize embedding model
-        self.embedding_model = HuggingFaceEmbeddings(
-            model_name=embedding_model_name,
-            model_kwargs={"device": "cpu"},
-            encode_kwargs={"normalize_embeddings": True}
-        )
+        # Initialize embedding model, or connect to the process that serves it
+        config = self.embedding_config()
+        self.embedding_model = create_embedding_model(config.pop("model_name"), config.pop("backend"), **config)
         
         # Initialize vector store
         self.vector_store = self.get_or_create_vector_store()
+        
+        # Chunk embeddings by text hash, reused when a collection is rebuilt
+        self.chunk_cache = (
+            ChunkEmbeddingCache(chunk_cache_path, self.model_key, max_entries=chunk_cache_max_entries)
+            if chunk_cache_path else None
+        )
+        
+        # Bumped on every change to the collection so caches can invalidate;
+        # with index_version_path, changes made by other processes count too
+        self.shared_index_version = IndexVersion(index_version_path) if index_version_path else None
+        self._local_index_version = 0
+        self._seen_index_version = self.shared_index_version.value if self.shared_index_version else 0
+        self._index_version_lock = threading.Lock()
+        
+        # Callbacks notified of ("add", chunks), ("delete", chunk_ids) and
+        # ("reload", []) when another process changed the collection
+        self.listeners: List[Callable[[str, List[Any]], None]] = []
+        
+        # Bounded executor for CPU-bound encoding and blocking vector store
+        # calls, so async callers never run them on the event loop
+        self.executor = ThreadPoolExecutor(
+            max_workers=encode_workers,
+            thread_name_prefix="embeddings"
+        )
+        
+        self.setup_query_encoding(
+            query_cache_size=query_cache_size,
+            query_cache_spill_path=query_cache_spill_path,
+            batch_max_size=batch_max_size,
+            batch_max_wait_ms=batch_max_wait_ms
+        )
     
-    def get_or_create_vector_store(self):
-        """Get existing vector store or create a new one"""
-        try:
-            return Chroma(
-                collection_name=self.collection_name,
-                embedding_function=self.embedding_model,
-                persist_directory=self.vector_store_path
-            )
-        except Exception as e:
-            print(f"Error loading vector store: {str(e)}. Creating a new one.")
-            return Chroma(
-                collection_name=self.collection_name,
-                embedding_function=self.embedding_model,
-                persist_directory=self.vector_store_path
-            )
+    def setup_query_encoding(
+        self,
+        query_cache_size: int = 10000,
+        query_cache_spill_path: Optional[str] = None,
+        batch_max_size: int = 32,
+        batch_max_wait_ms: float = 5
+    ) -> None:
+        """Create the query embedding cache and the micro-batching encoder"""
+        self.query_cache = QueryEmbeddingCache(
+            model_name=self.model_key,
+            max_size=query_cache_size,
+            spill_path=query_cache_spill_path
+        )
+        self.query_encoder = BatchingQueryEncoder(
+            encode_batch=self.encode_query_misses,
+            executor=self.executor,
+            max_batch_size=batch_max_size,
+            max_wait_ms=batch_max_wait_ms
+        )
+    
+    @property
+    def model_key(self) -> str:
+        """Identifies the vectors this model produces, e.g. for persisted caches"""
+        return embedding_model_key(self.embedding_model_name, self.embedding_backend, **self.embedding_options)
+    
+    def embedding_config(self) -> Dict[str, Any]:
+        """Arguments of create_embedding_model, to load the same model in a worker process"""
+        if self.embedding_server_socket:
+            return {
+                "model_name": self.embedding_model_name,
+                "backend": "remote",
+                "socket_path": self.embedding_server_socket,
+                "model_key": self.model_key
+            }
+        return {
+            "model_name": self.embedding_model_name,
+            "backend": self.embedding_backend,
+            **self.embedding_options
+        }
     
-    def add_documents(self, documents: List[Dict[str, Any]]) -> None:
-        """Add documents to the vector store"""
-        texts = [doc["text"] for doc in documents]
-        metadatas = [doc["metadata"] for doc in documents]
+    def add_listener(self, listener: Callable[[str, List[Any]], None]) -> None:
+        """Register a callback for changes to the collection"""
+        self.listeners.append(listener)
+    
+    @property
+    def index_version(self) -> int:
+        return self.sync_index_version()
+    
+    def sync_index_version(self) -> int:
+        """Current index version; tells listeners to reload if another process changed the collection"""
+        if self.shared_index_version is None:
+            return self._local_index_version
+        version = self.shared_index_version.value
+        if version <= self._seen_index_version:
+            return self._seen_index_version
+        with self._index_version_lock:
+            if version <= self._seen_index_version:
+                return self._seen_index_version
+            self._seen_index_version = version
+        self._call_listeners("reload", [])
+        return version
+    
+    def _notify(self, event: str, payload: List[Any]) -> None:
+        if self.shared_index_version is None:
+            self._local_index_version += 1
+        else:
+            with self._index_version_lock:
+                self._seen_index_version = self.shared_index_version.bump()
+        self._call_listeners(event, payload)
+    
+    def _call_listeners(self, event: str, payload: List[Any]) -> None:
+        for listener in self.listeners:
+            try:
+                listener(event, payload)
+            except Exception as e:
+                print(f"Error in vector store listener: {str(e)}")
+    
+    def get_or_create_vector_store(self) -> VectorStore:
+        """Open the collection in the configured vector store backend"""
+        return create_vector_store(
+            self.vector_store_backend,
+            self.vector_store_path,
+            self.collection_name,
+            self.embedding_model,
+            **self.vector_store_options
+        )
+    
+    def add_documents(
+        self,
+        documents: List[Dict[str, Any]],
+        batch_size: Optional[int] = None,
+        embeddings: Optional[Dict[str, List[float]]] = None
+    ) -> None:
+        """
+        Add documents to the vector store
+        
+        Chunks are written under their chunk_id, so adding the same chunk
+        twice overwrites it instead of creating a duplicate.
+        
+        Args:
+            documents: Chunks with text and metadata
+            batch_size: Number of chunks embedded per model call (all at once if None)
+            embeddings: Precomputed vectors by chunk_id (e.g. from an ingestion
+                worker process); when given, the model is not called
+        """
+        if not documents:
+            return
+        
+        batch_size = batch_size or len(documents)
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start:start + batch_size]
+            ids = [doc["metadata"]["chunk_id"] for doc in batch]
+            texts = [doc["text"] for doc in batch]
+            if embeddings is not None:
+                vectors = [embeddings[chunk_id] for chunk_id in ids]
+            else:
+                vectors = self.embed_chunks(texts)
+            self.vector_store.upsert(
+                ids=ids,
+                embeddings=vectors,
+                texts=texts,
+                metadatas=[doc["metadata"] for doc in batch]
+            )
         
-        self.vector_store.add_texts(texts=texts, metadatas=metadatas)
         self.vector_store.persist()
+        self._notify("add", documents)
+    
+    def embed_chunks(self, texts: List[str]) -> List[List[float]]:
+        """Embed chunk texts, taking texts embedded before from the chunk cache"""
+        if self.chunk_cache is None:
+            return self.embedding_model.embed_documents(texts)
+        return self.chunk_cache.embed(texts, self.embedding_model.embed_documents)
+    
+    def get_document_chunk_ids(self, document_id: str) -> List[str]:
+        """Return the IDs of all chunks stored for a document"""
+        return self.vector_store.get_ids(where={"document_id": document_id})
+    
+    def upsert_documents(
+        self,
+        documents: List[Dict[str, Any]],
+        batch_size: Optional[int] = None,
+        embeddings: Optional[Dict[str, List[float]]] = None
+    ) -> Dict[str, int]:
+        """
+        Replace the stored chunks of each document in documents
+        
+        Chunks whose ID (and therefore content) is already stored are kept
+        without re-embedding, stale chunks are deleted, and only new chunks
+        are embedded (or taken from embeddings, keyed by chunk_id).
+        
+        Returns:
+            Counts of added, deleted and unchanged chunks
+        """
+        by_document: Dict[str, List[Dict[str, Any]]] = {}
+        for doc in documents:
+            by_document.setdefault(doc["metadata"]["document_id"], []).append(doc)
+        
+        to_add, stale_ids, unchanged = [], [], 0
+        for document_id, chunks in by_document.items():
+            existing_ids = set(self.get_document_chunk_ids(document_id))
+            new_ids = {chunk["metadata"]["chunk_id"] for chunk in chunks}
+            stale_ids.extend(existing_ids - new_ids)
+            for chunk in chunks:
+                if chunk["metadata"]["chunk_id"] in existing_ids:
+                    unchanged += 1
+                else:
+                    to_add.append(chunk)
+        
+        if stale_ids:
+            self.vector_store.delete(stale_ids)
+            if not to_add:
+                self.vector_store.persist()
+            self._notify("delete", stale_ids)
+        self.add_documents(to_add, batch_size=batch_size, embeddings=embeddings)
+        
+        return {"added": len(to_add), "deleted": len(stale_ids), "unchanged": unchanged}
+    
+    def delete_document(self, document_id: str) -> int:
+        """Delete all chunks of a document and return how many were removed"""
+        ids = self.get_document_chunk_ids(document_id)
+        if ids:
+            self.vector_store.delete(ids)
+            self.vector_store.persist()
+            self._notify("delete", ids)
+        return len(ids)
+    
+    def get_chunks(self, chunk_ids: List[str], include_embeddings: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Fetch stored chunks by ID, optionally with their embeddings"""
+        return self.vector_store.get(chunk_ids, include_embeddings=include_embeddings)
+    
+    def encode_queries(self, queries: List[str]) -> List[List[float]]:
+        """Encode a batch of queries with a single model call"""
+        # Only the cache key is normalize_query()'d; the model sees the question as asked
+        return self.embedding_model.embed_documents([unicodedata.normalize("NFC", query) for query in queries])
+    
+    def encode_query_misses(self, queries: List[str]) -> List[List[float]]:
+        """
+        Encode queries missing from the in-memory query cache
+        
+        Runs on the executor as the micro-batching encoder's batch function,
+        so the spill file lookups stay off the event loop with the model call.
+        """
+        embeddings = {query: self.query_cache.get_spilled(normalize_query(query)) for query in queries}
+        misses = [query for query, embedding in embeddings.items() if embedding is None]
+        if misses:
+            embeddings.update(zip(misses, self.encode_queries(misses)))
+        return [embeddings[query] for query in queries]
+    
+    def embed_query(self, query: str) -> List[float]:
+        """Encode a query into an embedding vector, using the query cache"""
+        key = normalize_query(query)
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = self.encode_queries([query])[0]
+            self.query_cache.put(key, embedding)
+        return embedding
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Encode several queries, with a single model call for all cache misses"""
+        keys = [normalize_query(query) for query in queries]
+        embeddings: Dict[str, List[float]] = {}
+        misses: Dict[str, str] = {}
+        for key, query in zip(keys, queries):
+            if key in embeddings or key in misses:
+                continue
+            embedding = self.query_cache.get(key)
+            if embedding is not None:
+                embeddings[key] = embedding
+            else:
+                misses[key] = query
+        
+        if misses:
+            for key, embedding in zip(misses, self.encode_queries(list(misses.values()))):
+                self.query_cache.put(key, embedding)
+                embeddings[key] = embedding
+        return [embeddings[key] for key in keys]
+    
+    def similarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 3,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Search for similar documents using a precomputed query embedding"""
+        return self.similarity_search_by_vectors(
+            [embedding],
+            k=k,
+            filter_metadata=filter_metadata,
+            include_embeddings=include_embeddings
+        )[0]
+    
+    def similarity_search_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 3,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search several query embeddings with one vector store call
+        
+        Each hit has its cosine similarity to the query as "score" and, with
+        include_embeddings, its stored vector as "embedding" (used for MMR).
+        """
+        return self.vector_store.query(
+            embeddings,
+            k=k,
+            where=filter_metadata,
+            include_embeddings=include_embeddings
+        )
     
     def similarity_search(
         self, 
@@ -59,18 +399,69 @@ class EmbeddingsManager:
         filter_metadata: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
         """Search for similar documents in the vector store"""
-        docs = self.vector_store.similarity_search(
-            query=query,
+        return self.similarity_search_by_vector(
+            self.embed_query(query),
             k=k,
-            filter=filter_metadata
+            filter_metadata=filter_metadata
+        )
+    
+    async def aembed_query(self, query: str) -> List[float]:
+        """Encode a query via the cache, micro-batched on the bounded executor"""
+        key = normalize_query(query)
+        embedding = self.query_cache.get_memory(key)
+        if embedding is None:
+            embedding = await self.query_encoder.encode(query)
+            self.query_cache.put(key, embedding)
+        return embedding
+    
+    async def aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Encode a batch of queries on the bounded executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.embed_queries, queries)
+    
+    def close(self) -> None:
+        """Save the query cache to its spill file and release the executor"""
+        self.query_cache.flush()
+        self.executor.shutdown(wait=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return query cache, batching and chunk cache metrics"""
+        return {
+            "query_cache": self.query_cache.stats(),
+            "query_batching": self.query_encoder.stats(),
+            "chunk_cache": self.chunk_cache.stats() if self.chunk_cache else None
+        }
+    
+    async def asimilarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 3,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Search by a precomputed embedding on the bounded executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            partial(
+                self.similarity_search_by_vector,
+                embedding,
+                k=k,
+                filter_metadata=filter_metadata,
+                include_embeddings=include_embeddings
+            )
+        )
+    
+    async def asimilarity_search(
+        self,
+        query: str,
+        k: int = 3,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Search for similar documents without blocking the event loop"""
+        embedding = await self.aembed_query(query)
+        return await self.asimilarity_search_by_vector(
+            embedding,
+            k=k,
+            filter_metadata=filter_metadata
         )
-        
-        results = []
-        for doc in docs:
-            results.append({
-                "text": doc.page_content,
-                "metadata": doc.metadata,
-                "score": getattr(doc, "score", None)  # Some implementations provide score
-            })
-            
-        return results
\ No newline at end of file
@@ -0,0 +1,63 @@
+import os
+import threading
+from typing import Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: bumps are not serialized across processes
+    fcntl = None
+
+class IndexVersion:
+    """
+    Version number of the indexed chunks, shared through a file
+    
+    Every uvicorn worker keeps its own answer cache and BM25 index, so a
+    change made by one process must be visible to the others. The process
+    that changes the vector store calls bump(); every other process sees
+    the new value on its next read, which costs one stat() unless the
+    file was replaced.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._value = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+    
+    def _read(self) -> int:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+    
+    @property
+    def value(self) -> int:
+        stamp = self._stat()
+        if stamp != self._stamp:
+            with self._lock:
+                self._value = self._read()
+                self._stamp = stamp
+        return self._value
+    
+    def bump(self) -> int:
+        """Increment the version for all processes and return the new value"""
+        with self._lock, open(f"{self.path}.lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            value = self._read() + 1
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(str(value))
+            os.replace(tmp_path, self.path)
+            # Read back on the next call, in case another process bumps in between
+            self._value, self._stamp = value, None
+        return value
@@ -0,0 +1,449 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+JOB_STATES = ("queued", "extracting", "embedding", "done", "failed")
+ACTIVE_STATES = ("extracting", "embedding")
+
+class JobQueue:
+    """
+    Durable ingestion job queue stored in a SQLite file
+    
+    Jobs survive restarts. A claimed job records the pid of the API process
+    running it and a heartbeat that process keeps renewing; requeue_interrupted()
+    puts a job back in the queue only once its owner has died or stopped
+    renewing the lease, so with several uvicorn workers on one queue a
+    starting worker does not take over jobs another one is still running.
+    Worker processes open their own JobQueue on the same file to report
+    progress.
+    """
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, filename TEXT NOT NULL, document_id TEXT NOT NULL, "
+            "state TEXT NOT NULL, progress REAL NOT NULL DEFAULT 0, chunk_count INTEGER, "
+            "error TEXT, attempts INTEGER NOT NULL DEFAULT 0, timings TEXT NOT NULL DEFAULT '{}', "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "sha256" not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN sha256 TEXT")
+        if "owner_pid" not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN owner_pid INTEGER")
+            self._db.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_document ON jobs (document_id, created_at)")
+        self._db.commit()
+    
+    @staticmethod
+    def _to_dict(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["timings"] = json.loads(job["timings"])
+        return job
+    
+    def enqueue(self, filename: str, document_id: str, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """Add a job for a PDF in the raw directory and return it"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, filename, document_id, sha256, state, created_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, filename, document_id, sha256, time.time())
+            )
+            self._db.commit()
+        return self.get(job_id)
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job by ID"""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+    
+    def find_pending(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Return a queued or running job for a file with this content hash"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE sha256 = ? AND state IN ('queued', ?, ?) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (sha256, *ACTIVE_STATES)
+            ).fetchone()
+        return self._to_dict(row)
+    
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically move the oldest queued job to extracting, owned by this process, and return it"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE state = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    now = time.time()
+                    self._db.execute(
+                        "UPDATE jobs SET state = 'extracting', progress = 0, started_at = ?, "
+                        "owner_pid = ?, heartbeat_at = ?, attempts = attempts + 1 WHERE id = ?",
+                        (now, os.getpid(), now, row["id"])
+                    )
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+        return self.get(row["id"]) if row is not None else None
+    
+    def update(self, job_id: str, **fields: Any) -> None:
+        """Update columns of a job; timings is merged into the stored timings"""
+        timings = fields.pop("timings", None)
+        with self._lock:
+            if timings:
+                row = self._db.execute("SELECT timings FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                merged = {**json.loads(row["timings"]), **timings} if row is not None else timings
+                fields["timings"] = json.dumps(merged)
+            if not fields:
+                return
+            columns = ", ".join(f"{column} = ?" for column in fields)
+            self._db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self._db.commit()
+    
+    def heartbeat(self, job_ids: Iterable[str]) -> None:
+        """Renew the lease of jobs this process is running"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE owner_pid = ? AND state IN (?, ?) "
+                f"AND id IN ({','.join('?' * len(job_ids))})",
+                (time.time(), os.getpid(), *ACTIVE_STATES, *job_ids)
+            )
+            self._db.commit()
+    
+    def requeue_interrupted(self, lease_seconds: float = 60, running: Iterable[str] = ()) -> int:
+        """
+        Put jobs whose owner is gone back in the queue
+        
+        A job is requeued when its heartbeat is older than lease_seconds or
+        its owner process no longer exists. Jobs carrying this process's pid
+        but missing from running were left by an earlier process that had
+        the same pid (e.g. pid 1 in a restarted container).
+        """
+        running = set(running)
+        expired_before = time.time() - lease_seconds
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, owner_pid, heartbeat_at FROM jobs WHERE state IN (?, ?)",
+                ACTIVE_STATES
+            ).fetchall()
+            orphaned = [
+                row["id"] for row in rows
+                if row["heartbeat_at"] is None
+                or row["heartbeat_at"] < expired_before
+                or not _process_alive(row["owner_pid"])
+                or (row["owner_pid"] == os.getpid() and row["id"] not in running)
+            ]
+            if not orphaned:
+                return 0
+            cursor = self._db.execute(
+                f"UPDATE jobs SET state = 'queued', progress = 0, owner_pid = NULL "
+                f"WHERE state IN (?, ?) AND id IN ({','.join('?' * len(orphaned))})",
+                (*ACTIVE_STATES, *orphaned)
+            )
+            self._db.commit()
+        return cursor.rowcount
+    
+    def latest_by_document(self) -> Dict[str, Dict[str, Any]]:
+        """Return the most recent job of each document"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE rowid IN "
+                "(SELECT rowid FROM jobs j WHERE j.document_id = jobs.document_id "
+                "ORDER BY created_at DESC LIMIT 1)"
+            ).fetchall()
+        return {row["document_id"]: self._to_dict(row) for row in rows}
+    
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in each state"""
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+        counts = {state: 0 for state in JOB_STATES}
+        counts.update({row["state"]: row["n"] for row in rows})
+        return counts
+
+def _process_alive(pid: Optional[int]) -> bool:
+    """Whether a process with this pid exists on this machine"""
+    if not pid:
+        return False
+    if os.name == "nt":
+        return True  # os.kill would terminate it; rely on the lease
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    except OSError:
+        return False
+    return True
+
+class ProgressReporter:
+    """Write a job's progress to the queue, at most once per percent"""
+    
+    def __init__(self, jobs: JobQueue, job_id: str):
+        self.jobs = jobs
+        self.job_id = job_id
+        self.last_percent = -1
+    
+    def __call__(self, done: int, total: int) -> None:
+        percent = int(100 * done / total) if total else 100
+        if percent != self.last_percent:
+            self.last_percent = percent
+            self.jobs.update(self.job_id, progress=percent / 100)
+
+# Worker process state; each process loads the embedding model once
+_worker_models: Dict[str, Any] = {}
+
+def _init_worker(model_config: Dict[str, Any], torch_threads: int, nice: int) -> None:
+    """Keep ingestion processes from competing with query encoding for CPU"""
+    if nice:
+        os.nice(nice)
+    # ONNX Runtime gets its thread cap from model_config and a remote model
+    # runs in the embedding server: only the torch backend needs torch here
+    if model_config["backend"] != "torch":
+        return
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+def _extract_in_worker(
+    config: Dict[str, Any],
+    db_path: str,
+    job_id: str,
+    pdf_filename: str
+) -> List[Dict[str, Any]]:
+    """Extract and chunk a PDF, reporting page progress to the job"""
+    from app.rag.document_processor import DocumentProcessor
+    
+    progress = ProgressReporter(JobQueue(db_path), job_id)
+    return DocumentProcessor(**config).process_pdf(pdf_filename, progress=progress)
+
+def _embed_in_worker(
+    model_config: Dict[str, Any],
+    db_path: str,
+    job_id: str,
+    texts: List[str],
+    batch_size: int
+) -> List[List[float]]:
+    """Embed chunk texts in batches, reporting progress to the job"""
+    from app.rag.embeddings import create_embedding_model
+    
+    key = json.dumps(model_config, sort_keys=True)
+    if key not in _worker_models:
+        _worker_models[key] = create_embedding_model(**model_config)
+    model = _worker_models[key]
+    
+    progress = ProgressReporter(JobQueue(db_path), job_id)
+    embeddings: List[List[float]] = []
+    for start in range(0, len(texts), batch_size):
+        embeddings.extend(model.embed_documents(texts[start:start + batch_size]))
+        progress(len(embeddings), len(texts))
+    return embeddings
+
+class IngestionWorker:
+    """
+    Drain the job queue with a small pool of worker processes
+    
+    Extraction and embedding run in separate processes (spawned, so the API
+    process's model, threads and Chroma handles are not inherited), never on
+    the API event loop. Only writing the precomputed vectors happens in this
+    process, because Chroma's index lives in the process that serves queries.
+    At most max_workers jobs run at once. While a job runs, a heartbeat
+    thread renews its lease every lease_seconds / 3 and requeues jobs of
+    API processes that died.
+    """
+    
+    def __init__(
+        self,
+        jobs: JobQueue,
+        document_processor,
+        embeddings_manager,
+        max_workers: int = 1,
+        batch_size: int = 256,
+        torch_threads: int = 1,
+        nice: int = 10,
+        poll_interval: float = 1.0,
+        lease_seconds: float = 60
+    ):
+        self.jobs = jobs
+        self.document_processor = document_processor
+        self.embeddings_manager = embeddings_manager
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.torch_threads = torch_threads
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.model_config = self._worker_model_config()
+        
+        self.pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_config, torch_threads, nice)
+        )
+        self._slots = threading.Semaphore(max_workers)
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._manifest_lock = threading.Lock()
+        self._running: Set[str] = set()
+        self._running_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._heartbeat_thread: Optional[threading.Thread] = None
+    
+    def _worker_model_config(self) -> Dict[str, Any]:
+        """The API's embedding model, with the worker thread cap for ONNX Runtime"""
+        config = self.embeddings_manager.embedding_config()
+        if config["backend"] == "onnx":
+            config["threads"] = self.torch_threads
+        return config
+    
+    def start(self) -> None:
+        """Requeue interrupted jobs and start dispatching"""
+        self._requeue_interrupted()
+        self._thread = threading.Thread(target=self._dispatch, name="ingestion-dispatcher", daemon=True)
+        self._thread.start()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="ingestion-heartbeat", daemon=True)
+        self._heartbeat_thread.start()
+    
+    def _requeue_interrupted(self) -> None:
+        with self._running_lock:
+            requeued = self.jobs.requeue_interrupted(self.lease_seconds, running=self._running)
+        if requeued:
+            print(f"Requeued {requeued} interrupted ingestion jobs")
+            self._wake.set()
+    
+    def _heartbeat(self) -> None:
+        """Renew the leases of running jobs and pick up jobs of dead processes"""
+        while not self._stopped.wait(self.lease_seconds / 3):
+            try:
+                with self._running_lock:
+                    running = list(self._running)
+                self.jobs.heartbeat(running)
+                self._requeue_interrupted()
+            except Exception as e:
+                print(f"Error renewing ingestion job leases: {str(e)}")
+    
+    def notify(self) -> None:
+        """Wake the dispatcher after a job was enqueued"""
+        self._wake.set()
+    
+    def stop(self) -> None:
+        """Stop dispatching; running jobs are requeued once their lease expires"""
+        self._stopped.set()
+        self._wake.set()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+    
+    def _dispatch(self) -> None:
+        while not self._stopped.is_set():
+            self._slots.acquire()
+            job = None
+            try:
+                # Under the lock, so a concurrent requeue never sees the job claimed but not running
+                with self._running_lock:
+                    job = self.jobs.claim_next()
+                    if job is not None:
+                        self._running.add(job["id"])
+            except Exception as e:
+                print(f"Error claiming ingestion job: {str(e)}")
+            if job is None:
+                self._slots.release()
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            threading.Thread(target=self._run, args=(job,), name=f"ingestion-{job['id'][:8]}", daemon=True).start()
+    
+    def _run(self, job: Dict[str, Any]) -> None:
+        job_id, filename = job["id"], job["filename"]
+        timings = {"queue_wait_s": job["started_at"] - job["created_at"]}
+        start = time.perf_counter()
+        try:
+            # Extract and chunk in a worker process
+            stage = time.perf_counter()
+            chunks = self.pool.submit(
+                _extract_in_worker,
+                self.document_processor.worker_config(),
+                self.jobs.db_path,
+                job_id,
+                filename
+            ).result()
+            timings["extract_s"] = time.perf_counter() - stage
+            if not chunks:
+                raise ValueError(f"No text extracted from {filename}")
+            
+            # Embed only chunks the vector store does not already hold
+            stage = time.perf_counter()
+            self.jobs.update(job_id, state="embedding", progress=0, chunk_count=len(chunks), timings=timings)
+            existing_ids = set(self.embeddings_manager.get_document_chunk_ids(job["document_id"]))
+            to_embed = [chunk for chunk in chunks if chunk["metadata"]["chunk_id"] not in existing_ids]
+            
+            # Texts embedded before come from the chunk cache; the worker encodes the rest
+            chunk_cache = self.embeddings_manager.chunk_cache
+            by_text = chunk_cache.get_many([chunk["text"] for chunk in to_embed]) if chunk_cache else {}
+            from_cache = sum(1 for chunk in to_embed if chunk["text"] in by_text)
+            misses = list(dict.fromkeys(chunk["text"] for chunk in to_embed if chunk["text"] not in by_text))
+            vectors = self.pool.submit(
+                _embed_in_worker,
+                self.model_config,
+                self.jobs.db_path,
+                job_id,
+                misses,
+                self.batch_size
+            ).result() if misses else []
+            by_text.update(zip(misses, vectors))
+            if chunk_cache:
+                chunk_cache.put_many(dict(zip(misses, vectors)))
+            timings["embed_s"] = time.perf_counter() - stage
+            
+            # Write the chunks, precomputed vectors and manifest entry. The chunk file
+            # goes first so the lexical index saved after the upsert fingerprints it
+            stage = time.perf_counter()
+            embeddings = {chunk["metadata"]["chunk_id"]: by_text[chunk["text"]] for chunk in to_embed}
+            self.document_processor.save_chunks({filename: chunks})
+            self.embeddings_manager.upsert_documents(chunks, batch_size=self.batch_size, embeddings=embeddings)
+            with self._manifest_lock:
+                manifest = self.document_processor.load_manifest()
+                manifest[filename] = self.document_processor.manifest_entry(filename, chunk_count=len(chunks))
+                self.document_processor.save_manifest(manifest)
+            timings["index_s"] = time.perf_counter() - stage
+            timings["total_s"] = time.perf_counter() - start
+            
+            self.jobs.update(job_id, state="done", progress=1.0, finished_at=time.time(), timings=timings)
+            print(
+                f"Ingested {filename}: {len(chunks)} chunks ({from_cache} embeddings "
+                f"from cache) in {timings['total_s']:.1f}s"
+            )
+        except Exception as e:
+            if self._stopped.is_set():
+                return
+            timings["total_s"] = time.perf_counter() - start
+            self.jobs.update(job_id, state="failed", error=str(e), finished_at=time.time(), timings=timings)
+            print(f"Error processing document {filename}: {str(e)}")
+        finally:
+            with self._running_lock:
+                self._running.discard(job_id)
+            self._slots.release()
@@ -0,0 +1,286 @@
+import os
+import re
+import glob
+import json
+import math
+import pickle
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+INDEX_FORMAT_VERSION = 1
+
+def strip_diacritics(token: str) -> str:
+    """Remove Vietnamese diacritics ("nghiệp" -> "nghiep")"""
+    token = token.replace("đ", "d")
+    return "".join(c for c in unicodedata.normalize("NFD", token) if not unicodedata.combining(c))
+
+def tokenize_vietnamese(text: str) -> List[str]:
+    """
+    Tokenize Vietnamese text for lexical search
+    
+    Vietnamese words are written as space-separated syllables, so besides
+    syllables the tokens include syllable bigrams ("tốt_nghiệp"). Syllables
+    are also indexed without diacritics so queries typed without accents
+    still match.
+    """
+    syllables = TOKEN_PATTERN.findall(unicodedata.normalize("NFC", text).lower())
+    tokens = list(syllables)
+    tokens.extend(f"{a}_{b}" for a, b in zip(syllables, syllables[1:]))
+    for syllable in syllables:
+        folded = strip_diacritics(syllable)
+        if folded != syllable:
+            tokens.append(folded)
+    return tokens
+
+class BM25Index:
+    """
+    In-memory BM25 inverted index over chunks
+    
+    Postings are stored per term as two compact arrays (document slots and
+    term frequencies). Deleted chunks are tombstoned and dropped from the
+    postings when more than a quarter of the slots are dead. Changes made
+    through on_vector_store_change are saved save_delay seconds later in a
+    background thread, so a burst of writes costs one save. A "reload"
+    event (another process changed the collection) marks the index stale;
+    the next search reloads it from the saved copy or the chunk files.
+    """
+    
+    def __init__(self, k1: float = 1.5, b: float = 0.75, save_delay: float = 2.0):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._save_delay = save_delay
+        self._save_timer: Optional[threading.Timer] = None
+        self._stale = False
+        self._reset()
+    
+    def _reset(self) -> None:
+        self.term_ids: Dict[str, int] = {}
+        self.postings_docs: List[array] = []
+        self.postings_tfs: List[array] = []
+        self.chunk_ids: List[str] = []
+        self.slots: Dict[str, int] = {}
+        self.doc_lengths = array("I")
+        self.doc_sources = array("I")
+        self.source_codes: Dict[str, int] = {}
+        self.deleted = bytearray()
+        self.live_count = 0
+        self.total_length = 0
+        
+        # Where the index is persisted, and the chunk files it reflects
+        self.processed_dir: Optional[str] = None
+        self.index_path: Optional[str] = None
+        self.fingerprint: Optional[str] = None
+    
+    def __len__(self) -> int:
+        return self.live_count
+    
+    def add(self, chunks: List[Dict[str, Any]]) -> None:
+        """Index chunks, replacing any already indexed under the same chunk_id"""
+        with self._lock:
+            self.remove([chunk["metadata"]["chunk_id"] for chunk in chunks])
+            for chunk in chunks:
+                slot = len(self.chunk_ids)
+                terms = Counter(tokenize_vietnamese(chunk["text"]))
+                for term, tf in terms.items():
+                    term_id = self.term_ids.get(term)
+                    if term_id is None:
+                        term_id = self.term_ids[term] = len(self.postings_docs)
+                        self.postings_docs.append(array("I"))
+                        self.postings_tfs.append(array("H"))
+                    self.postings_docs[term_id].append(slot)
+                    self.postings_tfs[term_id].append(min(tf, 65535))
+                
+                length = sum(terms.values())
+                source = chunk["metadata"].get("source", "")
+                self.chunk_ids.append(chunk["metadata"]["chunk_id"])
+                self.slots[chunk["metadata"]["chunk_id"]] = slot
+                self.doc_lengths.append(length)
+                self.doc_sources.append(self.source_codes.setdefault(source, len(self.source_codes)))
+                self.deleted.append(0)
+                self.live_count += 1
+                self.total_length += length
+    
+    def remove(self, chunk_ids: List[str]) -> None:
+        """Tombstone chunks by ID"""
+        with self._lock:
+            for chunk_id in chunk_ids:
+                slot = self.slots.pop(chunk_id, None)
+                if slot is None:
+                    continue
+                self.deleted[slot] = 1
+                self.live_count -= 1
+                self.total_length -= self.doc_lengths[slot]
+            
+            if len(self.chunk_ids) and self.live_count < 0.75 * len(self.chunk_ids):
+                self.compact()
+    
+    def compact(self) -> None:
+        """Drop tombstoned slots and renumber the postings"""
+        with self._lock:
+            deleted = np.frombuffer(bytes(self.deleted), dtype=np.uint8).astype(bool)
+            live = np.flatnonzero(~deleted)
+            remap = np.full(len(self.chunk_ids), -1, dtype=np.int64)
+            remap[live] = np.arange(len(live))
+            
+            term_ids, postings_docs, postings_tfs = {}, [], []
+            for term, term_id in self.term_ids.items():
+                docs = remap[np.frombuffer(self.postings_docs[term_id], dtype=np.uint32)]
+                keep = docs >= 0
+                if not keep.any():
+                    continue
+                term_ids[term] = len(postings_docs)
+                postings_docs.append(array("I", docs[keep].astype(np.uint32).tobytes()))
+                postings_tfs.append(array("H", np.frombuffer(self.postings_tfs[term_id], dtype=np.uint16)[keep].tobytes()))
+            
+            self.term_ids = term_ids
+            self.postings_docs = postings_docs
+            self.postings_tfs = postings_tfs
+            self.chunk_ids = [self.chunk_ids[i] for i in live]
+            self.slots = {chunk_id: i for i, chunk_id in enumerate(self.chunk_ids)}
+            self.doc_lengths = array("I", [self.doc_lengths[i] for i in live])
+            self.doc_sources = array("I", [self.doc_sources[i] for i in live])
+            self.deleted = bytearray(len(self.chunk_ids))
+    
+    def search(self, query: str, k: int = 10, source: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Return up to k (chunk_id, BM25 score) pairs, best first"""
+        if self._stale:
+            self.reload()
+        with self._lock:
+            if not self.live_count:
+                return []
+            
+            n_slots = len(self.chunk_ids)
+            avg_length = self.total_length / self.live_count
+            doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32).astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * doc_lengths / avg_length)
+            scores = np.zeros(n_slots, dtype=np.float32)
+            
+            for term in set(tokenize_vietnamese(query)):
+                term_id = self.term_ids.get(term)
+                if term_id is None:
+                    continue
+                docs = np.frombuffer(self.postings_docs[term_id], dtype=np.uint32)
+                tfs = np.frombuffer(self.postings_tfs[term_id], dtype=np.uint16).astype(np.float32)
+                df = len(docs)
+                idf = math.log(1 + (self.live_count - df + 0.5) / (df + 0.5))
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+            
+            mask = np.frombuffer(bytes(self.deleted), dtype=np.uint8).astype(bool)
+            if source is not None:
+                code = self.source_codes.get(source)
+                if code is None:
+                    return []
+                mask |= np.frombuffer(self.doc_sources, dtype=np.uint32) != code
+            scores[mask] = 0.0
+            
+            k = min(k, n_slots)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.chunk_ids[i], float(scores[i])) for i in top if scores[i] > 0]
+    
+    def on_vector_store_change(self, event: str, payload: List[Any]) -> None:
+        """EmbeddingsManager listener keeping the index (and its saved copy) in sync"""
+        if event == "reload":
+            # May be called on the event loop: only flag the index here
+            self._stale = True
+            return
+        with self._lock:
+            if event == "add":
+                self.add(payload)
+            elif event == "delete":
+                self.remove(payload)
+            
+            if self.index_path and self.processed_dir and self._save_timer is None:
+                self._save_timer = threading.Timer(self._save_delay, self._save_in_background)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+    
+    def reload(self) -> None:
+        """Replace the contents with the chunk files as changed by other processes"""
+        with self._lock:
+            if not self._stale:
+                return
+            self._stale = False
+            if not (self.index_path and self.processed_dir):
+                return
+            # The chunk files already hold this process's own pending changes
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            fresh = BM25Index.load_or_build(self.processed_dir, self.index_path, save_delay=self._save_delay)
+            self.__dict__.update({key: value for key, value in fresh.__dict__.items() if not key.startswith("_")})
+    
+    def _save_in_background(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error saving lexical index: {str(e)}")
+    
+    def flush(self) -> None:
+        """Save changes waiting for the debounced save now, e.g. on shutdown"""
+        with self._lock:
+            if self._save_timer is None:
+                return
+            self._save_timer.cancel()
+            self._save_timer = None
+            # The chunk files are written by then, so the fingerprint matches them
+            self.fingerprint = self.directory_fingerprint(self.processed_dir)
+            self.save(self.index_path)
+    
+    def save(self, path: str) -> None:
+        """Atomically write the index to disk"""
+        with self._lock:
+            state = {key: value for key, value in self.__dict__.items() if not key.startswith("_")}
+            state["version"] = INDEX_FORMAT_VERSION
+            # Every uvicorn worker may save the same path
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str, save_delay: float = 2.0) -> Optional["BM25Index"]:
+        """Load an index written by save(), or None if missing or outdated"""
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state.pop("version", None) != INDEX_FORMAT_VERSION:
+            return None
+        index = cls(k1=state["k1"], b=state["b"], save_delay=save_delay)
+        index.__dict__.update(state)
+        return index
+    
+    @staticmethod
+    def directory_fingerprint(processed_dir: str) -> str:
+        """Fingerprint of the chunk JSON files an index was built from"""
+        entries = []
+        for path in sorted(glob.glob(os.path.join(processed_dir, "*_chunks.json"))):
+            stat = os.stat(path)
+            entries.append(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+        return "|".join(entries)
+    
+    @classmethod
+    def load_or_build(cls, processed_dir: str, index_path: str, save_delay: float = 2.0) -> "BM25Index":
+        """Load the saved index if the chunk files are unchanged, otherwise rebuild it"""
+        fingerprint = cls.directory_fingerprint(processed_dir)
+        index = cls.load(index_path, save_delay=save_delay)
+        if index is None or index.fingerprint != fingerprint:
+            index = cls(save_delay=save_delay)
+            for path in sorted(glob.glob(os.path.join(processed_dir, "*_chunks.json"))):
+                with open(path, "r", encoding="utf-8") as f:
+                    index.add(json.load(f))
+            index.fingerprint = fingerprint
+            os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+            index.save(index_path)
+        
+        index.processed_dir = processed_dir
+        index.index_path = index_path
+        return index
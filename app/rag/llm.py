@@ -0,0 +1,133 @@
+import time
+import random
+import asyncio
+from typing import Any, AsyncIterator, Iterator, Optional
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+LLM_BACKENDS = ("openai", "local", "fake")
+
+FAKE_RESPONSE = (
+    "Theo quy chế đào tạo được trích dẫn, sinh viên cần đáp ứng đầy đủ các điều kiện "
+    "về số tín chỉ tích lũy, điểm trung bình và thời hạn đăng ký theo quy định của Hiệu trưởng."
+)
+
+class FakeChatModel:
+    """
+    Deterministic offline LLM with a configurable latency and token rate
+    
+    Exposes the subset of the LangChain chat model interface the pipeline
+    uses (invoke, ainvoke, stream, astream). The first token arrives after
+    latency_ms and the rest at tokens_per_sec (0 means all at once), so
+    benchmarks measure pipeline overhead without a network or an API key.
+    failure_rate makes that fraction of calls raise, to exercise retries.
+    """
+    
+    def __init__(
+        self,
+        latency_ms: float = 300,
+        tokens_per_sec: float = 50,
+        response_tokens: int = 40,
+        failure_rate: float = 0.0,
+        seed: int = 0
+    ):
+        self.latency = latency_ms / 1000
+        self.tokens_per_sec = tokens_per_sec
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        
+        words = FAKE_RESPONSE.split()
+        self.tokens = [f"{words[i % len(words)]} " for i in range(response_tokens)]
+        self.response = "".join(self.tokens).strip()
+    
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_sec if self.tokens_per_sec else 0.0
+    
+    def _total_delay(self) -> float:
+        return self.latency + self._token_delay() * (len(self.tokens) - 1)
+    
+    def _maybe_fail(self) -> None:
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise RuntimeError("Fake LLM failure")
+    
+    def invoke(self, prompt: Any) -> AIMessage:
+        time.sleep(self._total_delay())
+        self._maybe_fail()
+        return AIMessage(content=self.response)
+    
+    async def ainvoke(self, prompt: Any) -> AIMessage:
+        await asyncio.sleep(self._total_delay())
+        self._maybe_fail()
+        return AIMessage(content=self.response)
+    
+    def stream(self, prompt: Any) -> Iterator[AIMessageChunk]:
+        time.sleep(self.latency)
+        self._maybe_fail()
+        for i, token in enumerate(self.tokens):
+            if i:
+                time.sleep(self._token_delay())
+            yield AIMessageChunk(content=token)
+    
+    async def astream(self, prompt: Any) -> AsyncIterator[AIMessageChunk]:
+        await asyncio.sleep(self.latency)
+        self._maybe_fail()
+        for i, token in enumerate(self.tokens):
+            if i:
+                await asyncio.sleep(self._token_delay())
+            yield AIMessageChunk(content=token)
+
+def create_llm(
+    backend: str = "openai",
+    model_name: str = "gpt-3.5-turbo",
+    temperature: float = 0.1,
+    max_tokens: int = 1024,
+    base_url: Optional[str] = None,
+    api_key: Optional[str] = None,
+    fake_latency_ms: float = 300,
+    fake_tokens_per_sec: float = 50,
+    fake_response_tokens: int = 40,
+    fake_failure_rate: float = 0.0
+):
+    """
+    Create the chat model for a backend
+    
+    Args:
+        backend: "openai" (OpenAI API), "local" (OpenAI-compatible server such
+            as llama.cpp or vLLM at base_url) or "fake" (offline FakeChatModel)
+        model_name: Model name sent to the API
+        temperature: Sampling temperature
+        max_tokens: Maximum tokens to generate
+        base_url: Server URL for the "local" backend
+        api_key: API key for the "local" backend (most local servers ignore it)
+        fake_latency_ms: Time to first token of the fake backend
+        fake_tokens_per_sec: Token rate of the fake backend
+        fake_response_tokens: Length of the fake response in tokens
+        fake_failure_rate: Fraction of fake calls that raise
+    
+    Returns:
+        An object with invoke/ainvoke/stream/astream
+    """
+    if backend == "fake":
+        return FakeChatModel(
+            latency_ms=fake_latency_ms,
+            tokens_per_sec=fake_tokens_per_sec,
+            response_tokens=fake_response_tokens,
+            failure_rate=fake_failure_rate
+        )
+    
+    from langchain_openai import ChatOpenAI
+    
+    if backend == "openai":
+        return ChatOpenAI(
+            model_name=model_name,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    if backend == "local":
+        return ChatOpenAI(
+            model_name=model_name,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            base_url=base_url,
+            api_key=api_key or "not-needed"
+        )
+    raise ValueError(f"Unknown LLM backend {backend!r}, expected one of {LLM_BACKENDS}")
@@ -0,0 +1,101 @@
+import os
+import json
+from typing import List, Dict, Any
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+MODEL_FILENAME = "model.onnx"
+QUANTIZED_MODEL_FILENAME = "model.int8.onnx"
+CONFIG_FILENAME = "embedding_config.json"
+
+POOLING_MODES = ("mean", "cls", "max")
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings from a transformer exported to ONNX
+    
+    Runs the model written by scripts/export_onnx.py with ONNX Runtime on
+    CPU, without importing torch. Tokenization, pooling and L2
+    normalization follow the sentence-transformers model it was exported
+    from, so vectors match the torch backend (exactly up to float error
+    for the fp32 model, approximately for the int8 one).
+    """
+    
+    def __init__(
+        self,
+        model_dir: str,
+        quantized: bool = True,
+        threads: int = 0,
+        batch_size: int = 32
+    ):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        
+        with open(os.path.join(model_dir, CONFIG_FILENAME), "r", encoding="utf-8") as f:
+            config: Dict[str, Any] = json.load(f)
+        self.pooling = config.get("pooling", "mean")
+        if self.pooling not in POOLING_MODES:
+            raise ValueError(f"Unsupported pooling mode {self.pooling!r}, expected one of {POOLING_MODES}")
+        self.max_length = config.get("max_length", 256)
+        self.batch_size = batch_size
+        
+        model_path = os.path.join(model_dir, QUANTIZED_MODEL_FILENAME if quantized else MODEL_FILENAME)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"{model_path} not found; export it with scripts/export_onnx.py"
+                + (" --quantize" if quantized else "")
+            )
+        self.model_path = model_path
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.pooling == "cls":
+            return hidden[:, 0]
+        mask = attention_mask[:, :, None].astype(hidden.dtype)
+        if self.pooling == "max":
+            return np.where(mask > 0, hidden, -1e9).max(axis=1)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+    
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode one batch into L2-normalized vectors"""
+        encoded = self.tokenizer(
+            [text.strip() for text in texts],
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np"
+        )
+        inputs = {}
+        for name in self.input_names:
+            if name in encoded:
+                inputs[name] = encoded[name].astype(np.int64)
+            else:
+                inputs[name] = np.zeros_like(encoded["input_ids"], dtype=np.int64)
+        
+        hidden = self.session.run(None, inputs)[0]
+        vectors = self._pool(hidden, encoded["attention_mask"])
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Batch texts of similar length together so little compute goes to padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors: List[Any] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self.encode([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,204 @@
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict, deque, Counter
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+class QueryEmbeddingCache:
+    """
+    In-process LRU of query embeddings keyed by model name and normalized text
+    
+    When spill_path is set, entries evicted from memory are written to a SQLite
+    file and promoted back into memory on the next hit, so the cache can
+    exceed max_size; flush() writes the in-memory entries too, so the working
+    set survives a restart.
+    """
+    
+    def __init__(self, model_name: str, max_size: int = 10000, spill_path: Optional[str] = None):
+        self.model_name = model_name
+        self.max_size = max_size
+        self.spill_path = spill_path
+        
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if spill_path:
+            self._db = sqlite3.connect(spill_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings "
+                "(model TEXT, query TEXT, embedding BLOB, PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+        
+        # Counters
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+    
+    def get(self, query: str) -> Optional[List[float]]:
+        """Return the cached embedding of a normalized query, if any"""
+        embedding = self.get_memory(query)
+        return embedding if embedding is not None else self.get_spilled(query)
+    
+    def get_memory(self, query: str) -> Optional[List[float]]:
+        """Look up the in-memory LRU only; a miss is counted by get_spilled()"""
+        with self._lock:
+            vector = self._entries.get(query)
+            if vector is None:
+                return None
+            self._entries.move_to_end(query)
+            self.hits += 1
+            return vector.tolist()
+    
+    def get_spilled(self, query: str) -> Optional[List[float]]:
+        """Look up the spill file (blocking SQLite read) and promote a hit into memory"""
+        with self._lock:
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT embedding FROM query_embeddings WHERE model = ? AND query = ?",
+                    (self.model_name, query)
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._put_locked(query, vector)
+                    self.disk_hits += 1
+                    return vector.tolist()
+            
+            self.misses += 1
+            return None
+    
+    def put(self, query: str, embedding: List[float]) -> None:
+        """Cache the embedding of a normalized query"""
+        with self._lock:
+            self._put_locked(query, np.asarray(embedding, dtype=np.float32))
+    
+    def _put_locked(self, query: str, vector: np.ndarray) -> None:
+        self._entries[query] = vector
+        self._entries.move_to_end(query)
+        evicted = []
+        while len(self._entries) > self.max_size:
+            evicted.append(self._entries.popitem(last=False))
+        
+        if evicted and self._db is not None:
+            self._spill_locked(evicted)
+    
+    def _spill_locked(self, entries: List[Tuple[str, np.ndarray]]) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO query_embeddings (model, query, embedding) VALUES (?, ?, ?)",
+            [(self.model_name, key, value.tobytes()) for key, value in entries]
+        )
+        self._db.commit()
+    
+    def flush(self) -> None:
+        """Write the in-memory entries to the spill file, e.g. on shutdown"""
+        with self._lock:
+            if self._db is not None and self._entries:
+                self._spill_locked(list(self._entries.items()))
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss counters"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+
+class BatchingQueryEncoder:
+    """
+    Micro-batching encoder for concurrent queries
+    
+    Queries arriving within max_wait_ms of each other are collected and
+    encoded with a single call to encode_batch on the given executor. A batch
+    is dispatched early once it reaches max_batch_size.
+    """
+    
+    def __init__(
+        self,
+        encode_batch: Callable[[List[str]], List[List[float]]],
+        executor: Executor,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5
+    ):
+        self.encode_batch = encode_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        
+        self._pending: List[Tuple[str, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        
+        # Metrics
+        self.batches = 0
+        self.queries = 0
+        self.batch_sizes: Counter = Counter()
+        self.queue_waits: deque = deque(maxlen=1000)
+        self.encode_times: deque = deque(maxlen=1000)
+    
+    async def encode(self, query: str) -> List[float]:
+        """Queue a query for the next batch and wait for its embedding"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, future, time.perf_counter()))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        
+        return await future
+    
+    def _flush(self) -> None:
+        """Dispatch all pending queries as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        asyncio.get_running_loop().create_task(self._run_batch(batch))
+    
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future, float]]) -> None:
+        loop = asyncio.get_running_loop()
+        dispatched = time.perf_counter()
+        unique_queries = list(dict.fromkeys(query for query, _, _ in batch))
+        
+        try:
+            embeddings = await loop.run_in_executor(self.executor, self.encode_batch, unique_queries)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        by_query = dict(zip(unique_queries, embeddings))
+        for query, future, enqueued in batch:
+            self.queue_waits.append(dispatched - enqueued)
+            if not future.done():
+                future.set_result(by_query[query])
+        
+        self.batches += 1
+        self.queries += len(batch)
+        self.batch_sizes[len(batch)] += 1
+        self.encode_times.append(time.perf_counter() - dispatched)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return batch size and queue wait metrics"""
+        waits = sorted(self.queue_waits)
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch_size": self.queries / self.batches if self.batches else 0.0,
+            "max_batch_size": max(self.batch_sizes) if self.batch_sizes else 0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "queue_wait_mean_ms": sum(waits) / len(waits) * 1000 if waits else 0.0,
+            "queue_wait_p95_ms": waits[int(len(waits) * 0.95)] * 1000 if waits else 0.0,
+            "encode_mean_ms": sum(self.encode_times) / len(self.encode_times) * 1000 if self.encode_times else 0.0
+        }
@@ -1,7 +1,20 @@
-from typing import Dict, List, Any, Optional
+import time
+import random
+import asyncio
+from functools import partial
+from typing import Dict, List, Any, Optional, AsyncIterator, Tuple
 from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from app.rag.retriever import DocumentRetriever
+from app.rag.cache import AnswerCache
+from app.rag.llm import create_llm
+from app.rag.context_builder import ContextBuilder, TokenCounter
+from app.rag.reranker import CrossEncoderReranker
+from app.utils.telemetry import span, record_span, record_llm_tokens
+
+# Answer sent without calling the LLM when retrieval finds nothing relevant
+NO_CONTEXT_RESPONSE = (
+    "Xin lỗi, tôi không tìm thấy thông tin liên quan trong quy chế để trả lời câu hỏi này."
+)
 
 class RAGPipeline:
     """RAG pipeline for university regulation Q&A"""
@@ -11,20 +24,45 @@ class RAGPipeline:
         retriever: DocumentRetriever,
         model_name: str = "gpt-3.5-turbo",
         temperature: float = 0.1,
-        max_tokens: int = 1024
+        max_tokens: int = 1024,
+        answer_cache: Optional[AnswerCache] = None,
+        llm_concurrency: int = 8,
+        llm_max_retries: int = 3,
+        llm_retry_backoff: float = 0.5,
+        llm=None,
+        context_builder: Optional[ContextBuilder] = None,
+        reranker: Optional[CrossEncoderReranker] = None,
+        rerank_candidates: int = 30,
+        rerank_top_n: int = 3
     ):
         self.retriever = retriever
+        self.answer_cache = answer_cache
         self.model_name = model_name
         self.temperature = temperature
         self.max_tokens = max_tokens
         
-        # Initialize LLM
-        self.llm = ChatOpenAI(
+        # Shared by all batch requests so together they stay under the limit
+        self.llm_semaphore = asyncio.Semaphore(llm_concurrency)
+        self.llm_max_retries = llm_max_retries
+        self.llm_retry_backoff = llm_retry_backoff
+        
+        # Initialize LLM (OpenAI unless a backend from create_llm is passed in)
+        self.llm = llm if llm is not None else create_llm(
+            "openai",
             model_name=self.model_name,
             temperature=self.temperature,
             max_tokens=self.max_tokens
         )
         
+        # Optional second stage: retrieve rerank_candidates chunks, keep the
+        # rerank_top_n best by cross-encoder score
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        self.rerank_top_n = rerank_top_n
+        
+        # Packs retrieved chunks into the prompt within a token budget
+        self.context_builder = context_builder or ContextBuilder(TokenCounter(model_name))
+        
         # Define RAG prompt template
         self.rag_template = """
         Bạn là trợ lý thông minh chuyên giải đáp về quy chế đào tạo của trường đại học. 
@@ -50,11 +88,160 @@ class RAGPipeline:
             input_variables=["context", "question"]
         )
     
+    def _build_prompt(
+        self,
+        query: str,
+        retrieved_docs: List[Dict[str, Any]]
+    ) -> Tuple[str, List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Create the LLM prompt from the question and retrieved documents
+        
+        Returns the prompt, the context blocks it cites (the sources shown
+        to the user) and token usage.
+        """
+        with span("prompt"):
+            context, context_docs, usage = self.context_builder.build(retrieved_docs)
+            prompt = self.prompt.format(
+                context=context,
+                question=query
+            )
+            usage["prompt_tokens"] = self.context_builder.token_counter.count(prompt)
+        return prompt, context_docs, usage
+    
+    def _record_completion(self, usage: Dict[str, Any], response: str) -> None:
+        """Count the completion tokens into usage and the token histograms"""
+        usage["completion_tokens"] = self.context_builder.token_counter.count(response)
+        record_llm_tokens(usage["prompt_tokens"], usage["completion_tokens"])
+    
+    def _retrieval_k(self, k: int) -> int:
+        """Number of chunks to retrieve: the reranker's candidate pool, if enabled"""
+        return max(k, self.rerank_candidates) if self.reranker is not None else k
+    
+    def _rerank(self, query: str, retrieved_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Keep the best rerank_top_n candidates by cross-encoder score"""
+        if self.reranker is None or not retrieved_docs:
+            return retrieved_docs
+        with span("rerank"):
+            return self.reranker.rerank(query, retrieved_docs, self.rerank_top_n)
+    
+    async def _arerank(self, query: str, retrieved_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Async variant of _rerank that runs the model on the embeddings executor"""
+        if self.reranker is None or not retrieved_docs:
+            return retrieved_docs
+        loop = asyncio.get_running_loop()
+        with span("rerank"):
+            return await loop.run_in_executor(
+                self.retriever.embeddings_manager.executor,
+                self.reranker.rerank, query, retrieved_docs, self.rerank_top_n
+            )
+    
+    @staticmethod
+    def _timings(start: float, retrieved_at: float, reranked_at: float) -> Dict[str, float]:
+        """Per-stage latency in milliseconds, ending now"""
+        end = time.perf_counter()
+        return {
+            "retrieval_ms": (retrieved_at - start) * 1000,
+            "rerank_ms": (reranked_at - retrieved_at) * 1000,
+            "generation_ms": (end - reranked_at) * 1000,
+            "total_ms": (end - start) * 1000
+        }
+    
+    def _no_context_result(self) -> Dict[str, Any]:
+        """Result for a question with no relevant chunks; the LLM is not called"""
+        _, _, usage = self.context_builder.build([])
+        usage["prompt_tokens"] = 0
+        return self._build_result(NO_CONTEXT_RESPONSE, [], usage)
+    
+    def _build_result(
+        self,
+        response: str,
+        context_docs: List[Dict[str, Any]],
+        usage: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Create the response object returned to API callers"""
+        return {
+            "response": response,
+            "sources": [
+                {
+                    "text": doc["text"],
+                    "metadata": doc["metadata"]
+                }
+                for doc in context_docs
+            ],
+            "usage": usage
+        }
+    
+    def _lookup_cache(
+        self,
+        query: str,
+        k: int,
+        source_filter: Optional[str],
+        use_cache: bool = True
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]], int]:
+        """
+        Check the answer cache, exact match first, then semantic
+        
+        Returns the cached result (or None), the query embedding if one was
+        computed, and the index version the lookup was made against.
+        Answers are only cached for the default retrieval options, so
+        use_cache is False when a request overrides them.
+        """
+        embeddings_manager = self.retriever.embeddings_manager
+        index_version = embeddings_manager.index_version
+        if self.answer_cache is None or not use_cache:
+            return None, None, index_version
+        
+        cached = self.answer_cache.get_exact(query, source_filter, k, index_version)
+        if cached is not None:
+            return cached, None, index_version
+        
+        with span("embed"):
+            query_embedding = embeddings_manager.embed_query(query)
+        cached = self.answer_cache.get_semantic(query_embedding, source_filter, k, index_version)
+        return cached, query_embedding, index_version
+    
+    async def _alookup_cache(
+        self,
+        query: str,
+        k: int,
+        source_filter: Optional[str],
+        use_cache: bool = True
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]], int]:
+        """Async variant of _lookup_cache that encodes on the executor"""
+        embeddings_manager = self.retriever.embeddings_manager
+        index_version = embeddings_manager.index_version
+        if self.answer_cache is None or not use_cache:
+            return None, None, index_version
+        
+        cached = self.answer_cache.get_exact(query, source_filter, k, index_version)
+        if cached is not None:
+            return cached, None, index_version
+        
+        with span("embed"):
+            query_embedding = await embeddings_manager.aembed_query(query)
+        cached = self.answer_cache.get_semantic(query_embedding, source_filter, k, index_version)
+        return cached, query_embedding, index_version
+    
+    def _store_cache(
+        self,
+        query: str,
+        k: int,
+        source_filter: Optional[str],
+        index_version: int,
+        query_embedding: Optional[List[float]],
+        result: Dict[str, Any]
+    ) -> None:
+        """Cache a freshly generated answer"""
+        if self.answer_cache is not None and query_embedding is not None:
+            self.answer_cache.set(query, source_filter, k, index_version, query_embedding, result)
+    
     def generate_response(
         self, 
         query: str,
         k: int = 3,
-        source_filter: Optional[str] = None
+        source_filter: Optional[str] = None,
+        min_score: Optional[float] = None,
+        retrieval_mode: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Generate response using RAG pipeline
@@ -63,36 +250,281 @@ class RAGPipeline:
             query: User question
             k: Number of documents to retrieve
             source_filter: Optional filter by document source
+            min_score: Optional minimum similarity of retrieved chunks
+            retrieval_mode: Optional "similarity" or "mmr"
             
         Returns:
-            Dictionary with response and retrieved sources
+            Dictionary with response, retrieved sources, token usage and
+            per-stage timings
         """
+        start = time.perf_counter()
+        use_cache = min_score is None and retrieval_mode is None
+        cached, query_embedding, index_version = self._lookup_cache(query, k, source_filter, use_cache)
+        if cached is not None:
+            return cached
+        
         # Retrieve relevant documents
         retrieved_docs = self.retriever.retrieve_documents(
             query=query,
-            k=k,
-            source_filter=source_filter
+            k=self._retrieval_k(k),
+            source_filter=source_filter,
+            query_embedding=query_embedding,
+            min_score=min_score,
+            mode=retrieval_mode
         )
-        
-        # Create context from retrieved documents
-        context = self.retriever.format_retrieved_documents(retrieved_docs)
+        retrieved_at = time.perf_counter()
+        retrieved_docs = self._rerank(query, retrieved_docs)
+        reranked_at = time.perf_counter()
+        if not retrieved_docs:
+            return {**self._no_context_result(), "timings": self._timings(start, retrieved_at, reranked_at)}
         
         # Generate response
-        formatted_prompt = self.prompt.format(
-            context=context,
-            question=query
+        formatted_prompt, context_docs, usage = self._build_prompt(query, retrieved_docs)
+        with span("llm"):
+            response = self.llm.invoke(formatted_prompt).content
+        self._record_completion(usage, response)
+        
+        result = self._build_result(response, context_docs, usage)
+        self._store_cache(query, k, source_filter, index_version, query_embedding, result)
+        return {**result, "timings": self._timings(start, retrieved_at, reranked_at)}
+    
+    async def agenerate_response(
+        self,
+        query: str,
+        k: int = 3,
+        source_filter: Optional[str] = None,
+        min_score: Optional[float] = None,
+        retrieval_mode: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Async variant of generate_response
+        
+        Retrieval runs on the embeddings executor and the LLM is called with
+        ainvoke, so the event loop stays free for other requests.
+        """
+        start = time.perf_counter()
+        use_cache = min_score is None and retrieval_mode is None
+        cached, query_embedding, index_version = await self._alookup_cache(query, k, source_filter, use_cache)
+        if cached is not None:
+            return cached
+        
+        retrieved_docs = await self.retriever.aretrieve_documents(
+            query=query,
+            k=self._retrieval_k(k),
+            source_filter=source_filter,
+            query_embedding=query_embedding,
+            min_score=min_score,
+            mode=retrieval_mode
         )
+        retrieved_at = time.perf_counter()
+        retrieved_docs = await self._arerank(query, retrieved_docs)
+        reranked_at = time.perf_counter()
+        if not retrieved_docs:
+            return {**self._no_context_result(), "timings": self._timings(start, retrieved_at, reranked_at)}
         
-        response = self.llm.invoke(formatted_prompt).content
+        formatted_prompt, context_docs, usage = self._build_prompt(query, retrieved_docs)
+        with span("llm"):
+            response = (await self.llm.ainvoke(formatted_prompt)).content
+        self._record_completion(usage, response)
         
-        # Create response object
-        return {
-            "response": response,
-            "sources": [
-                {
-                    "text": doc["text"],
-                    "metadata": doc["metadata"]
+        result = self._build_result(response, context_docs, usage)
+        self._store_cache(query, k, source_filter, index_version, query_embedding, result)
+        return {**result, "timings": self._timings(start, retrieved_at, reranked_at)}
+    
+    async def astream_response(
+        self,
+        query: str,
+        k: int = 3,
+        source_filter: Optional[str] = None,
+        min_score: Optional[float] = None,
+        retrieval_mode: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a RAG response as events
+        
+        Yields a "sources" event once retrieval finishes, one "token" event per
+        LLM chunk, then a "done" event with timings (retrieval, reranking, time
+        to first token and total time, in milliseconds). A cached answer, or the fixed answer
+        when nothing relevant is retrieved, is sent as a single token event.
+        """
+        start = time.perf_counter()
+        use_cache = min_score is None and retrieval_mode is None
+        cached, query_embedding, index_version = await self._alookup_cache(query, k, source_filter, use_cache)
+        if cached is not None:
+            yield {"event": "sources", "data": cached["sources"]}
+            yield {"event": "token", "data": cached["response"]}
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            yield {
+                "event": "done",
+                "data": {
+                    "retrieval_ms": 0.0,
+                    "rerank_ms": 0.0,
+                    "ttft_ms": elapsed_ms,
+                    "total_ms": elapsed_ms,
+                    "cached": True,
+                    "usage": cached.get("usage")
+                }
+            }
+            return
+        
+        retrieved_docs = await self.retriever.aretrieve_documents(
+            query=query,
+            k=self._retrieval_k(k),
+            source_filter=source_filter,
+            query_embedding=query_embedding,
+            min_score=min_score,
+            mode=retrieval_mode
+        )
+        retrieval_ms = (time.perf_counter() - start) * 1000
+        retrieved_docs = await self._arerank(query, retrieved_docs)
+        rerank_ms = (time.perf_counter() - start) * 1000 - retrieval_ms
+        
+        if not retrieved_docs:
+            result = self._no_context_result()
+            yield {"event": "sources", "data": []}
+            yield {"event": "token", "data": result["response"]}
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            yield {
+                "event": "done",
+                "data": {
+                    "retrieval_ms": retrieval_ms,
+                    "rerank_ms": rerank_ms,
+                    "ttft_ms": elapsed_ms,
+                    "total_ms": elapsed_ms,
+                    "cached": False,
+                    "usage": result["usage"]
                 }
-                for doc in retrieved_docs
-            ]
-        }
\ No newline at end of file
+            }
+            return
+        
+        formatted_prompt, context_docs, usage = self._build_prompt(query, retrieved_docs)
+        yield {
+            "event": "sources",
+            "data": self._build_result("", context_docs)["sources"]
+        }
+        
+        ttft_ms = None
+        tokens = []
+        llm_start = time.perf_counter()
+        async for chunk in self.llm.astream(formatted_prompt):
+            if not chunk.content:
+                continue
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - start) * 1000
+                record_span("llm_first_token", time.perf_counter() - llm_start)
+            tokens.append(chunk.content)
+            yield {"event": "token", "data": chunk.content}
+        record_span("llm", time.perf_counter() - llm_start)
+        self._record_completion(usage, "".join(tokens))
+        
+        result = self._build_result("".join(tokens), context_docs, usage)
+        self._store_cache(query, k, source_filter, index_version, query_embedding, result)
+        
+        yield {
+            "event": "done",
+            "data": {
+                "retrieval_ms": retrieval_ms,
+                "rerank_ms": rerank_ms,
+                "ttft_ms": ttft_ms,
+                "total_ms": (time.perf_counter() - start) * 1000,
+                "cached": False,
+                "usage": usage
+            }
+        }
+    
+    async def _ainvoke_with_retry(self, prompt: str) -> str:
+        """Call the LLM under the concurrency limit, retrying with exponential backoff and jitter"""
+        for attempt in range(self.llm_max_retries + 1):
+            try:
+                # Waiting for a slot is queueing, not model latency
+                queued = time.perf_counter()
+                async with self.llm_semaphore:
+                    record_span("llm_queue", time.perf_counter() - queued)
+                    with span("llm"):
+                        return (await self.llm.ainvoke(prompt)).content
+            except Exception:
+                if attempt == self.llm_max_retries:
+                    raise
+                delay = self.llm_retry_backoff * (2 ** attempt)
+                await asyncio.sleep(delay * (0.5 + random.random()))
+    
+    async def agenerate_batch(
+        self,
+        queries: List[str],
+        k: int = 3,
+        source_filters: Optional[List[Optional[str]]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Answer a batch of questions, yielding each result as soon as it is ready
+        
+        All queries are encoded in one embedding batch, searched together
+        (one vector store call per distinct source filter), and the LLM calls
+        fan out under the pipeline's concurrency limit with retries. Results
+        arrive in completion order and carry the input index; a failed
+        question yields an item with an error instead of aborting the batch.
+        """
+        source_filters = source_filters or [None] * len(queries)
+        embeddings_manager = self.retriever.embeddings_manager
+        index_version = embeddings_manager.index_version
+        
+        with span("embed"):
+            query_embeddings = await embeddings_manager.aembed_queries(queries)
+        
+        # Answer what we can from the cache
+        pending = []
+        for i, (query, source_filter, embedding) in enumerate(zip(queries, source_filters, query_embeddings)):
+            cached = None
+            if self.answer_cache is not None:
+                cached = self.answer_cache.get_exact(query, source_filter, k, index_version)
+                if cached is None:
+                    cached = self.answer_cache.get_semantic(embedding, source_filter, k, index_version)
+            if cached is not None:
+                yield {"index": i, "query": query, **cached, "cached": True}
+            else:
+                pending.append(i)
+        
+        if not pending:
+            return
+        
+        retrieved = await self.retriever.aretrieve_documents_batch(
+            [queries[i] for i in pending],
+            [query_embeddings[i] for i in pending],
+            k=self._retrieval_k(k),
+            source_filters=[source_filters[i] for i in pending]
+        )
+        if self.reranker is not None:
+            # One cross-encoder call for the candidates of every question
+            loop = asyncio.get_running_loop()
+            retrieved = await loop.run_in_executor(
+                self.retriever.embeddings_manager.executor,
+                partial(self.reranker.rerank_batch, [queries[i] for i in pending], retrieved, self.rerank_top_n)
+            )
+        
+        async def answer(i: int, retrieved_docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+            if not retrieved_docs:
+                return {"index": i, "query": queries[i], **self._no_context_result(), "cached": False, "llm_ms": 0.0}
+            start = time.perf_counter()
+            formatted_prompt, context_docs, usage = self._build_prompt(queries[i], retrieved_docs)
+            try:
+                response = await self._ainvoke_with_retry(formatted_prompt)
+            except Exception as e:
+                return {"index": i, "query": queries[i], "error": str(e)}
+            self._record_completion(usage, response)
+            result = self._build_result(response, context_docs, usage)
+            self._store_cache(queries[i], k, source_filters[i], index_version, query_embeddings[i], result)
+            return {
+                "index": i,
+                "query": queries[i],
+                **result,
+                "cached": False,
+                "llm_ms": (time.perf_counter() - start) * 1000
+            }
+        
+        tasks = [asyncio.create_task(answer(i, docs)) for i, docs in zip(pending, retrieved)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # The client may disconnect mid-stream; don't leave LLM calls running
+            for task in tasks:
+                task.cancel()
\ No newline at end of file
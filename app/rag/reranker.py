@@ -0,0 +1,124 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import List, Dict, Any, Tuple
+from app.rag.cache import normalize_query
+
+class CrossEncoderReranker:
+    """
+    Rerank retrieved chunks with a cross-encoder
+    
+    Each (query, chunk) pair is scored jointly by a small CPU cross-encoder,
+    which ranks far better than embedding similarity but is too slow to run
+    over the whole collection, so it is applied to the retrieved candidates
+    only. Scores are cached by (normalized query, chunk_id): chunk IDs change
+    with chunk content, so cached scores never go stale.
+    """
+    
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+        batch_size: int = 32,
+        max_length: int = 512,
+        cache_size: int = 20000
+    ):
+        from sentence_transformers import CrossEncoder
+        
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        
+        self.cache_size = cache_size
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.predict_times: deque = deque(maxlen=1000)
+    
+    @staticmethod
+    def _chunk_key(doc: Dict[str, Any]) -> str:
+        return doc["metadata"].get("chunk_id") or doc["text"]
+    
+    def score_pairs(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """Score (query, text) pairs with the model, batch_size pairs per forward pass"""
+        if not pairs:
+            return []
+        start = time.perf_counter()
+        scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        self.predict_times.append(time.perf_counter() - start)
+        return [float(score) for score in scores]
+    
+    def score_batch(self, queries: List[str], documents: List[List[Dict[str, Any]]]) -> List[List[float]]:
+        """
+        Score the candidates of several queries
+        
+        Cached pairs are looked up and all remaining pairs, across every
+        query, are scored in one model call.
+        
+        Returns:
+            One list of scores per query, aligned with its documents
+        """
+        keys = [
+            [(normalize_query(query), self._chunk_key(doc)) for doc in docs]
+            for query, docs in zip(queries, documents)
+        ]
+        
+        scores: Dict[Tuple[str, str], float] = {}
+        misses: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        with self._lock:
+            for query, docs, query_keys in zip(queries, documents, keys):
+                for doc, key in zip(docs, query_keys):
+                    if key in scores or key in misses:
+                        continue
+                    score = self._scores.get(key)
+                    if score is not None:
+                        self._scores.move_to_end(key)
+                        scores[key] = score
+                        self.hits += 1
+                    else:
+                        misses[key] = (query, doc["text"])
+                        self.misses += 1
+        
+        if misses:
+            new_scores = dict(zip(misses, self.score_pairs(list(misses.values()))))
+            scores.update(new_scores)
+            with self._lock:
+                self._scores.update(new_scores)
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+        
+        return [[scores[key] for key in query_keys] for query_keys in keys]
+    
+    def rerank_batch(
+        self,
+        queries: List[str],
+        documents: List[List[Dict[str, Any]]],
+        top_n: int
+    ) -> List[List[Dict[str, Any]]]:
+        """Reorder each query's candidates by cross-encoder score and keep the top_n"""
+        reranked = []
+        for docs, doc_scores in zip(documents, self.score_batch(queries, documents)):
+            order = sorted(range(len(docs)), key=lambda i: -doc_scores[i])[:top_n]
+            reranked.append([{**docs[i], "rerank_score": doc_scores[i]} for i in order])
+        return reranked
+    
+    def rerank(self, query: str, documents: List[Dict[str, Any]], top_n: int) -> List[Dict[str, Any]]:
+        """Reorder candidates by cross-encoder score and keep the top_n"""
+        return self.rerank_batch([query], [documents], top_n)[0]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return score cache counters and model call latency"""
+        lookups = self.hits + self.misses
+        predict_ms = sorted(t * 1000 for t in self.predict_times)
+        return {
+            "model": self.model_name,
+            "cache_size": len(self._scores),
+            "max_cache_size": self.cache_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "predict_calls": len(predict_ms),
+            "predict_p50_ms": predict_ms[len(predict_ms) // 2] if predict_ms else None
+        }
@@ -1,49 +1,312 @@
-from typing import List, Dict, Any
+import asyncio
+from functools import partial
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 from app.rag.embeddings import EmbeddingsManager
+from app.rag.lexical_index import BM25Index
+from app.utils.telemetry import span
+
+RETRIEVAL_MODES = ("similarity", "mmr")
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists with reciprocal rank fusion, best first"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, 1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+def maximal_marginal_relevance(
+    query_embedding: List[float],
+    embeddings: List[List[float]],
+    k: int,
+    lambda_mult: float = 0.5
+) -> List[int]:
+    """
+    Select k candidates by maximal marginal relevance
+    
+    Each step picks the candidate maximizing
+    lambda_mult * sim(query, c) - (1 - lambda_mult) * max sim(c, selected),
+    with all similarities computed up front as two matrix products.
+    
+    Returns:
+        Indexes into embeddings, in selection order
+    """
+    if not embeddings or k <= 0:
+        return []
+    candidates = np.array(embeddings, dtype=np.float32)
+    candidates /= np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.array(query_embedding, dtype=np.float32)
+    query /= max(np.linalg.norm(query), 1e-12)
+    
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
 
 class DocumentRetriever:
     """Retrieve relevant documents for a given query"""
     
-    def __init__(self, embeddings_manager: EmbeddingsManager):
+    def __init__(
+        self,
+        embeddings_manager: EmbeddingsManager,
+        lexical_index: Optional[BM25Index] = None,
+        hybrid_candidates: int = 20,
+        rrf_k: int = 60,
+        min_score: Optional[float] = None,
+        mode: str = "similarity",
+        mmr_lambda: float = 0.5,
+        mmr_fetch_k: int = 20
+    ):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
         self.embeddings_manager = embeddings_manager
+        self.lexical_index = lexical_index
+        self.hybrid_candidates = hybrid_candidates
+        self.rrf_k = rrf_k
+        self.min_score = min_score
+        self.mode = mode
+        self.mmr_lambda = mmr_lambda
+        self.mmr_fetch_k = mmr_fetch_k
+    
+    def _build_filter(self, source_filter: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Create metadata filter if source is specified"""
+        if source_filter:
+            return {"source": source_filter}
+        return None
+    
+    def _resolve_options(self, min_score: Optional[float], mode: Optional[str]) -> Tuple[Optional[float], str]:
+        """Fill in the retriever defaults for options a request did not set"""
+        mode = mode or self.mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+        return (self.min_score if min_score is None else min_score), mode
+    
+    def _candidate_count(self, k: int, mode: str = "similarity") -> int:
+        """Number of dense results to fetch before fusion, thresholding and MMR"""
+        count = k
+        if mode == "mmr":
+            count = max(count, self.mmr_fetch_k)
+        if self.lexical_index is not None:
+            count = max(count, self.hybrid_candidates)
+        return count
+    
+    def _select(
+        self,
+        query: str,
+        query_embedding: List[float],
+        k: int,
+        source_filter: Optional[str],
+        documents: List[Dict[str, Any]],
+        min_score: Optional[float],
+        mode: str
+    ) -> List[Dict[str, Any]]:
+        """Fuse, threshold and diversify dense candidates into the final top k"""
+        if self.lexical_index is not None:
+            # Keep the whole fused list when hits may still be dropped below
+            fused_k = k if min_score is None and mode == "similarity" else self._candidate_count(k, mode)
+            documents = self._fuse(query, query_embedding, fused_k, source_filter, documents)
+        
+        if min_score is not None:
+            documents = [doc for doc in documents if doc["score"] is not None and doc["score"] >= min_score]
+        
+        if mode == "mmr":
+            order = maximal_marginal_relevance(
+                query_embedding,
+                [doc["embedding"] for doc in documents],
+                k,
+                self.mmr_lambda
+            )
+            documents = [documents[i] for i in order]
+        
+        return [
+            {key: value for key, value in doc.items() if key != "embedding"}
+            for doc in documents[:k]
+        ]
+    
+    def _fuse(
+        self,
+        query: str,
+        query_embedding: List[float],
+        k: int,
+        source_filter: Optional[str],
+        dense_docs: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Fuse dense results with BM25 results and return the top k"""
+        # Flags the BM25 index for reload if another worker changed the collection
+        self.embeddings_manager.sync_index_version()
+        lexical_hits = self.lexical_index.search(query, k=self.hybrid_candidates, source=source_filter or None)
+        
+        by_id = {doc["metadata"].get("chunk_id", doc["text"]): doc for doc in dense_docs}
+        fused = reciprocal_rank_fusion(
+            [list(by_id), [chunk_id for chunk_id, _ in lexical_hits]],
+            k=self.rrf_k
+        )[:k]
+        
+        # Load chunks that only the lexical index found and score them against the query
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in by_id]
+        for chunk_id, chunk in self.embeddings_manager.get_chunks(missing, include_embeddings=True).items():
+            by_id[chunk_id] = {**chunk, "score": float(np.dot(chunk["embedding"], query_embedding))}
+        
+        return [
+            {**by_id[chunk_id], "rrf_score": score}
+            for chunk_id, score in fused
+            if chunk_id in by_id
+        ]
     
     def retrieve_documents(
         self, 
         query: str, 
         k: int = 3,
-        source_filter: str = None
+        source_filter: str = None,
+        query_embedding: Optional[List[float]] = None,
+        min_score: Optional[float] = None,
+        mode: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
         Retrieve the most relevant documents for a query
         
+        With a lexical index, dense and BM25 candidates are fused with
+        reciprocal rank fusion.
+        
         Args:
             query: User query
             k: Number of documents to retrieve
             source_filter: Optional filter by document source
+            query_embedding: Optional precomputed embedding of the query
+            min_score: Drop chunks whose cosine similarity to the query is
+                lower (retriever default if None)
+            mode: "similarity" for the top k, or "mmr" to trade relevance
+                for diversity (retriever default if None)
             
         Returns:
-            List of relevant document chunks with metadata
+            List of relevant document chunks with metadata and score, best
+            first; fewer than k (possibly none) when min_score cuts them off
         """
-        # Create filter if source is specified
-        filter_dict = None
-        if source_filter:
-            filter_dict = {"source": source_filter}
+        min_score, mode = self._resolve_options(min_score, mode)
         
-        # Retrieve relevant documents
-        documents = self.embeddings_manager.similarity_search(
-            query=query,
-            k=k,
-            filter_metadata=filter_dict
-        )
+        # Reuse the query embedding if the caller already computed it
+        if query_embedding is None:
+            with span("embed"):
+                query_embedding = self.embeddings_manager.embed_query(query)
         
-        return documents
+        with span("search"):
+            documents = self.embeddings_manager.similarity_search_by_vector(
+                query_embedding,
+                k=self._candidate_count(k, mode),
+                filter_metadata=self._build_filter(source_filter),
+                include_embeddings=mode == "mmr"
+            )
+            return self._select(query, query_embedding, k, source_filter, documents, min_score, mode)
     
-    def format_retrieved_documents(self, documents: List[Dict[str, Any]]) -> str:
-        """Format retrieved documents for context insertion"""
-        context = ""
+    async def aretrieve_documents(
+        self,
+        query: str,
+        k: int = 3,
+        source_filter: str = None,
+        query_embedding: Optional[List[float]] = None,
+        min_score: Optional[float] = None,
+        mode: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Async variant of retrieve_documents that keeps the event loop free"""
+        min_score, mode = self._resolve_options(min_score, mode)
+        
+        if query_embedding is None:
+            with span("embed"):
+                query_embedding = await self.embeddings_manager.aembed_query(query)
         
-        for i, doc in enumerate(documents):
-            source = doc["metadata"].get("source", "Unknown source")
-            context += f"\n\nTRÍCH DẪN #{i+1} (Nguồn: {source}):\n{doc['text']}"
+        with span("search"):
+            documents = await self.embeddings_manager.asimilarity_search_by_vector(
+                query_embedding,
+                k=self._candidate_count(k, mode),
+                filter_metadata=self._build_filter(source_filter),
+                include_embeddings=mode == "mmr"
+            )
+            
+            select = partial(self._select, query, query_embedding, k, source_filter, documents, min_score, mode)
+            if self.lexical_index is None:
+                return select()
+            # Fusion runs a BM25 search and may fetch chunks from the vector store
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.embeddings_manager.executor, select)
+    
+    def retrieve_documents_batch(
+        self,
+        queries: List[str],
+        query_embeddings: List[List[float]],
+        k: int = 3,
+        source_filters: Optional[List[Optional[str]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve documents for several queries at once
+        
+        Queries sharing a source filter are searched with a single vector
+        store call; BM25 fusion, the score threshold and MMR (with the
+        retriever defaults) are then applied per query.
         
-        return context
\ No newline at end of file
+        Args:
+            queries: User queries
+            query_embeddings: Precomputed embeddings, one per query
+            k: Number of documents to retrieve per query
+            source_filters: Optional source filter per query
+            
+        Returns:
+            One list of document chunks per query, in input order
+        """
+        source_filters = source_filters or [None] * len(queries)
+        min_score, mode = self._resolve_options(None, None)
+        candidates = self._candidate_count(k, mode)
+        
+        groups: Dict[Optional[str], List[int]] = {}
+        for i, source_filter in enumerate(source_filters):
+            groups.setdefault(source_filter or None, []).append(i)
+        
+        results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        for source_filter, indexes in groups.items():
+            dense_results = self.embeddings_manager.similarity_search_by_vectors(
+                [query_embeddings[i] for i in indexes],
+                k=candidates,
+                filter_metadata=self._build_filter(source_filter),
+                include_embeddings=mode == "mmr"
+            )
+            for i, documents in zip(indexes, dense_results):
+                results[i] = self._select(
+                    queries[i], query_embeddings[i], k, source_filter, documents, min_score, mode
+                )
+        return results
+    
+    async def aretrieve_documents_batch(
+        self,
+        queries: List[str],
+        query_embeddings: List[List[float]],
+        k: int = 3,
+        source_filters: Optional[List[Optional[str]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Async variant of retrieve_documents_batch, run on the embeddings executor"""
+        loop = asyncio.get_running_loop()
+        with span("search"):
+            return await loop.run_in_executor(
+                self.embeddings_manager.executor,
+                partial(
+                    self.retrieve_documents_batch,
+                    queries,
+                    query_embeddings,
+                    k=k,
+                    source_filters=source_filters
+                )
+            )
+    
+    def format_retrieved_documents(self, documents: List[Dict[str, Any]]) -> str:
+        """Format retrieved documents for context insertion"""
+        return "".join(
+            f"\n\nTRÍCH DẪN #{i+1} (Nguồn: {doc['metadata'].get('source', 'Unknown source')}):\n{doc['text']}"
+            for i, doc in enumerate(documents)
+        )
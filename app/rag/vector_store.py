@@ -0,0 +1,838 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+from urllib.parse import quote
+import numpy as np
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialized across processes
+    fcntl = None
+
+VECTOR_STORE_BACKENDS = ("chroma", "numpy")
+
+# Metadata fields kept in memory (as one code per row) to build filter masks;
+# filters on other fields are read from the row table on first use and cached
+MASK_FIELDS = ("source", "document_id")
+
+# Copy the live rows into a new epoch once this share of the rows is dead
+COMPACT_DEAD_RATIO = 0.25
+
+# Bound parameters per SQLite statement (older SQLite builds allow 999)
+SQL_BATCH = 900
+
+# Rows copied or added to the HNSW graph per step, to bound memory
+COPY_BATCH = 4096
+
+MANIFEST_FILENAME = "manifest.json"
+FORMAT_VERSION = 2
+
+def create_vector_store(
+    backend: str,
+    persist_directory: str,
+    collection_name: str,
+    embedding_function: Embeddings,
+    **options: Any
+) -> "VectorStore":
+    """
+    Open the vector store that holds the chunk embeddings
+    
+    Args:
+        backend: "chroma" or "numpy" (memory-mapped vectors searched in process)
+        persist_directory: Vector store directory
+        collection_name: Collection within the directory
+        embedding_function: Embedding model (used by Chroma only)
+        options: Backend options; for "numpy": hnsw_threshold, hnsw_m,
+            hnsw_ef_construction and hnsw_ef_search
+    """
+    if backend == "numpy":
+        return NumpyVectorStore(os.path.join(persist_directory, "numpy", collection_name), **options)
+    if backend != "chroma":
+        raise ValueError(f"Unknown vector store backend {backend!r}, expected one of {VECTOR_STORE_BACKENDS}")
+    return ChromaVectorStore(collection_name, embedding_function, persist_directory)
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so dot products are cosine similarities"""
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+class VectorStore:
+    """
+    Storage and nearest-neighbour search for chunk embeddings
+    
+    Chunks are stored under their chunk_id with a normalized embedding,
+    text and metadata. Filters are Chroma-style equality dicts such as
+    {"source": "quy_che.pdf"}; hits carry their cosine similarity to the
+    query as "score".
+    """
+    
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        """Insert chunks, replacing stored chunks with the same IDs"""
+        raise NotImplementedError
+    
+    def delete(self, ids: List[str]) -> None:
+        """Delete chunks by ID"""
+        raise NotImplementedError
+    
+    def get_ids(self, where: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Return the IDs of all chunks matching the filter"""
+        raise NotImplementedError
+    
+    def get(self, ids: List[str], include_embeddings: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Fetch stored chunks by ID, optionally with their embeddings"""
+        raise NotImplementedError
+    
+    def query(
+        self,
+        embeddings: List[List[float]],
+        k: int = 3,
+        where: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False
+    ) -> List[List[Dict[str, Any]]]:
+        """Return the k nearest chunks of each query embedding"""
+        raise NotImplementedError
+    
+    def count(self) -> int:
+        """Number of stored chunks"""
+        raise NotImplementedError
+    
+    def persist(self) -> None:
+        """Flush pending writes to disk"""
+
+class ChromaVectorStore(VectorStore):
+    """Vector store backed by a persistent Chroma collection"""
+    
+    def __init__(self, collection_name: str, embedding_function: Embeddings, persist_directory: str):
+        try:
+            self.store = Chroma(
+                collection_name=collection_name,
+                embedding_function=embedding_function,
+                persist_directory=persist_directory
+            )
+        except Exception as e:
+            print(f"Error loading vector store: {str(e)}. Creating a new one.")
+            self.store = Chroma(
+                collection_name=collection_name,
+                embedding_function=embedding_function,
+                persist_directory=persist_directory
+            )
+        self.collection = self.store._collection
+    
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        self.collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=texts)
+    
+    def delete(self, ids: List[str]) -> None:
+        self.store.delete(ids=ids)
+    
+    def get_ids(self, where: Optional[Dict[str, Any]] = None) -> List[str]:
+        return self.store.get(where=where, include=[])["ids"]
+    
+    def get(self, ids: List[str], include_embeddings: bool = False) -> Dict[str, Dict[str, Any]]:
+        if not ids:
+            return {}
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        result = self.store.get(ids=ids, include=include)
+        chunks = {}
+        for i, (chunk_id, text, metadata) in enumerate(zip(result["ids"], result["documents"], result["metadatas"])):
+            chunks[chunk_id] = {"text": text, "metadata": metadata}
+            if include_embeddings:
+                chunks[chunk_id]["embedding"] = result["embeddings"][i]
+        return chunks
+    
+    def distance_to_score(self, distance: float) -> float:
+        """Convert a Chroma distance to cosine similarity (embeddings are normalized)"""
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "l2":
+            return 1 - distance / 2  # Chroma returns squared L2 distance
+        return 1 - distance  # cosine and ip distances
+    
+    def query(
+        self,
+        embeddings: List[List[float]],
+        k: int = 3,
+        where: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False
+    ) -> List[List[Dict[str, Any]]]:
+        if not embeddings:
+            return []
+        include = ["documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
+        result = self.collection.query(
+            query_embeddings=embeddings,
+            n_results=k,
+            where=where,
+            include=include
+        )
+        
+        results = []
+        for i, (texts, metadatas, distances) in enumerate(
+            zip(result["documents"], result["metadatas"], result["distances"])
+        ):
+            hits = []
+            for j, (text, metadata, distance) in enumerate(zip(texts, metadatas, distances)):
+                # The HNSW segment of this process can still return rows that another
+                # process deleted, with their document and metadata gone
+                if metadata is None:
+                    continue
+                hit = {"text": text, "metadata": metadata, "score": self.distance_to_score(distance)}
+                if include_embeddings:
+                    hit["embedding"] = result["embeddings"][i][j]
+                hits.append(hit)
+            results.append(hits)
+        return results
+    
+    def count(self) -> int:
+        return self.collection.count()
+    
+    def persist(self) -> None:
+        self.store.persist()
+
+class _RowTable:
+    """SQLite table with the chunk ID, text and metadata of each row of an epoch"""
+    
+    def __init__(self, path: str, create: bool = False):
+        try:
+            self._db = sqlite3.connect(
+                f"file:{quote(path)}?mode={'rwc' if create else 'rw'}",
+                uri=True,
+                check_same_thread=False,
+                timeout=30
+            )
+        except sqlite3.OperationalError:
+            # Removed by a compaction since the manifest was read
+            raise FileNotFoundError(path)
+        self._lock = threading.Lock()
+        if create:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "row INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL, text TEXT NOT NULL, "
+                "metadata TEXT NOT NULL, added_in INTEGER NOT NULL, deleted_in INTEGER)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS chunks_chunk_id ON chunks (chunk_id)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS chunks_deleted_in ON chunks (deleted_in)")
+            self._db.commit()
+        self._db.execute("PRAGMA synchronous=FULL")
+    
+    def query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+    
+    def query_in(self, sql: str, values: Iterable[Any], params: Tuple = ()) -> List[Tuple]:
+        """Run sql, whose "{marks}" placeholder is an IN list, over values in batches"""
+        values = list(values)
+        result = []
+        for start in range(0, len(values), SQL_BATCH):
+            batch = values[start:start + SQL_BATCH]
+            result.extend(self.query(sql.format(marks=",".join("?" * len(batch))), tuple(batch) + params))
+        return result
+    
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+    
+    def close(self) -> None:
+        self._db.close()
+
+class _Generation:
+    """
+    The rows of a NumpyVectorStore visible at one manifest generation
+    
+    Only what a search needs for every row is held in memory: the live
+    mask and a code per row for each MASK_FIELDS value. Vectors are a
+    memory map of the epoch's file; IDs, texts and metadata are read from
+    the row table for the rows that are returned.
+    """
+    
+    def __init__(
+        self,
+        manifest: Dict[str, Any],
+        table: Optional[_RowTable],
+        vectors: np.ndarray,
+        live: np.ndarray,
+        codes: Dict[str, np.ndarray],
+        values: Dict[str, Dict[Any, int]],
+        hnsw: Any = None
+    ):
+        self.manifest = manifest
+        self.epoch = manifest.get("epoch", 0)
+        self.number = manifest.get("generation", 0)
+        self.rows = manifest.get("rows", 0)
+        self.table = table
+        self.vectors = vectors
+        self.live = live
+        self.live_count = int(live.sum())
+        self.codes = codes
+        self.values = values
+        
+        # Rows in the graph deleted after it was written are not marked in it
+        self.hnsw = hnsw
+        self.hnsw_rows = self.hnsw_live = self.hnsw_unmarked = 0
+        if hnsw is not None:
+            self.hnsw_rows = manifest["hnsw"]["rows"]
+            self.hnsw_live = manifest["hnsw"]["live"]
+            self.hnsw_unmarked = self.hnsw_live - int(live[:self.hnsw_rows].sum())
+        self.candidate_cache: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    
+    def field_mask(self, field: str, value: Any) -> np.ndarray:
+        if self.table is None:
+            return np.zeros(self.rows, dtype=bool)
+        if field in self.codes:
+            code = self.values[field].get(value)
+            if code is None:
+                return np.zeros(self.rows, dtype=bool)
+            return self.codes[field] == code
+        mask = np.zeros(self.rows, dtype=bool)
+        rows = self.table.query(
+            "SELECT row FROM chunks WHERE row < ? AND json_extract(metadata, ?) = ?",
+            (self.rows, f'$."{field}"', value)
+        )
+        mask[[row for row, in rows]] = True
+        return mask
+    
+    def candidates(self, where: Optional[Dict[str, Any]]) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """Mask and row numbers of the live chunks matching where (None, None for all rows)"""
+        if not where and self.live_count == self.rows:
+            return None, None
+        key = json.dumps(where or {}, sort_keys=True, default=str)
+        cached = self.candidate_cache.get(key)
+        if cached is None:
+            mask = self.live.copy()
+            for field, value in (where or {}).items():
+                if field.startswith("$") or isinstance(value, dict):
+                    raise ValueError(f"Only equality filters are supported, got {where!r}")
+                mask &= self.field_mask(field, value)
+            cached = (mask, np.flatnonzero(mask))
+            self.candidate_cache[key] = cached
+        return cached
+    
+    def fetch(self, rows: Iterable[int]) -> Dict[int, Tuple[str, str, Dict[str, Any]]]:
+        """Chunk ID, text and metadata of the given rows"""
+        found = self.table.query_in(
+            "SELECT row, chunk_id, text, metadata FROM chunks WHERE row IN ({marks})",
+            sorted({int(row) for row in rows})
+        )
+        return {row: (chunk_id, text, json.loads(metadata)) for row, chunk_id, text, metadata in found}
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store on memory-mapped float32 vectors
+    
+    The store lives in epochs of files in directory: vectors-<e>.f32
+    (normalized float32 rows, opened with mmap so uvicorn workers on one
+    machine share its pages through the OS page cache) and rows-<e>.sqlite
+    (chunk ID, text and metadata of each row, with the generation that
+    added and deleted it). A write appends its vectors and rows, marks
+    replaced rows deleted and atomically replaces manifest.json, which
+    holds the row count and generation every reader is allowed to see;
+    writers are serialized with a file lock. Once COMPACT_DEAD_RATIO of
+    the rows are dead, the live rows are copied into a new epoch.
+    
+    Readers check the manifest on every call and catch up incrementally:
+    they only read the rows added and deleted since the generation they
+    mapped, and keep no texts or metadata in memory.
+    
+    Search is an exact matrix product below hnsw_threshold live chunks and
+    an hnswlib graph (inner product) above it. The graph is extended in
+    persist(); rows written after it are searched exactly and merged in.
+    Filtered searches stay exact over the rows of a boolean mask.
+    """
+    
+    def __init__(
+        self,
+        directory: str,
+        hnsw_threshold: int = 10000,
+        hnsw_m: int = 16,
+        hnsw_ef_construction: int = 200,
+        hnsw_ef_search: int = 64
+    ):
+        self.directory = directory
+        self.hnsw_threshold = hnsw_threshold
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        os.makedirs(directory, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._writer_lock = threading.Lock()
+        self._manifest_stamp: Optional[Tuple[int, int]] = None
+        self._hnsw_warned = False
+        self._state = self._empty_state()
+        
+        self._refresh()
+    
+    @staticmethod
+    def _empty_state() -> _Generation:
+        return _Generation(
+            {},
+            None,
+            np.zeros((0, 0), dtype=np.float32),
+            np.zeros(0, dtype=bool),
+            {field: np.zeros(0, dtype=np.int32) for field in MASK_FIELDS},
+            {field: {} for field in MASK_FIELDS}
+        )
+    
+    def _path(self, kind: str, epoch: int, generation: Optional[int] = None) -> str:
+        if kind == "hnsw":
+            return os.path.join(self.directory, f"hnsw-{epoch}-{generation}.bin")
+        extension = {"vectors": "f32", "rows": "sqlite"}[kind]
+        return os.path.join(self.directory, f"{kind}-{epoch}.{extension}")
+    
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.directory, MANIFEST_FILENAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+    
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        self._write_file(os.path.join(self.directory, MANIFEST_FILENAME), lambda f: json.dump(manifest, f))
+        self._manifest_stamp = None
+    
+    def _map_vectors(self, epoch: int, rows: int, dim: int) -> np.ndarray:
+        if rows == 0:
+            return np.zeros((0, dim), dtype=np.float32)
+        return np.memmap(self._path("vectors", epoch), dtype=np.float32, mode="r", shape=(rows, dim))
+    
+    def _refresh(self) -> _Generation:
+        """Catch up with the generation in the manifest if another write replaced it"""
+        try:
+            stat = os.stat(os.path.join(self.directory, MANIFEST_FILENAME))
+            stamp = (stat.st_mtime_ns, stat.st_ino)
+        except FileNotFoundError:
+            return self._state
+        if stamp == self._manifest_stamp:
+            return self._state
+        
+        with self._lock:
+            for _ in range(3):
+                manifest = self._read_manifest()
+                if manifest is None or manifest == self._state.manifest:
+                    break
+                try:
+                    self._state = self._load(manifest, self._state)
+                    break
+                except FileNotFoundError:
+                    continue  # Compacted again while loading; read the new manifest
+            self._manifest_stamp = stamp
+        return self._state
+    
+    def _load(self, manifest: Dict[str, Any], previous: _Generation) -> _Generation:
+        """State for manifest, extending previous if it is an earlier generation of the same epoch"""
+        if manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector store format {manifest.get('format')!r} in {self.directory}")
+        epoch, generation, rows = manifest["epoch"], manifest["generation"], manifest["rows"]
+        
+        if previous.table is not None and previous.epoch == epoch and previous.number <= generation:
+            table, start, since = previous.table, previous.rows, previous.number
+            live, codes = previous.live, previous.codes
+            values = {field: dict(previous.values[field]) for field in MASK_FIELDS}
+        else:
+            table, start, since = _RowTable(self._path("rows", epoch)), 0, 0
+            empty = self._empty_state()
+            live, codes, values = empty.live, empty.codes, empty.values
+        
+        columns = ", ".join(f"json_extract(metadata, '$.\"{field}\"')" for field in MASK_FIELDS)
+        added = table.query(f"SELECT row, {columns} FROM chunks WHERE row >= ? AND row < ?", (start, rows))
+        new_codes = {field: np.full(rows - start, -1, dtype=np.int32) for field in MASK_FIELDS}
+        for row, *row_values in added:
+            for field, value in zip(MASK_FIELDS, row_values):
+                if value is not None:
+                    new_codes[field][row - start] = values[field].setdefault(value, len(values[field]))
+        live = np.concatenate([live, np.ones(rows - start, dtype=bool)])
+        codes = {field: np.concatenate([codes[field], new_codes[field]]) for field in MASK_FIELDS}
+        
+        deleted = table.query(
+            "SELECT row FROM chunks WHERE deleted_in > ? AND deleted_in <= ? AND row < ?",
+            (since, generation, rows)
+        )
+        live[[row for row, in deleted]] = False
+        
+        vectors = self._map_vectors(epoch, rows, manifest["dim"])
+        hnsw = None
+        info = manifest.get("hnsw")
+        if info and previous.hnsw is not None and previous.epoch == epoch and previous.manifest.get("hnsw") == info:
+            hnsw = previous.hnsw
+        elif info:
+            hnsw = self._load_hnsw(self._path("hnsw", epoch, info["generation"]), manifest["dim"], info["rows"])
+        return _Generation(manifest, table, vectors, live, codes, values, hnsw)
+    
+    def _load_hnsw(self, path: str, dim: int, rows: int) -> Any:
+        try:
+            import hnswlib
+        except ImportError:
+            if not self._hnsw_warned:
+                print("hnswlib is not installed; searching the numpy vector store exactly")
+                self._hnsw_warned = True
+            return None
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        hnsw = hnswlib.Index(space="ip", dim=dim)
+        hnsw.load_index(path, max_elements=rows)
+        hnsw.set_ef(self.hnsw_ef_search)
+        return hnsw
+    
+    @contextmanager
+    def _write_lock(self):
+        """Serialize writers within and across processes"""
+        with self._writer_lock, open(os.path.join(self.directory, "write.lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+    
+    def _new_epoch(self, epoch: int) -> _RowTable:
+        """Create empty files for epoch, removing leftovers of a write that crashed"""
+        for path in (self._path("vectors", epoch), self._path("rows", epoch)):
+            for leftover in (path, f"{path}-wal", f"{path}-shm"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        open(self._path("vectors", epoch), "wb").close()
+        return _RowTable(self._path("rows", epoch), create=True)
+    
+    def _update(
+        self,
+        delete_ids: List[str],
+        ids: List[str],
+        embeddings: List[List[float]],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        """Append the given chunks and mark delete_ids and replaced chunks deleted, as the next generation"""
+        with self._write_lock():
+            manifest = self._read_manifest() or {
+                "format": FORMAT_VERSION, "epoch": 0, "generation": 0, "dim": 0, "rows": 0, "live": 0, "hnsw": None
+            }
+            
+            # A chunk given twice keeps its last version
+            latest = {chunk_id: i for i, chunk_id in enumerate(ids)}
+            order = sorted(latest.values())
+            ids = [ids[i] for i in order]
+            new_vectors = np.asarray([embeddings[i] for i in order], dtype=np.float32)
+            dim = manifest["dim"]
+            if ids:
+                new_vectors = normalize_rows(new_vectors.reshape(len(ids), -1))
+                if manifest["rows"] and new_vectors.shape[1] != dim:
+                    raise ValueError(
+                        f"Embedding dimension {new_vectors.shape[1]} does not match the store's {dim}"
+                    )
+                dim = new_vectors.shape[1]
+            
+            epoch, rows = manifest["epoch"], manifest["rows"]
+            if epoch == 0:
+                if not ids:
+                    return
+                epoch = 1
+                table = self._new_epoch(epoch)
+            else:
+                table = _RowTable(self._path("rows", epoch))
+            
+            generation = manifest["generation"] + 1
+            try:
+                with table.transaction() as db:
+                    # Leftovers of a write that crashed before replacing the manifest
+                    db.execute("DELETE FROM chunks WHERE row >= ?", (rows,))
+                    db.execute("UPDATE chunks SET deleted_in = NULL WHERE deleted_in > ?", (manifest["generation"],))
+                    
+                    dead_rows = []
+                    replaced = list(set(delete_ids) | set(ids))
+                    for start in range(0, len(replaced), SQL_BATCH):
+                        batch = replaced[start:start + SQL_BATCH]
+                        dead_rows.extend(row for row, in db.execute(
+                            f"SELECT row FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))}) "
+                            "AND deleted_in IS NULL",
+                            batch
+                        ))
+                    if not ids and not dead_rows:
+                        return
+                    db.executemany("UPDATE chunks SET deleted_in = ? WHERE row = ?", [(generation, row) for row in dead_rows])
+                    db.executemany(
+                        "INSERT INTO chunks (row, chunk_id, text, metadata, added_in) VALUES (?, ?, ?, ?, ?)",
+                        [
+                            (rows + n, ids[n], texts[i], json.dumps(metadatas[i], ensure_ascii=False), generation)
+                            for n, i in enumerate(order)
+                        ]
+                    )
+                    
+                    # Vectors are durable before the rows that point at them are committed
+                    with open(self._path("vectors", epoch), "ab") as f:
+                        f.truncate(rows * dim * 4)
+                        f.write(new_vectors.tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+            finally:
+                table.close()
+            
+            manifest = {
+                **manifest,
+                "format": FORMAT_VERSION,
+                "epoch": epoch,
+                "generation": generation,
+                "dim": dim,
+                "rows": rows + len(ids),
+                "live": manifest["live"] - len(dead_rows) + len(ids)
+            }
+            compact = manifest["rows"] - manifest["live"] > COMPACT_DEAD_RATIO * manifest["rows"]
+            if compact:
+                manifest = self._compact(manifest)
+            self._write_manifest(manifest)
+            if compact:
+                self._remove_files_except(manifest)
+    
+    def _compact(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy the live rows of the manifest's epoch into the next epoch; returns its manifest"""
+        epoch, dim = manifest["epoch"] + 1, manifest["dim"]
+        old_vectors = self._map_vectors(manifest["epoch"], manifest["rows"], dim)
+        old_table = _RowTable(self._path("rows", manifest["epoch"]))
+        table = self._new_epoch(epoch)
+        copied, last = 0, -1
+        try:
+            with open(self._path("vectors", epoch), "ab") as f, table.transaction() as db:
+                while True:
+                    batch = old_table.query(
+                        "SELECT row, chunk_id, text, metadata FROM chunks "
+                        "WHERE row > ? AND row < ? AND deleted_in IS NULL ORDER BY row LIMIT ?",
+                        (last, manifest["rows"], COPY_BATCH)
+                    )
+                    if not batch:
+                        break
+                    f.write(np.ascontiguousarray(old_vectors[[row for row, *_ in batch]]).tobytes())
+                    db.executemany(
+                        "INSERT INTO chunks (row, chunk_id, text, metadata, added_in) VALUES (?, ?, ?, ?, ?)",
+                        [
+                            (copied + n, chunk_id, text, metadata, manifest["generation"])
+                            for n, (_, chunk_id, text, metadata) in enumerate(batch)
+                        ]
+                    )
+                    copied += len(batch)
+                    last = batch[-1][0]
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            old_table.close()
+            table.close()
+        # Row numbers changed, so the graph is rebuilt by the next persist()
+        return {**manifest, "epoch": epoch, "rows": copied, "live": copied, "hnsw": None}
+    
+    def _write_hnsw(self, manifest: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Extend or build the HNSW graph of the manifest's rows; returns its manifest entry"""
+        current = manifest.get("hnsw")
+        if manifest["live"] < self.hnsw_threshold:
+            return None
+        if current and current["generation"] == manifest["generation"]:
+            return current
+        try:
+            import hnswlib
+        except ImportError:
+            if not self._hnsw_warned:
+                print("hnswlib is not installed; searching the numpy vector store exactly")
+                self._hnsw_warned = True
+            return None
+        
+        epoch, generation, rows, dim = manifest["epoch"], manifest["generation"], manifest["rows"], manifest["dim"]
+        vectors = self._map_vectors(epoch, rows, dim)
+        table = _RowTable(self._path("rows", epoch))
+        try:
+            index = hnswlib.Index(space="ip", dim=dim)
+            if current:
+                # Labels are row numbers, which stay stable within an epoch
+                index.load_index(self._path("hnsw", epoch, current["generation"]), max_elements=rows)
+                for row, in table.query(
+                    "SELECT row FROM chunks WHERE row < ? AND deleted_in > ? AND deleted_in <= ?",
+                    (current["rows"], current["generation"], generation)
+                ):
+                    index.mark_deleted(row)
+                start = current["rows"]
+            else:
+                index.init_index(max_elements=rows, ef_construction=self.hnsw_ef_construction, M=self.hnsw_m)
+                start = 0
+            new_rows = np.asarray([row for row, in table.query(
+                "SELECT row FROM chunks WHERE row >= ? AND row < ? AND (deleted_in IS NULL OR deleted_in > ?) ORDER BY row",
+                (start, rows, generation)
+            )], dtype=np.int64)
+        finally:
+            table.close()
+        for batch_start in range(0, len(new_rows), COPY_BATCH):
+            batch = new_rows[batch_start:batch_start + COPY_BATCH]
+            index.add_items(vectors[batch], batch)
+        
+        path = self._path("hnsw", epoch, generation)
+        index.save_index(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        return {"generation": generation, "rows": rows, "live": manifest["live"]}
+    
+    def _write_file(self, path: str, write, binary: bool = False) -> None:
+        """Write a file durably under a temporary name and move it into place"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb" if binary else "w", **({} if binary else {"encoding": "utf-8"})) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    
+    def _remove_files_except(self, manifest: Dict[str, Any]) -> None:
+        """Delete files of other epochs and graphs (processes that still use them keep their pages)"""
+        epoch = manifest["epoch"]
+        keep = {
+            os.path.basename(self._path("vectors", epoch)),
+            *(os.path.basename(self._path("rows", epoch)) + suffix for suffix in ("", "-wal", "-shm"))
+        }
+        if manifest.get("hnsw"):
+            keep.add(os.path.basename(self._path("hnsw", epoch, manifest["hnsw"]["generation"])))
+        for filename in os.listdir(self.directory):
+            if filename.split("-")[0] in ("vectors", "rows", "hnsw") and filename not in keep:
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+    
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        self._update([], ids, embeddings, texts, metadatas)
+    
+    def delete(self, ids: List[str]) -> None:
+        self._update(ids, [], [], [], [])
+    
+    def persist(self) -> None:
+        """Bring the HNSW graph up to date with the rows written since it was built"""
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if manifest is None or manifest.get("format") != FORMAT_VERSION:
+                return
+            hnsw = self._write_hnsw(manifest)
+            if hnsw != manifest.get("hnsw"):
+                manifest = {**manifest, "hnsw": hnsw}
+                self._write_manifest(manifest)
+                self._remove_files_except(manifest)
+    
+    def get_ids(self, where: Optional[Dict[str, Any]] = None) -> List[str]:
+        state = self._refresh()
+        _, rows = state.candidates(where)
+        if rows is None:
+            rows = np.arange(state.rows)
+        chunks = state.fetch(rows) if len(rows) else {}
+        return [chunks[row][0] for row in rows.tolist()]
+    
+    def get(self, ids: List[str], include_embeddings: bool = False) -> Dict[str, Dict[str, Any]]:
+        state = self._refresh()
+        if not ids or state.table is None:
+            return {}
+        found = state.table.query_in(
+            "SELECT row, chunk_id, text, metadata FROM chunks WHERE chunk_id IN ({marks}) AND row < ?",
+            ids,
+            (state.rows,)
+        )
+        chunks = {}
+        for row, chunk_id, text, metadata in found:
+            if not state.live[row]:
+                continue
+            chunks[chunk_id] = {"text": text, "metadata": json.loads(metadata)}
+            if include_embeddings:
+                chunks[chunk_id]["embedding"] = state.vectors[row].tolist()
+        return chunks
+    
+    def _search_exact(
+        self,
+        state: _Generation,
+        queries: np.ndarray,
+        k: int,
+        mask: Optional[np.ndarray],
+        rows: Optional[np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if rows is not None and len(rows) * 2 < state.rows:
+            # Few candidates: gather them instead of scoring every row
+            scores = queries @ state.vectors[rows].T
+        else:
+            scores = queries @ state.vectors.T
+            if mask is not None:
+                scores[:, ~mask] = -np.inf
+            rows = None
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return (top if rows is None else rows[top]), top_scores
+    
+    def _search_hnsw(self, state: _Generation, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Search the graph, skipping rows deleted since it was written, and the rows appended after it exactly"""
+        fetch = min(k + state.hnsw_unmarked, state.hnsw_live)
+        labels, distances = state.hnsw.knn_query(queries, k=fetch)
+        labels, scores = labels.astype(np.int64), 1 - distances
+        
+        tail = np.flatnonzero(state.live[state.hnsw_rows:]) + state.hnsw_rows
+        if len(tail):
+            labels = np.concatenate([labels, np.broadcast_to(tail, (len(queries), len(tail)))], axis=1)
+            scores = np.concatenate([scores, queries @ state.vectors[tail].T], axis=1)
+        scores = np.where(state.live[labels], scores, -np.inf)
+        order = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(labels, order, axis=1), np.take_along_axis(scores, order, axis=1)
+    
+    def query(
+        self,
+        embeddings: List[List[float]],
+        k: int = 3,
+        where: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False
+    ) -> List[List[Dict[str, Any]]]:
+        if not embeddings:
+            return []
+        state = self._refresh()
+        mask, rows = state.candidates(where)
+        k = min(k, state.live_count if rows is None else len(rows))
+        if k <= 0:
+            return [[] for _ in embeddings]
+        
+        queries = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        top = None
+        if state.hnsw is not None and not where:
+            try:
+                top, top_scores = self._search_hnsw(state, queries, k)
+            except RuntimeError:
+                pass  # Too few reachable elements left in the graph; search exactly
+        if top is None:
+            top, top_scores = self._search_exact(state, queries, k, mask, rows)
+        
+        chunks = state.fetch(top.ravel())
+        results = []
+        for query_rows, query_scores in zip(top, top_scores):
+            hits = []
+            for row, score in zip(query_rows.tolist(), query_scores):
+                if not np.isfinite(score):
+                    continue
+                _, text, metadata = chunks[row]
+                hit = {"text": text, "metadata": metadata, "score": float(score)}
+                if include_embeddings:
+                    hit["embedding"] = state.vectors[row].tolist()
+                hits.append(hit)
+            results.append(hits)
+        return results
+    
+    def count(self) -> int:
+        return self._refresh().live_count
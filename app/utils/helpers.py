@@ -0,0 +1,36 @@
+import os
+import json
+import hashlib
+from typing import Any, Dict
+
+MANIFEST_FILENAME = "manifest.json"
+
+def format_sse(event: str, data: Any) -> str:
+    """Format a server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def format_ndjson(data: Any) -> str:
+    """Format one newline-delimited JSON record"""
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+def sha256_file(path: str, block_size: int = 1 << 20) -> str:
+    """Compute the SHA-256 of a file without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def make_chunk_id(document_id: str, chunk_index: int, text: str) -> str:
+    """Stable chunk ID from document ID, chunk position and content hash"""
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    return f"{document_id}_chunk_{chunk_index}_{content_hash}"
+
+
+def load_manifest(processed_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Load the ingestion manifest (content hash, chunking params and chunk count per file)"""
+    manifest_path = os.path.join(processed_dir, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
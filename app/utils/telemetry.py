@@ -0,0 +1,147 @@
+import json
+import time
+import random
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Any, Optional, Tuple, Iterator
+
+# Seconds; spans range from sub-millisecond prompt builds to multi-second LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+class Histogram:
+    """Prometheus-style histogram with labels, safe to observe from any thread"""
+    
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+    
+    def render(self) -> List[str]:
+        """Lines of the Prometheus text exposition format"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: {**value, "counts": list(value["counts"])} for key, value in self._series.items()}
+        for key, value in sorted(series.items()):
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), value["counts"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {value['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {value['count']}")
+        return lines
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each stage of answering a question",
+    ("stage",)
+)
+LLM_TOKENS = Histogram(
+    "rag_llm_tokens",
+    "Prompt and completion tokens per LLM call",
+    ("kind",),
+    buckets=TOKEN_BUCKETS
+)
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = STAGE_SECONDS.render() + LLM_TOKENS.render()
+    return "\n".join(lines) + "\n"
+
+class Trace:
+    """Timing spans of one request, summed by name"""
+    
+    def __init__(self):
+        self.spans: Dict[str, float] = {}
+    
+    def add(self, name: str, seconds: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+    
+    def header(self) -> str:
+        """Spans in Server-Timing syntax, in milliseconds"""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.spans.items())
+
+# The trace of the request being handled; set by TimingMiddleware
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+def record_span(name: str, seconds: float) -> None:
+    """Add a span to the stage histogram and to the current request's trace"""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the enclosed block as a stage span"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+def record_llm_tokens(prompt_tokens: int, completion_tokens: int) -> None:
+    LLM_TOKENS.observe(prompt_tokens, kind="prompt")
+    LLM_TOKENS.observe(completion_tokens, kind="completion")
+
+class TimingMiddleware:
+    """
+    ASGI middleware that traces each HTTP request
+    
+    Spans recorded while the request is handled are returned in an
+    X-Timing header (Server-Timing syntax). Streaming responses send their
+    headers before the body, so their header only covers the spans up to
+    the first byte; the histograms still receive every span.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        trace = Trace()
+        token = current_trace.set(trace)
+        
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and trace.spans:
+                headers = list(message.get("headers", []))
+                headers.append((b"x-timing", trace.header().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_trace.reset(token)
+
+def log_sampled(event: str, sample_rate: float, **fields: Any) -> None:
+    """Print a JSON log line for a sample_rate fraction of calls"""
+    if sample_rate <= 0 or (sample_rate < 1 and random.random() >= sample_rate):
+        return
+    print(json.dumps({"event": event, "ts": round(time.time(), 3), **fields}, ensure_ascii=False, default=str))
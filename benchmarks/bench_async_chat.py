@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark /chat throughput with N concurrent clients against the fake LLM backend
+
+Compares the old blocking route (sync generate_response inside an async
+handler) with the async agenerate_response path, and measures /health
+latency while the chat load is running.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, Any
+
+import httpx
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from common import StubEmbeddingsManager, summarize
+from app.rag.retriever import DocumentRetriever
+from app.rag.rag_pipeline import RAGPipeline
+from app.rag.llm import FakeChatModel
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent /chat throughput")
+    parser.add_argument("--clients", type=str, default="1,8,32", help="Comma-separated client counts")
+    parser.add_argument("--requests_per_client", type=int, default=5, help="Requests sent by each client")
+    parser.add_argument("--llm_latency_ms", type=float, default=300, help="Fake LLM latency")
+    parser.add_argument("--encode_ms", type=float, default=20, help="Simulated query encoding time")
+    parser.add_argument("--search_ms", type=float, default=5, help="Simulated vector search time")
+    parser.add_argument("--encode_workers", type=int, default=2, help="Embeddings executor size")
+    parser.add_argument("--json", type=str, help="Write results to this JSON file")
+    return parser.parse_args()
+
+class ChatRequest(BaseModel):
+    message: str
+
+def build_app(pipeline: RAGPipeline) -> FastAPI:
+    app = FastAPI()
+    
+    @app.post("/chat-sync")
+    async def chat_sync(request: ChatRequest):
+        return pipeline.generate_response(query=request.message)
+    
+    @app.post("/chat")
+    async def chat(request: ChatRequest):
+        return await pipeline.agenerate_response(query=request.message)
+    
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+    
+    return app
+
+async def run_load(app: FastAPI, route: str, clients: int, requests_per_client: int) -> Dict[str, Any]:
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    health_latencies = []
+    done = asyncio.Event()
+    
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def chat_client(i: int):
+            for j in range(requests_per_client):
+                start = time.perf_counter()
+                response = await client.post(route, json={"message": f"Câu hỏi {i}-{j}"})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+        
+        async def health_probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/health")
+                health_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.05)
+        
+        probe = asyncio.create_task(health_probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(chat_client(i) for i in range(clients)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe
+    
+    return {
+        "route": route,
+        "clients": clients,
+        "requests": len(latencies),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed,
+        "chat": summarize(latencies),
+        "health": summarize(health_latencies),
+    }
+
+async def main():
+    args = parse_args()
+    
+    embeddings_manager = StubEmbeddingsManager(
+        encode_ms=args.encode_ms,
+        search_ms=args.search_ms,
+        encode_workers=args.encode_workers
+    )
+    pipeline = RAGPipeline(
+        retriever=DocumentRetriever(embeddings_manager),
+        llm=FakeChatModel(latency_ms=args.llm_latency_ms, tokens_per_sec=0)
+    )
+    app = build_app(pipeline)
+    
+    results = []
+    print(f"{'route':<12}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'health p95 ms':>16}")
+    for clients in [int(c) for c in args.clients.split(",")]:
+        for route in ("/chat-sync", "/chat"):
+            result = await run_load(app, route, clients, args.requests_per_client)
+            results.append(result)
+            print(
+                f"{route:<12}{clients:>8}{result['throughput_rps']:>10.1f}"
+                f"{result['chat']['p50_ms']:>10.0f}{result['chat']['p95_ms']:>10.0f}"
+                f"{result['health']['p95_ms']:>16.0f}"
+            )
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved results to {args.json}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
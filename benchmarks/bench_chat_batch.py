@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark POST /chat/batch against looping POST /chat one question at a time
+
+Runs the real API routes with the RAG pipeline dependency overridden by a
+pipeline over stubbed encoding and search and the fake LLM backend, and
+reports questions/sec for the sequential loop and for the batch endpoint
+at several LLM concurrency limits.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, Any, List
+
+import httpx
+
+from common import StubEmbeddingsManager
+from app.main import app
+from app.api.dependencies import get_rag_pipeline
+from app.rag.retriever import DocumentRetriever
+from app.rag.rag_pipeline import RAGPipeline
+from app.rag.llm import FakeChatModel
+
+API = "/api/v1"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark /chat/batch against a sequential /chat loop")
+    parser.add_argument("--questions", type=int, default=100, help="Questions per run")
+    parser.add_argument("--concurrency", type=str, default="1,8,32", help="Comma-separated LLM concurrency limits")
+    parser.add_argument("--llm_latency_ms", type=float, default=300, help="Fake LLM latency")
+    parser.add_argument("--failure_rate", type=float, default=0.0, help="Fraction of LLM calls that fail and are retried")
+    parser.add_argument("--encode_ms", type=float, default=20, help="Simulated query encoding time")
+    parser.add_argument("--search_ms", type=float, default=5, help="Simulated vector search time")
+    parser.add_argument("--json", type=str, help="Write results to this JSON file")
+    return parser.parse_args()
+
+def build_pipeline(args, concurrency: int) -> RAGPipeline:
+    embeddings_manager = StubEmbeddingsManager(encode_ms=args.encode_ms, search_ms=args.search_ms)
+    pipeline = RAGPipeline(
+        retriever=DocumentRetriever(embeddings_manager),
+        llm_concurrency=concurrency,
+        llm_retry_backoff=0.05,
+        llm=FakeChatModel(latency_ms=args.llm_latency_ms, tokens_per_sec=0, failure_rate=args.failure_rate)
+    )
+    return pipeline
+
+async def run_sequential(client: httpx.AsyncClient, questions: List[str]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    errors = 0
+    for question in questions:
+        response = await client.post(f"{API}/chat", json={"message": question})
+        errors += response.status_code != 200
+    elapsed = time.perf_counter() - start
+    return {"mode": "sequential", "elapsed_s": elapsed, "qps": len(questions) / elapsed, "errors": errors}
+
+async def run_batch(client: httpx.AsyncClient, questions: List[str], concurrency: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    first_result_s = None
+    results = []
+    async with client.stream(
+        "POST",
+        f"{API}/chat/batch",
+        json={"questions": [{"message": question} for question in questions]}
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            if first_result_s is None:
+                first_result_s = time.perf_counter() - start
+            results.append(json.loads(line))
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": "batch",
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "qps": len(questions) / elapsed,
+        "first_result_s": first_result_s,
+        "errors": sum("error" in result for result in results),
+    }
+
+async def main():
+    args = parse_args()
+    questions = [f"Điều kiện xét tốt nghiệp số {i} là gì?" for i in range(args.questions)]
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        pipeline = build_pipeline(args, concurrency=1)
+        app.dependency_overrides[get_rag_pipeline] = lambda: pipeline
+        results.append(await run_sequential(client, questions))
+        
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            # Fresh pipeline so the semaphore matches the limit under test
+            pipeline = build_pipeline(args, concurrency=concurrency)
+            app.dependency_overrides[get_rag_pipeline] = lambda: pipeline
+            results.append(await run_batch(client, questions, concurrency))
+    
+    app.dependency_overrides.clear()
+    
+    print(f"{'mode':<12}{'concurrency':>12}{'q/s':>10}{'elapsed s':>12}{'errors':>8}")
+    for result in results:
+        print(
+            f"{result['mode']:<12}{result.get('concurrency', 1):>12}{result['qps']:>10.1f}"
+            f"{result['elapsed_s']:>12.2f}{result['errors']:>8}"
+        )
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved results to {args.json}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Offline retrieval-quality benchmark: recursive vs regulation-aware chunking
+
+Chunks a synthetic regulation with both strategies, retrieves with a simple
+TF-IDF scorer (no embedding model or network needed) and reports hit rate,
+MRR and the context size sent to the LLM at several k.
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import tempfile
+from collections import Counter
+from typing import Dict, Any, List
+
+from common import generate_regulation, regulation_text
+from app.rag.document_processor import DocumentProcessor
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare chunking strategies on retrieval quality")
+    parser.add_argument("--chapters", type=int, default=6, help="Chapters in the synthetic regulation")
+    parser.add_argument("--articles_per_chapter", type=int, default=10, help="Articles per chapter")
+    parser.add_argument("--questions", type=int, default=200, help="Number of generated questions")
+    parser.add_argument("--chunk_size", type=int, default=1000, help="Chunk size")
+    parser.add_argument("--chunk_overlap", type=int, default=200, help="Chunk overlap")
+    parser.add_argument("--k", type=str, default="1,3,5", help="Comma-separated k values")
+    parser.add_argument("--json", type=str, help="Write results to this JSON file")
+    return parser.parse_args()
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+_encoding = None
+
+def count_tokens(text: str) -> int:
+    """Count cl100k tokens, or estimate at 4 chars/token if tiktoken is unavailable"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(text) // 4
+
+class TfidfScorer:
+    """Minimal TF-IDF cosine scorer over chunk texts"""
+    
+    def __init__(self, texts: List[str]):
+        self.vectors = []
+        doc_freq = Counter()
+        counts = [Counter(tokenize(text)) for text in texts]
+        for count in counts:
+            doc_freq.update(count.keys())
+        self.idf = {term: math.log(len(texts) / df) + 1 for term, df in doc_freq.items()}
+        for count in counts:
+            self.vectors.append(self._weigh(count))
+    
+    def _weigh(self, count: Counter) -> Dict[str, float]:
+        vector = {term: tf * self.idf.get(term, 0.0) for term, tf in count.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        return {term: w / norm for term, w in vector.items()}
+    
+    def rank(self, query: str) -> List[int]:
+        q = self._weigh(Counter(tokenize(query)))
+        scores = [sum(w * vector.get(term, 0.0) for term, w in q.items()) for vector in self.vectors]
+        return sorted(range(len(scores)), key=lambda i: -scores[i])
+
+def make_questions(articles: List[Dict[str, Any]], n: int, seed: int = 7) -> List[Dict[str, Any]]:
+    """Build questions from a clause's first phrase; the answer is that phrase"""
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(n):
+        article = rng.choice(articles)
+        clause = rng.choice(article["clauses"])
+        answer = clause.split(". ", 1)[1].split(",")[0]
+        words = answer.split()
+        kept = [w for w in words if any(ch.isdigit() for ch in w) or rng.random() < 0.7]
+        questions.append({
+            "question": f"{article['topic']}: {' '.join(kept)}?",
+            "answer": answer,
+            "article": article["number"],
+        })
+    return questions
+
+def evaluate(chunks: List[Dict[str, Any]], questions: List[Dict[str, Any]], ks: List[int]) -> Dict[str, Any]:
+    scorer = TfidfScorer([chunk["text"] for chunk in chunks])
+    max_k = max(ks)
+    hits = {k: 0 for k in ks}
+    context_tokens = {k: 0 for k in ks}
+    reciprocal_ranks = 0.0
+    
+    for question in questions:
+        ranking = scorer.rank(question["question"])[:max_k]
+        first_hit = next(
+            (rank for rank, i in enumerate(ranking, 1) if question["answer"] in chunks[i]["text"]),
+            None
+        )
+        if first_hit:
+            reciprocal_ranks += 1 / first_hit
+        for k in ks:
+            if first_hit and first_hit <= k:
+                hits[k] += 1
+            context_tokens[k] += sum(count_tokens(chunks[i]["text"]) for i in ranking[:k])
+    
+    n = len(questions)
+    return {
+        "chunks": len(chunks),
+        "mean_chunk_chars": sum(len(chunk["text"]) for chunk in chunks) / len(chunks),
+        f"mrr@{max_k}": reciprocal_ranks / n,
+        "recall": {f"@{k}": hits[k] / n for k in ks},
+        "mean_context_tokens": {f"@{k}": context_tokens[k] / n for k in ks},
+    }
+
+def main():
+    args = parse_args()
+    ks = [int(k) for k in args.k.split(",")]
+    
+    articles = generate_regulation(
+        chapters=args.chapters,
+        articles_per_chapter=args.articles_per_chapter,
+        clauses_per_article=6
+    )
+    text = regulation_text(articles)
+    # Split into page-sized blocks on line boundaries, as PDF extraction would
+    lines = text.splitlines(keepends=True)
+    pages = [(i // 40 + 1, "".join(lines[i:i + 40])) for i in range(0, len(lines), 40)]
+    questions = make_questions(articles, args.questions)
+    
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for strategy in ("recursive", "regulation"):
+            processor = DocumentProcessor(
+                chunk_size=args.chunk_size,
+                chunk_overlap=args.chunk_overlap,
+                raw_dir=tmp_dir,
+                processed_dir=tmp_dir,
+                chunking_strategy=strategy
+            )
+            chunks = list(processor.iter_chunks(pages, {"source": "synthetic.pdf"}))
+            results[strategy] = evaluate(chunks, questions, ks)
+    
+    header = f"{'strategy':<12}{'chunks':>8}" + "".join(f"{'R@' + str(k):>8}{'tok@' + str(k):>9}" for k in ks)
+    print(header)
+    for strategy, result in results.items():
+        row = f"{strategy:<12}{result['chunks']:>8}"
+        for k in ks:
+            row += f"{result['recall'][f'@{k}']:>8.2f}{result['mean_context_tokens'][f'@{k}']:>9.0f}"
+        print(row)
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 Saved results to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark embedding backends: load time, chunk throughput and query latency
+
+Each backend runs in a fresh spawned process, so its load time includes
+importing its runtime (torch for sentence-transformers, onnxruntime for
+the exported model) and backends do not share threads or caches. Texts
+are synthetic regulation clauses; queries are encoded one at a time, as
+the API does on a query cache miss.
+"""
+
+import argparse
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List
+
+from common import generate_regulation, summarize
+from app.config import settings
+
+BACKENDS = {
+    "torch": ("torch", {}),
+    "onnx": ("onnx", {"quantized": False}),
+    "onnx-int8": ("onnx", {"quantized": True}),
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark torch and ONNX embedding backends")
+    parser.add_argument("--backends", type=str, default="torch,onnx,onnx-int8", help=f"Comma-separated, from {list(BACKENDS)}")
+    parser.add_argument("--model", type=str, default=settings.EMBEDDING_MODEL_NAME, help="Embedding model")
+    parser.add_argument("--onnx_model_dir", type=str, default=settings.ONNX_MODEL_DIR, help="Exported ONNX model directory")
+    parser.add_argument("--texts", type=int, default=512, help="Chunk texts to encode")
+    parser.add_argument("--queries", type=int, default=100, help="Single queries to encode")
+    parser.add_argument("--batch_size", type=int, default=32, help="Texts per model call")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads (0 = runtime default)")
+    parser.add_argument("--json", type=str, help="Write results to this JSON file")
+    return parser.parse_args()
+
+def sample_texts(count: int) -> List[str]:
+    articles = generate_regulation(chapters=max(count // 40, 1), articles_per_chapter=10, clauses_per_article=4)
+    clauses = [f"Điều {a['number']}. {a['topic']}\n{clause}" for a in articles for clause in a["clauses"]]
+    return clauses[:count]
+
+def run_backend(
+    name: str,
+    model_name: str,
+    onnx_model_dir: str,
+    texts: List[str],
+    queries: List[str],
+    batch_size: int,
+    threads: int
+) -> Dict[str, Any]:
+    """Load one backend and measure it; runs in its own process"""
+    start = time.perf_counter()
+    if threads:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    from app.rag.embeddings import create_embedding_model
+
+    backend, options = BACKENDS[name]
+    if backend == "onnx":
+        options = {**options, "model_dir": onnx_model_dir, "threads": threads, "batch_size": batch_size}
+    model = create_embedding_model(model_name, backend, **options)
+    load_s = time.perf_counter() - start
+
+    # Warm up so one-time allocations are not measured
+    model.embed_documents(texts[:batch_size])
+
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        model.embed_documents(texts[i:i + batch_size])
+    encode_s = time.perf_counter() - start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        model.embed_documents([query])
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "backend": name,
+        "load_s": load_s,
+        "texts": len(texts),
+        "sentences_per_sec": len(texts) / encode_s,
+        "query": summarize(latencies),
+    }
+
+def main():
+    args = parse_args()
+    texts = sample_texts(args.texts)
+    queries = [f"{text.splitlines()[0]} quy định những gì?" for text in texts[:args.queries]]
+
+    results = []
+    print(f"{'backend':<11}{'load s':>8}{'sent/s':>9}{'query p50 ms':>14}{'query p95 ms':>14}")
+    for name in args.backends.split(","):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                result = pool.submit(
+                    run_backend, name, args.model, args.onnx_model_dir,
+                    texts, queries, args.batch_size, args.threads
+                ).result()
+            except Exception as e:
+                print(f"{name:<11} failed: {e}")
+                continue
+        results.append(result)
+        print(
+            f"{name:<11}{result['load_s']:>8.1f}{result['sentences_per_sec']:>9.1f}"
+            f"{result['query']['p50_ms']:>14.1f}{result['query']['p95_ms']:>14.1f}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved results to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of ingestion, retrieval and /chat on a synthetic corpus
+
+Generates synthetic Vietnamese regulation PDFs and ingests them in steps up
+to each corpus size through DocumentProcessor and EmbeddingsManager (the real
+embedding model and a temporary Chroma store). At every size it measures
+retrieval latency for each k, and at the largest size it drives the real
+/chat route with concurrent clients against the fake LLM backend. All
+results, with the run configuration, are written as one JSON document so
+runs before and after a change can be diffed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from typing import Dict, Any, List
+
+import httpx
+
+from common import generate_regulation, regulation_text, write_pdf, summarize
+from app.config import settings
+from app.rag.document_processor import DocumentProcessor
+from app.rag.embeddings import EmbeddingsManager
+from app.rag.retriever import DocumentRetriever
+from app.rag.rag_pipeline import RAGPipeline
+from app.rag.llm import FakeChatModel
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and /chat end to end")
+    parser.add_argument("--sizes", type=str, default="5,20", help="Comma-separated corpus sizes in documents")
+    parser.add_argument("--pages_per_doc", type=int, default=20, help="Approximate pages per generated PDF")
+    parser.add_argument("--k", type=str, default="1,3,5,10", help="Comma-separated k values for retrieval")
+    parser.add_argument("--queries", type=int, default=200, help="Retrieval queries per corpus size and k")
+    parser.add_argument("--clients", type=str, default="1,8,32", help="Comma-separated /chat client counts")
+    parser.add_argument("--requests_per_client", type=int, default=5, help="/chat requests sent by each client")
+    parser.add_argument("--llm_latency_ms", type=float, default=300, help="Fake LLM latency")
+    parser.add_argument("--embedding_model", type=str, default=settings.EMBEDDING_MODEL_NAME, help="Embedding model")
+    parser.add_argument("--batch_size", type=int, default=settings.EMBED_BATCH_SIZE, help="Embedding batch size")
+    parser.add_argument("--vector_store", type=str, default=settings.VECTOR_STORE_BACKEND, help="Vector store backend (chroma or numpy)")
+    parser.add_argument("--chunk_size", type=int, default=settings.CHUNK_SIZE, help="Chunk size")
+    parser.add_argument("--chunk_overlap", type=int, default=settings.CHUNK_OVERLAP, help="Chunk overlap")
+    parser.add_argument("--chunking_strategy", type=str, default=settings.CHUNKING_STRATEGY, help="Chunking strategy")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the corpus and the queries")
+    parser.add_argument("--json", type=str, default="bench_end_to_end.json", help="Write results to this JSON file")
+    return parser.parse_args()
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def generate_corpus(raw_dir: str, documents: int, pages_per_doc: int, seed: int) -> List[Dict[str, Any]]:
+    """Write one synthetic regulation PDF per document and return their filenames, pages and articles"""
+    corpus = []
+    for i in range(documents):
+        # Roughly two generated articles per page at the default PDF layout
+        articles = generate_regulation(
+            chapters=max(pages_per_doc // 10, 1),
+            articles_per_chapter=20,
+            clauses_per_article=6,
+            seed=seed + i
+        )
+        filename = f"quy_che_{i:04d}.pdf"
+        pages = write_pdf(os.path.join(raw_dir, filename), regulation_text(articles))
+        corpus.append({"filename": filename, "pages": pages, "articles": articles})
+    return corpus
+
+def make_queries(corpus: List[Dict[str, Any]], count: int, rng: random.Random) -> List[str]:
+    """Questions about random articles of the ingested documents"""
+    queries = []
+    for _ in range(count):
+        article = rng.choice(rng.choice(corpus)["articles"])
+        clause = rng.choice(article["clauses"]).split(", ")[0]
+        queries.append(f"{article['topic']}: {clause[3:].lower()} là thế nào?")
+    return queries
+
+def ingest(
+    processor: DocumentProcessor,
+    embeddings_manager: EmbeddingsManager,
+    documents: List[Dict[str, Any]],
+    batch_size: int
+) -> Dict[str, Any]:
+    """Extract, chunk and embed documents, timing each phase"""
+    start = time.perf_counter()
+    chunks = [chunk for doc in documents for chunk in processor.process_pdf(doc["filename"])]
+    extracted = time.perf_counter()
+    embeddings_manager.upsert_documents(chunks, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    
+    pages = sum(doc["pages"] for doc in documents)
+    return {
+        "documents": len(documents),
+        "pages": pages,
+        "chunks": len(chunks),
+        "extract_s": extracted - start,
+        "embed_s": elapsed - (extracted - start),
+        "elapsed_s": elapsed,
+        "pages_per_sec": pages / elapsed,
+        "chunks_per_sec": len(chunks) / elapsed,
+    }
+
+def measure_retrieval(
+    retriever: DocumentRetriever,
+    queries: List[str],
+    k_values: List[int]
+) -> List[Dict[str, Any]]:
+    """Latency of query encoding, and of search for each k with precomputed embeddings"""
+    embeddings_manager = retriever.embeddings_manager
+    embed_latencies = []
+    query_embeddings = []
+    for query in queries:
+        start = time.perf_counter()
+        query_embeddings.append(embeddings_manager.encode_queries([query])[0])
+        embed_latencies.append(time.perf_counter() - start)
+    
+    results = []
+    for k in k_values:
+        latencies = []
+        for query, query_embedding in zip(queries, query_embeddings):
+            start = time.perf_counter()
+            retriever.retrieve_documents(query, k=k, query_embedding=query_embedding)
+            latencies.append(time.perf_counter() - start)
+        results.append({"k": k, "embed": summarize(embed_latencies), "search": summarize(latencies)})
+    return results
+
+async def measure_chat(
+    client: httpx.AsyncClient,
+    queries: List[str],
+    clients: int,
+    requests_per_client: int
+) -> Dict[str, Any]:
+    """Throughput and latency of the /chat route with concurrent clients"""
+    route = f"{settings.API_PREFIX}{settings.API_V1_STR}/chat"
+    latencies = []
+    
+    async def chat_client(i: int):
+        for j in range(requests_per_client):
+            query = queries[(i * requests_per_client + j) % len(queries)]
+            start = time.perf_counter()
+            response = await client.post(route, json={"message": query})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(chat_client(i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed,
+        "latency": summarize(latencies),
+    }
+
+async def run_chat_load(
+    pipeline: RAGPipeline,
+    queries: List[str],
+    client_counts: List[int],
+    requests_per_client: int
+) -> List[Dict[str, Any]]:
+    """Serve the real API app with pipeline injected and load /chat at each client count"""
+    from app.main import app
+    from app.api.dependencies import get_rag_pipeline
+    
+    app.dependency_overrides[get_rag_pipeline] = lambda: pipeline
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for clients in client_counts:
+                results.append(await measure_chat(client, queries, clients, requests_per_client))
+    finally:
+        app.dependency_overrides.clear()
+    return results
+
+def main():
+    args = parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    k_values = [int(k) for k in args.k.split(",")]
+    rng = random.Random(args.seed)
+    
+    results: Dict[str, Any] = {
+        "config": vars(args),
+        "environment": {
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "ingestion": [],
+        "retrieval": [],
+        "chat": [],
+    }
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = os.path.join(tmp_dir, "raw")
+        os.makedirs(raw_dir)
+        corpus = generate_corpus(raw_dir, sizes[-1], args.pages_per_doc, args.seed)
+        print(f"📄 Generated {len(corpus)} synthetic PDFs, {sum(doc['pages'] for doc in corpus)} pages")
+        
+        processor = DocumentProcessor(
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            raw_dir=raw_dir,
+            processed_dir=os.path.join(tmp_dir, "processed"),
+            chunking_strategy=args.chunking_strategy
+        )
+        embeddings_manager = EmbeddingsManager(
+            embedding_model_name=args.embedding_model,
+            vector_store_path=os.path.join(tmp_dir, "vectorstore"),
+            vector_store_backend=args.vector_store,
+            vector_store_options=settings.vector_store_options if args.vector_store == "numpy" else {}
+        )
+        retriever = DocumentRetriever(embeddings_manager)
+        
+        print(f"\n{'docs':>6}{'pages':>8}{'chunks':>8}{'pages/s':>10}{'chunks/s':>10}")
+        ingested = 0
+        for size in sizes:
+            step = ingest(processor, embeddings_manager, corpus[ingested:size], args.batch_size)
+            ingested = size
+            results["ingestion"].append({"corpus_documents": size, **step})
+            print(f"{size:>6}{step['pages']:>8}{step['chunks']:>8}{step['pages_per_sec']:>10.1f}{step['chunks_per_sec']:>10.1f}")
+            
+            queries = make_queries(corpus[:size], args.queries, rng)
+            for result in measure_retrieval(retriever, queries, k_values):
+                results["retrieval"].append({"corpus_documents": size, **result})
+        
+        print(f"\n{'docs':>6}{'k':>4}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for result in results["retrieval"]:
+            search = result["search"]
+            print(
+                f"{result['corpus_documents']:>6}{result['k']:>4}"
+                f"{search['p50_ms']:>10.2f}{search['p95_ms']:>10.2f}{search['p99_ms']:>10.2f}"
+            )
+        
+        pipeline = RAGPipeline(
+            retriever=retriever,
+            llm=FakeChatModel(latency_ms=args.llm_latency_ms, tokens_per_sec=0)
+        )
+        queries = make_queries(corpus, args.queries, rng)
+        print(f"\n{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        client_counts = [int(c) for c in args.clients.split(",")]
+        for result in asyncio.run(run_chat_load(pipeline, queries, client_counts, args.requests_per_client)):
+            results["chat"].append({"corpus_documents": sizes[-1], **result})
+            latency = result["latency"]
+            print(
+                f"{result['clients']:>8}{result['throughput_rps']:>10.1f}"
+                f"{latency['p50_ms']:>10.0f}{latency['p95_ms']:>10.0f}{latency['p99_ms']:>10.0f}"
+            )
+        
+        embeddings_manager.executor.shutdown(wait=False)
+    
+    with open(args.json, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"💾 Saved results to {args.json}")
+
+if __name__ == "__main__":
+    main()
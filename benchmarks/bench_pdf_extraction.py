@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark peak memory and throughput of PDF extraction and chunking
+
+Compares the previous approach (concatenate every page into one string,
+then split it) with DocumentProcessor's streaming page-aware pipeline on a
+synthetic multi-hundred-page regulation compilation.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, Any, List
+
+import fitz
+
+from common import generate_regulation, regulation_text, write_pdf
+from app.rag.document_processor import DocumentProcessor
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark PDF extraction memory and throughput")
+    parser.add_argument("--pages", type=int, default=500, help="Approximate number of PDF pages")
+    parser.add_argument("--chunk_size", type=int, default=1000, help="Chunk size")
+    parser.add_argument("--chunk_overlap", type=int, default=200, help="Chunk overlap")
+    parser.add_argument("--json", type=str, help="Write results to this JSON file")
+    return parser.parse_args()
+
+def legacy_process(processor: DocumentProcessor, pdf_path: str) -> List[Dict[str, Any]]:
+    """Previous implementation: one giant string, then split"""
+    text = ""
+    doc = fitz.open(pdf_path)
+    for page_num in range(len(doc)):
+        text += doc.load_page(page_num).get_text()
+    doc.close()
+    return processor.chunk_text(text, {"source": os.path.basename(pdf_path)})
+
+def measure(name: str, func: Callable[[], List[Dict[str, Any]]], pages: int) -> Dict[str, Any]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    chunks = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "method": name,
+        "pages": pages,
+        "chunks": len(chunks),
+        "elapsed_s": elapsed,
+        "pages_per_sec": pages / elapsed,
+        "chunks_per_sec": len(chunks) / elapsed,
+        "peak_python_mb": peak / (1 << 20),
+    }
+
+def main():
+    args = parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Roughly two generated articles per page at the default PDF layout
+        articles = generate_regulation(chapters=max(args.pages // 20, 1), articles_per_chapter=40, clauses_per_article=6)
+        pdf_path = os.path.join(tmp_dir, "quy_che_tong_hop.pdf")
+        pages = write_pdf(pdf_path, regulation_text(articles))
+        print(f"📄 Generated synthetic PDF with {pages} pages")
+        
+        processor = DocumentProcessor(
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            raw_dir=tmp_dir,
+            processed_dir=os.path.join(tmp_dir, "processed")
+        )
+        
+        results = [
+            measure("concat+split", lambda: legacy_process(processor, pdf_path), pages),
+            measure("streaming", lambda: processor.process_pdf(os.path.basename(pdf_path)), pages),
+        ]
+    
+    print(f"{'method':<14}{'chunks':>8}{'pages/s':>10}{'chunks/s':>10}{'peak MB':>10}")
+    for result in results:
+        print(
+            f"{result['method']:<14}{result['chunks']:>8}{result['pages_per_sec']:>10.0f}"
+            f"{result['chunks_per_sec']:>10.0f}{result['peak_python_mb']:>10.1f}"
+        )
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved results to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Measure RAGPipeline overhead with a zero-latency fake LLM
+
+Encoding, search and generation all cost nothing, so the time per request
+is what the pipeline itself adds (cache lookups, prompt building, executor
+hops, event plumbing). Runs fully offline; --max_overhead_ms turns it into
+a regression check that exits non-zero when any path gets slower.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Dict, Any
+
+from common import StubEmbeddingsManager, summarize
+from app.rag.retriever import DocumentRetriever
+from app.rag.rag_pipeline import RAGPipeline
+from app.rag.llm import FakeChatModel
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure RAG pipeline overhead offline")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per path")
+    parser.add_argument("--response_tokens", type=int, default=40, help="Tokens per fake answer")
+    parser.add_argument("--max_overhead_ms", type=float, help="Fail if any path's p50 exceeds this")
+    parser.add_argument("--json", type=str, help="Write results to this JSON file")
+    return parser.parse_args()
+
+async def measure(pipeline: RAGPipeline, requests: int) -> Dict[str, Any]:
+    questions = [f"Điều kiện học lại học phần số {i}?" for i in range(requests)]
+    results = {}
+    
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        pipeline.generate_response(query=question)
+        latencies.append(time.perf_counter() - start)
+    results["generate_response"] = summarize(latencies)
+    
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        await pipeline.agenerate_response(query=question)
+        latencies.append(time.perf_counter() - start)
+    results["agenerate_response"] = summarize(latencies)
+    
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        async for _ in pipeline.astream_response(query=question):
+            pass
+        latencies.append(time.perf_counter() - start)
+    results["astream_response"] = summarize(latencies)
+    
+    start = time.perf_counter()
+    async for _ in pipeline.agenerate_batch(questions):
+        pass
+    per_question = (time.perf_counter() - start) / len(questions)
+    results["agenerate_batch"] = summarize([per_question])
+    
+    return results
+
+async def main():
+    args = parse_args()
+    
+    pipeline = RAGPipeline(
+        retriever=DocumentRetriever(StubEmbeddingsManager(encode_ms=0, search_ms=0)),
+        llm=FakeChatModel(latency_ms=0, tokens_per_sec=0, response_tokens=args.response_tokens)
+    )
+    results = await measure(pipeline, args.requests)
+    
+    print(f"{'path':<22}{'p50 ms':>10}{'p95 ms':>10}")
+    for path, summary in results.items():
+        print(f"{path:<22}{summary['p50_ms']:>10.3f}{summary['p95_ms']:>10.3f}")
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved results to {args.json}")
+    
+    if args.max_overhead_ms is not None:
+        slow = [path for path, summary in results.items() if summary["p50_ms"] > args.max_overhead_ms]
+        if slow:
+            print(f"❌ Overhead above {args.max_overhead_ms} ms: {', '.join(slow)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark API import time and startup time
+
+Measures, each in a fresh interpreter:
+- how long `import app.main` takes (what every worker restart or --reload pays
+  before uvicorn can bind),
+- how long building the RAG components takes (what the import used to pay
+  when routes.py constructed them at module level),
+- for a real uvicorn process, the time until /health answers (liveness) and
+  until /ready answers 200 (model, vector store and indexes loaded).
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+from common import summarize
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import app.main
+print(time.perf_counter() - start)
+"""
+
+INITIALIZE_SNIPPET = """
+import time
+from app.api.dependencies import components
+start = time.perf_counter()
+components.initialize()
+print(time.perf_counter() - start)
+"""
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark API import and startup time")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh-process runs per measurement")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for /ready")
+    parser.add_argument("--skip_initialize", action="store_true", help="Skip the component build measurement")
+    parser.add_argument("--json", type=str, help="Write results to this JSON file")
+    return parser.parse_args()
+
+def run_snippet(snippet: str) -> float:
+    """Run a snippet in a fresh interpreter and return the seconds it prints"""
+    output = subprocess.run(
+        [sys.executable, "-c", snippet],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for(client: httpx.Client, url: str, deadline: float) -> Optional[float]:
+    """Poll a URL until it returns 200; return the time it did, or None
+
+    Gives up early when the endpoint reports a failed startup.
+    """
+    while time.perf_counter() < deadline:
+        try:
+            response = client.get(url)
+            if response.status_code == 200:
+                return time.perf_counter()
+            if response.json().get("status") == "error":
+                return None
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    return None
+
+def measure_server(timeout: float) -> Dict[str, Any]:
+    """Start uvicorn and time /health and /ready"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        with httpx.Client(timeout=5.0) as client:
+            deadline = start + timeout
+            health_at = wait_for(client, f"{base_url}/health", deadline)
+            ready_at = wait_for(client, f"{base_url}/ready", deadline) if health_at else None
+            ready = client.get(f"{base_url}/ready").json() if health_at else None
+    finally:
+        process.terminate()
+        process.wait()
+    
+    return {
+        "health_s": health_at - start if health_at else None,
+        "ready_s": ready_at - start if ready_at else None,
+        "ready": ready,
+    }
+
+def main():
+    args = parse_args()
+    results: Dict[str, Any] = {}
+    
+    import_times: List[float] = [run_snippet(IMPORT_SNIPPET) for _ in range(args.runs)]
+    results["import_app_main"] = summarize(import_times)
+    print(f"import app.main:        p50 {results['import_app_main']['p50_ms']:.0f} ms")
+    
+    if not args.skip_initialize:
+        try:
+            init_times = [run_snippet(INITIALIZE_SNIPPET) for _ in range(args.runs)]
+            results["initialize_components"] = summarize(init_times)
+            print(f"initialize components:  p50 {results['initialize_components']['p50_ms']:.0f} ms")
+        except subprocess.CalledProcessError as e:
+            results["initialize_components"] = {"error": e.stderr.strip().splitlines()[-1]}
+            print(f"initialize components:  failed ({results['initialize_components']['error']})")
+    
+    server = measure_server(args.timeout)
+    results["server"] = server
+    health = f"{server['health_s'] * 1000:.0f} ms" if server["health_s"] is not None else "timeout"
+    ready = f"{server['ready_s'] * 1000:.0f} ms" if server["ready_s"] is not None else f"not ready ({server['ready']})"
+    print(f"uvicorn → /health:      {health}")
+    print(f"uvicorn → /ready:       {ready}")
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved results to {args.json}")
+
+if __name__ == "__main__":
+    main()
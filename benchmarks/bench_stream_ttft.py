@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark time-to-first-token of /chat/stream against the blocking /chat
+
+With /chat the user sees nothing until the whole completion is generated;
+with /chat/stream the first token event arrives after retrieval plus the
+LLM's own time to first token.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, Any
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from common import StubEmbeddingsManager, serve_app, summarize
+from app.rag.retriever import DocumentRetriever
+from app.rag.rag_pipeline import RAGPipeline
+from app.rag.llm import FakeChatModel
+from app.utils.helpers import format_sse
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark streaming time-to-first-token")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests_per_client", type=int, default=5, help="Requests sent by each client")
+    parser.add_argument("--llm_latency_ms", type=float, default=300, help="Fake LLM time to first token")
+    parser.add_argument("--tokens_per_sec", type=float, default=40, help="Fake LLM generation rate")
+    parser.add_argument("--response_tokens", type=int, default=120, help="Tokens per fake answer")
+    parser.add_argument("--json", type=str, help="Write results to this JSON file")
+    return parser.parse_args()
+
+class ChatRequest(BaseModel):
+    message: str
+
+def build_app(pipeline: RAGPipeline) -> FastAPI:
+    app = FastAPI()
+    
+    @app.post("/chat")
+    async def chat(request: ChatRequest):
+        return await pipeline.agenerate_response(query=request.message)
+    
+    @app.post("/chat/stream")
+    async def chat_stream(request: ChatRequest):
+        async def event_stream():
+            async for event in pipeline.astream_response(query=request.message):
+                yield format_sse(event["event"], event["data"])
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+    
+    return app
+
+async def measure(base_url: str, route: str, clients: int, requests_per_client: int) -> Dict[str, Any]:
+    first_token, totals = [], []
+    limits = httpx.Limits(max_connections=clients)
+    
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        async def one_client(i: int):
+            for j in range(requests_per_client):
+                start = time.perf_counter()
+                seen_token = False
+                async with client.stream("POST", route, json={"message": f"Câu hỏi {i}-{j}"}) as response:
+                    async for line in response.aiter_lines():
+                        if not seen_token and (route == "/chat" or line == "event: token"):
+                            # The blocking route's first useful byte is the full answer
+                            first_token.append(time.perf_counter() - start)
+                            seen_token = True
+                totals.append(time.perf_counter() - start)
+        
+        await asyncio.gather(*(one_client(i) for i in range(clients)))
+    
+    return {"route": route, "ttft": summarize(first_token), "total": summarize(totals)}
+
+async def main():
+    args = parse_args()
+    
+    pipeline = RAGPipeline(
+        retriever=DocumentRetriever(StubEmbeddingsManager()),
+        llm=FakeChatModel(
+            latency_ms=args.llm_latency_ms,
+            tokens_per_sec=args.tokens_per_sec,
+            response_tokens=args.response_tokens
+        )
+    )
+    app = build_app(pipeline)
+    
+    results = []
+    print(f"{'route':<14}{'ttft p50 ms':>14}{'ttft p95 ms':>14}{'total p50 ms':>14}")
+    with serve_app(app) as base_url:
+        for route in ("/chat", "/chat/stream"):
+            result = await measure(base_url, route, args.clients, args.requests_per_client)
+            results.append(result)
+            print(
+                f"{route:<14}{result['ttft']['p50_ms']:>14.0f}{result['ttft']['p95_ms']:>14.0f}"
+                f"{result['total']['p50_ms']:>14.0f}"
+            )
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved results to {args.json}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
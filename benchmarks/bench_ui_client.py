@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Benchmark UI-server concurrency of the Chainlit handlers' HTTP calls
+
+Simulates N chat sessions on one event loop, as in the Chainlit server:
+each session fetches the document list, then uploads a PDF and asks a
+question. The old handlers used a blocking requests.get for the document
+list, a new connection per call and sent the upload before chatting; the
+new ones use the shared pooled client, the cached document list and upload
+concurrently with the streamed answer. Event loop lag is sampled meanwhile,
+since any stall delays every connected user.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List
+
+import httpx
+import requests
+from fastapi import FastAPI, Request, Response, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from common import StubEmbeddingsManager, serve_app, summarize, percentile
+from app.rag.retriever import DocumentRetriever
+from app.rag.rag_pipeline import RAGPipeline
+from app.rag.llm import FakeChatModel
+from app.utils.helpers import format_sse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ui')))
+
+API_PREFIX = "/api/v1"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark UI-server HTTP client concurrency")
+    parser.add_argument("--sessions", type=str, default="1,16,64", help="Comma-separated concurrent session counts")
+    parser.add_argument("--documents", type=int, default=50, help="Documents in the stub document list")
+    parser.add_argument("--documents_ms", type=float, default=50, help="Stub /documents latency")
+    parser.add_argument("--upload_ms", type=float, default=300, help="Stub /upload latency")
+    parser.add_argument("--llm_latency_ms", type=float, default=300, help="Fake LLM time to first token")
+    parser.add_argument("--tokens_per_sec", type=float, default=100, help="Fake LLM generation rate")
+    parser.add_argument("--json", type=str, help="Write results to this JSON file")
+    return parser.parse_args()
+
+class ChatRequest(BaseModel):
+    message: str
+
+def build_api(pipeline: RAGPipeline, documents: List[Dict[str, Any]], documents_ms: float, upload_ms: float) -> FastAPI:
+    """Stub of the API routes the UI calls"""
+    app = FastAPI()
+    etag = '"stub-documents-v1"'
+    
+    @app.get(API_PREFIX + "/documents")
+    async def list_documents(request: Request, response: Response):
+        await asyncio.sleep(documents_ms / 1000)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        return documents
+    
+    @app.post(API_PREFIX + "/upload")
+    async def upload(file: UploadFile = File(...), document_id: str = Form(None)):
+        await file.read()
+        await asyncio.sleep(upload_ms / 1000)
+        return {"status": "queued", "document_id": document_id, "filename": file.filename}
+    
+    @app.post(API_PREFIX + "/chat/stream")
+    async def chat_stream(request: ChatRequest):
+        async def event_stream():
+            async for event in pipeline.astream_response(query=request.message):
+                yield format_sse(event["event"], event["data"])
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+    
+    return app
+
+async def stream_answer(client: httpx.AsyncClient, url: str, message: str) -> None:
+    async with client.stream("POST", url, json={"message": message}, timeout=httpx.Timeout(None, connect=5.0)) as response:
+        async for _ in response.aiter_lines():
+            pass
+
+async def legacy_session(base_url: str, pdf_path: str, i: int) -> None:
+    """Previous handlers: blocking document list, one connection per call, upload then chat"""
+    response = requests.get(f"{base_url}{API_PREFIX}/documents")
+    response.json()
+    
+    with open(pdf_path, "rb") as f:
+        async with httpx.AsyncClient(timeout=httpx.Timeout(120.0, connect=5.0)) as client:
+            await client.post(
+                f"{base_url}{API_PREFIX}/upload",
+                files={"file": ("quy_che.pdf", f, "application/pdf")},
+                data={"document_id": f"quy_che_{i}"}
+            )
+    
+    async with httpx.AsyncClient() as client:
+        await stream_answer(client, f"{base_url}{API_PREFIX}/chat/stream", f"Câu hỏi {i}")
+
+async def pooled_session(pdf_path: str, i: int) -> None:
+    """Current handlers: cached document list, shared client, upload during the chat"""
+    import api_client
+    
+    await api_client.document_list.get()
+    upload = asyncio.create_task(api_client.upload_pdf(pdf_path, f"quy_che_{i}"))
+    await stream_answer(api_client.get_client(), api_client.api_url("/chat/stream"), f"Câu hỏi {i}")
+    await upload
+
+async def run_sessions(session_factory, sessions: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    lags: List[float] = []
+    done = asyncio.Event()
+    
+    async def lag_probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - start - 0.01)
+    
+    async def one_session(i: int):
+        start = time.perf_counter()
+        await session_factory(i)
+        latencies.append(time.perf_counter() - start)
+    
+    probe = asyncio.create_task(lag_probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(one_session(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe
+    
+    return {
+        "sessions": sessions,
+        "elapsed_s": elapsed,
+        "sessions_per_sec": sessions / elapsed,
+        "session": summarize(latencies),
+        "loop_lag_p99_ms": percentile(lags, 99) * 1000,
+        "loop_lag_max_ms": max(lags, default=0.0) * 1000,
+    }
+
+async def main():
+    args = parse_args()
+    
+    pipeline = RAGPipeline(
+        retriever=DocumentRetriever(StubEmbeddingsManager()),
+        llm=FakeChatModel(latency_ms=args.llm_latency_ms, tokens_per_sec=args.tokens_per_sec)
+    )
+    documents = [
+        {"document_id": f"quy_che_{i}", "filename": f"quy_che_{i}.pdf", "status": "processed", "chunk_count": 120}
+        for i in range(args.documents)
+    ]
+    api = build_api(pipeline, documents, args.documents_ms, args.upload_ms)
+    
+    results = []
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf, serve_app(api) as base_url:
+        pdf.write(b"%PDF-1.4\n" + b"0" * (256 * 1024))
+        pdf.flush()
+        
+        os.environ["API_URL"] = base_url
+        os.environ["API_PREFIX"] = API_PREFIX
+        import api_client
+        
+        print(f"{'client':<8}{'sessions':>9}{'sess/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'lag p99 ms':>12}{'lag max ms':>12}")
+        for sessions in [int(s) for s in args.sessions.split(",")]:
+            for name, factory in (
+                ("legacy", lambda i: legacy_session(base_url, pdf.name, i)),
+                ("pooled", lambda i: pooled_session(pdf.name, i)),
+            ):
+                result = {"client": name, **await run_sessions(factory, sessions)}
+                results.append(result)
+                print(
+                    f"{name:<8}{sessions:>9}{result['sessions_per_sec']:>9.1f}"
+                    f"{result['session']['p50_ms']:>9.0f}{result['session']['p95_ms']:>9.0f}"
+                    f"{result['loop_lag_p99_ms']:>12.1f}{result['loop_lag_max_ms']:>12.1f}"
+                )
+        
+        await api_client.close_client()
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved results to {args.json}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
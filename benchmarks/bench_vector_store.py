@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark vector store backends: write time, open time and search latency
+
+Compares Chroma with the memory-mapped numpy store (exact search, and the
+HNSW graph when hnswlib is installed) on synthetic normalized vectors
+clustered around topic centers, like chunk embeddings of a few
+regulations. Queries go through the VectorStore interface one at a time,
+unfiltered and with a source filter, as DocumentRetriever calls it;
+recall is measured against exact search.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+
+from common import summarize
+from app.rag.vector_store import create_vector_store
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark Chroma against the numpy vector store")
+    parser.add_argument("--sizes", type=str, default="1000,10000,50000", help="Comma-separated corpus sizes (chunks)")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension")
+    parser.add_argument("--sources", type=int, default=20, help="Distinct source documents (for filters)")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per configuration")
+    parser.add_argument("--k", type=int, default=5, help="Results per query")
+    parser.add_argument("--backends", type=str, default="chroma,numpy,numpy-hnsw", help="Comma-separated backends")
+    parser.add_argument("--batch_size", type=int, default=5000, help="Chunks per write")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--json", type=str, help="Write results to this JSON file")
+    return parser.parse_args()
+
+def make_vectors(rng: np.random.Generator, count: int, dim: int, centers: np.ndarray) -> np.ndarray:
+    vectors = centers[rng.integers(len(centers), size=count)] + 0.6 * rng.normal(size=(count, dim))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def open_store(backend: str, directory: str):
+    if backend == "chroma":
+        return create_vector_store("chroma", directory, "bench", None)
+    # Exact search for "numpy"; "numpy-hnsw" builds the graph from the first chunk
+    if backend == "numpy-hnsw":
+        import hnswlib  # noqa: F401 (the store would silently fall back to exact search)
+    threshold = 1 if backend == "numpy-hnsw" else 10 ** 12
+    return create_vector_store("numpy", directory, "bench", None, hnsw_threshold=threshold)
+
+def run_backend(
+    backend: str,
+    vectors: np.ndarray,
+    sources: List[str],
+    queries: np.ndarray,
+    query_sources: List[str],
+    k: int,
+    batch_size: int,
+    exact: Dict[str, List[List[str]]]
+) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ids = [f"chunk-{i}" for i in range(len(vectors))]
+        store = open_store(backend, tmp_dir)
+        start = time.perf_counter()
+        for i in range(0, len(ids), batch_size):
+            store.upsert(
+                ids=ids[i:i + batch_size],
+                embeddings=vectors[i:i + batch_size].tolist(),
+                texts=ids[i:i + batch_size],
+                metadatas=[{"source": source, "document_id": source} for source in sources[i:i + batch_size]]
+            )
+        store.persist()
+        write_s = time.perf_counter() - start
+        
+        # Opening again measures what an API worker pays at startup
+        start = time.perf_counter()
+        store = open_store(backend, tmp_dir)
+        store.count()
+        open_s = time.perf_counter() - start
+        
+        result: Dict[str, Any] = {"backend": backend, "chunks": len(vectors), "write_s": write_s, "open_s": open_s}
+        for name, filtered in (("unfiltered", False), ("filtered", True)):
+            store.query(queries[:1].tolist(), k=k)
+            latencies, found = [], []
+            for query, source in zip(queries, query_sources):
+                start = time.perf_counter()
+                hits = store.query([query.tolist()], k=k, where={"source": source} if filtered else None)[0]
+                latencies.append(time.perf_counter() - start)
+                found.append([hit["text"] for hit in hits])
+            result[name] = summarize(latencies)
+            result[name]["recall"] = float(np.mean([
+                len(set(a) & set(b)) / k for a, b in zip(found, exact[name])
+            ]))
+        return result
+
+def exact_neighbours(
+    vectors: np.ndarray,
+    sources: np.ndarray,
+    queries: np.ndarray,
+    query_sources: List[str],
+    k: int
+) -> Dict[str, List[List[str]]]:
+    scores = queries @ vectors.T
+    unfiltered = np.argsort(-scores, axis=1)[:, :k]
+    filtered = []
+    for row, source in zip(scores, query_sources):
+        row = np.where(sources == source, row, -np.inf)
+        filtered.append(np.argsort(-row)[:k])
+    return {
+        "unfiltered": [[f"chunk-{i}" for i in top] for top in unfiltered],
+        "filtered": [[f"chunk-{i}" for i in top] for top in filtered],
+    }
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    centers = rng.normal(size=(64, args.dim))
+    
+    vectors = make_vectors(rng, sizes[-1], args.dim, centers)
+    sources = np.array([f"quy_che_{i % args.sources}.pdf" for i in range(sizes[-1])])
+    queries = make_vectors(rng, args.queries, args.dim, centers)
+    query_sources = [f"quy_che_{i % args.sources}.pdf" for i in range(args.queries)]
+    
+    results = []
+    print(
+        f"{'backend':<12}{'chunks':>8}{'write s':>9}{'open s':>8}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'recall':>8}{'filt p50':>10}{'filt p95':>10}{'recall':>8}"
+    )
+    for size in sizes:
+        exact = exact_neighbours(vectors[:size], sources[:size], queries, query_sources, args.k)
+        for backend in args.backends.split(","):
+            try:
+                result = run_backend(
+                    backend, vectors[:size], list(sources[:size]), queries, query_sources,
+                    args.k, args.batch_size, exact
+                )
+            except ImportError as e:
+                print(f"{backend:<12}{size:>8} skipped: {e}")
+                continue
+            results.append(result)
+            print(
+                f"{backend:<12}{size:>8}{result['write_s']:>9.1f}{result['open_s']:>8.2f}"
+                f"{result['unfiltered']['p50_ms']:>9.2f}{result['unfiltered']['p95_ms']:>9.2f}"
+                f"{result['unfiltered']['recall']:>8.3f}"
+                f"{result['filtered']['p50_ms']:>10.2f}{result['filtered']['p95_ms']:>10.2f}"
+                f"{result['filtered']['recall']:>8.3f}"
+            )
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"💾 Saved results to {args.json}")
+
+if __name__ == "__main__":
+    main()
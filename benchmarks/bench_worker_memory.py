@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Benchmark the memory of `uvicorn --workers N`, with and without the embedding server
+
+For each worker count, starts uvicorn on the current configuration
+(data directory, embedding and vector store backends from the
+environment), waits until every worker answers /ready, sends a few chat
+requests so the lazily loaded parts are resident, and then reads the
+memory of the whole process tree from /proc/<pid>/smaps_rollup (Linux):
+
+- RSS counts shared pages (libraries, the mmapped vector file, model
+  weights shared after fork) once per process, so its sum overstates
+  the real footprint;
+- PSS divides each shared page between the processes that map it, so
+  the PSS sum is what the deployment actually costs;
+- USS (private pages) is what each process alone would free on exit.
+
+In "server" mode scripts/embedding_server.py is started first and the
+workers connect to it through EMBEDDING_SERVER_SOCKET, so the model is
+loaded once instead of once per worker.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+from bench_startup import ROOT, free_port
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark API memory by worker count")
+    parser.add_argument("--workers", type=str, default="1,2,4,8", help="Comma-separated uvicorn worker counts")
+    parser.add_argument("--modes", type=str, default="inprocess,server", help="Comma-separated: inprocess, server")
+    parser.add_argument("--chat_requests", type=int, default=4, help="Chat requests per worker before measuring")
+    parser.add_argument("--settle", type=float, default=3.0, help="Seconds to wait after the requests")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for all workers to be ready")
+    parser.add_argument("--json", type=str, help="Write results to this JSON file")
+    return parser.parse_args()
+
+def process_tree(root_pid: int) -> List[int]:
+    """root_pid and all its descendants, from the parent pids in /proc"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # The command name may contain spaces; the ppid follows its closing parenthesis
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+def memory_mb(pid: int) -> Optional[Dict[str, float]]:
+    """RSS, PSS and USS of a process in MB, or None if it exited"""
+    fields: Dict[str, float] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1]) / 1024
+    except OSError:
+        return None
+    return {
+        "rss": fields.get("Rss", 0.0),
+        "pss": fields.get("Pss", 0.0),
+        "uss": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+    }
+
+def tree_memory(root_pid: int) -> Dict[str, Any]:
+    processes = {pid: memory_mb(pid) for pid in process_tree(root_pid)}
+    processes = {pid: memory for pid, memory in processes.items() if memory is not None}
+    return {
+        "processes": len(processes),
+        "rss_mb": sum(memory["rss"] for memory in processes.values()),
+        "pss_mb": sum(memory["pss"] for memory in processes.values()),
+        "uss_mb": sum(memory["uss"] for memory in processes.values()),
+        "per_process": {str(pid): memory for pid, memory in processes.items()},
+    }
+
+def wait_for_workers(client: httpx.Client, base_url: str, workers: int, deadline: float) -> bool:
+    """Poll /ready until that many distinct worker pids have reported ready"""
+    ready_pids = set()
+    while time.perf_counter() < deadline:
+        try:
+            # A new connection each time, so the kernel can hand it to any worker
+            response = client.get(f"{base_url}/ready", headers={"Connection": "close"})
+            if response.status_code == 200:
+                ready_pids.add(response.json().get("pid"))
+                if len(ready_pids) >= workers:
+                    return True
+                continue
+            if response.json().get("status") == "error":
+                print(f"  startup failed: {response.json().get('detail')}")
+                return False
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    return False
+
+def start_embedding_server(socket_path: str, env: Dict[str, str], timeout: float) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "scripts", "embedding_server.py"), "--socket", socket_path],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    deadline = time.perf_counter() + timeout
+    while not os.path.exists(socket_path):
+        if process.poll() is not None or time.perf_counter() > deadline:
+            raise RuntimeError("Embedding server did not start")
+        time.sleep(0.1)
+    return process
+
+def measure(mode: str, workers: int, args) -> Optional[Dict[str, Any]]:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, "WARMUP_ON_STARTUP": "true"}
+    server = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if mode == "server":
+            env["EMBEDDING_SERVER_SOCKET"] = os.path.join(tmp_dir, "embeddings.sock")
+            server = start_embedding_server(env["EMBEDDING_SERVER_SOCKET"], env, args.timeout)
+        else:
+            env.pop("EMBEDDING_SERVER_SOCKET", None)
+        
+        api = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)
+            ],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            with httpx.Client(timeout=60.0) as client:
+                if not wait_for_workers(client, base_url, workers, time.perf_counter() + args.timeout):
+                    return None
+                for i in range(args.chat_requests * workers):
+                    client.post(f"{base_url}/api/v1/chat", json={"message": f"Điều kiện tốt nghiệp {i}?"})
+            time.sleep(args.settle)
+            
+            result: Dict[str, Any] = {"mode": mode, "workers": workers, "api": tree_memory(api.pid)}
+            result["embedding_server"] = tree_memory(server.pid) if server else None
+            for key in ("rss_mb", "pss_mb", "uss_mb"):
+                result[key] = result["api"][key] + (result["embedding_server"][key] if server else 0.0)
+            return result
+        finally:
+            api.terminate()
+            api.wait()
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+def main():
+    args = parse_args()
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("This benchmark reads /proc/<pid>/smaps_rollup and needs Linux 4.14 or later")
+    
+    results = []
+    print(f"{'mode':<11}{'workers':>8}{'procs':>7}{'RSS MB':>9}{'PSS MB':>9}{'USS MB':>9}{'server PSS':>12}")
+    for mode in args.modes.split(","):
+        for workers in [int(count) for count in args.workers.split(",")]:
+            result = measure(mode, workers, args)
+            if result is None:
+                print(f"{mode:<11}{workers:>8}  workers did not become ready")
+                continue
+            results.append(result)
+            server_pss = f"{result['embedding_server']['pss_mb']:.0f}" if result["embedding_server"] else "-"
+            processes = result["api"]["processes"] + (result["embedding_server"]["processes"] if result["embedding_server"] else 0)
+            print(
+                f"{mode:<11}{workers:>8}{processes:>7}{result['rss_mb']:>9.0f}"
+                f"{result['pss_mb']:>9.0f}{result['uss_mb']:>9.0f}{server_pss:>12}"
+            )
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"💾 Saved results to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+
+import os
+import sys
+import time
+import random
+import socket
+import threading
+import statistics
+import unicodedata
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.rag.embeddings import EmbeddingsManager
+
+
+class StubEmbeddingsManager(EmbeddingsManager):
+    """EmbeddingsManager with simulated encode/search costs and no model or Chroma"""
+    
+    def __init__(self, encode_ms: float = 20, search_ms: float = 5, encode_workers: int = 2):
+        self.embedding_model_name = "stub"
+        self.embedding_backend = "torch"
+        self.embedding_options = {}
+        self.encode_latency = encode_ms / 1000
+        self.search_latency = search_ms / 1000
+        self.shared_index_version = None
+        self._local_index_version = 0
+        self.chunk_cache = None
+        self.executor = ThreadPoolExecutor(
+            max_workers=encode_workers,
+            thread_name_prefix="embeddings"
+        )
+        self.setup_query_encoding()
+    
+    def encode_queries(self, queries: List[str]) -> List[List[float]]:
+        # Batches amortize most of the per-call cost, as with sentence-transformers
+        time.sleep(self.encode_latency * (1 + 0.1 * (len(queries) - 1)))
+        return [[0.0] * 768 for _ in queries]
+    
+    def similarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 3,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        time.sleep(self.search_latency)
+        return self._stub_results(k, include_embeddings)
+    
+    def similarity_search_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 3,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False
+    ) -> List[List[Dict[str, Any]]]:
+        # One call amortizes the per-query overhead like a batched ANN query
+        time.sleep(self.search_latency * (1 + 0.1 * (len(embeddings) - 1)))
+        return [self._stub_results(k, include_embeddings) for _ in embeddings]
+    
+    def _stub_results(self, k: int, include_embeddings: bool = False) -> List[Dict[str, Any]]:
+        results = []
+        for i in range(k):
+            result = {
+                "text": f"Điều {i + 1}. Nội dung quy chế mẫu.",
+                "metadata": {"source": "stub.pdf", "document_id": "stub"},
+                "score": 1.0 - 0.01 * i
+            }
+            if include_embeddings:
+                result["embedding"] = [1.0 if j == i % 768 else 0.0 for j in range(768)]
+            results.append(result)
+        return results
+
+
+@contextmanager
+def serve_app(app):
+    """Run an ASGI app with uvicorn in a background thread and yield its base URL
+
+    Streaming benchmarks need a real socket: httpx's ASGI transport buffers
+    the whole response body before returning it.
+    """
+    import uvicorn
+    
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+CHAPTER_TITLES = [
+    "NHỮNG QUY ĐỊNH CHUNG",
+    "TỔ CHỨC ĐÀO TẠO",
+    "KIỂM TRA VÀ THI HỌC PHẦN",
+    "XÉT VÀ CÔNG NHẬN TỐT NGHIỆP",
+    "HỌC BỔNG VÀ KHEN THƯỞNG",
+    "XỬ LÝ VI PHẠM",
+]
+
+ARTICLE_TOPICS = [
+    "Đăng ký khối lượng học tập",
+    "Học lại và học cải thiện điểm",
+    "Điều kiện xét tốt nghiệp",
+    "Cách tính điểm trung bình",
+    "Nghỉ học tạm thời và thôi học",
+    "Cảnh báo kết quả học tập",
+    "Chuyển ngành và chuyển trường",
+    "Học phần tiên quyết",
+    "Thi lại và phúc khảo",
+    "Xếp hạng năm đào tạo",
+    "Miễn học và công nhận tín chỉ",
+    "Khóa luận tốt nghiệp",
+]
+
+SENTENCE_PARTS = [
+    "sinh viên phải hoàn thành {n} tín chỉ",
+    "điểm trung bình tích lũy đạt từ {g} trở lên",
+    "trong thời hạn {n} tuần kể từ ngày công bố kết quả",
+    "theo quy định của Hiệu trưởng",
+    "được Phòng Đào tạo xem xét và phê duyệt",
+    "không vượt quá {n} tín chỉ trong một học kỳ",
+    "trừ trường hợp có lý do chính đáng",
+    "kết quả được ghi vào bảng điểm của sinh viên",
+]
+
+def _sentence(rng: random.Random) -> str:
+    parts = rng.sample(SENTENCE_PARTS, 3)
+    text = ", ".join(part.format(n=rng.randint(2, 150), g=f"{rng.uniform(1.5, 3.6):.2f}") for part in parts)
+    return text[0].upper() + text[1:] + "."
+
+def generate_regulation(
+    chapters: int = 6,
+    articles_per_chapter: int = 8,
+    clauses_per_article: int = 4,
+    seed: int = 42
+) -> List[Dict[str, Any]]:
+    """
+    Generate a synthetic Vietnamese regulation as a list of articles
+    
+    Each article has its number, chapter, topic, clauses and full text, so
+    benchmarks can check which article a retrieved chunk came from.
+    """
+    rng = random.Random(seed)
+    articles = []
+    number = 0
+    for chapter in range(1, chapters + 1):
+        chapter_title = CHAPTER_TITLES[(chapter - 1) % len(CHAPTER_TITLES)]
+        for index in range(articles_per_chapter):
+            number += 1
+            topic = ARTICLE_TOPICS[rng.randrange(len(ARTICLE_TOPICS))]
+            clauses = [
+                f"{c}. " + " ".join(_sentence(rng) for _ in range(rng.randint(2, 5)))
+                for c in range(1, clauses_per_article + 1)
+            ]
+            heading = f"Chương {chapter}\n{chapter_title}\n" if index == 0 else ""
+            articles.append({
+                "number": number,
+                "chapter": chapter,
+                "topic": topic,
+                "clauses": clauses,
+                "text": heading + f"Điều {number}. {topic}\n" + "\n".join(clauses) + "\n"
+            })
+    return articles
+
+def regulation_text(articles: List[Dict[str, Any]]) -> str:
+    """Join generated articles into one document"""
+    return "".join(article["text"] for article in articles)
+
+def ascii_fold(text: str) -> str:
+    """Strip Vietnamese diacritics (the built-in PDF fonts have no glyphs for them)"""
+    text = text.replace("Đ", "D").replace("đ", "d")
+    return "".join(c for c in unicodedata.normalize("NFD", text) if not unicodedata.combining(c))
+
+def write_pdf(path: str, text: str, lines_per_page: int = 60, line_width: int = 100) -> int:
+    """Write text to a PDF with built-in fonts and return the page count"""
+    import textwrap
+    import fitz
+    
+    lines = []
+    for paragraph in ascii_fold(text).splitlines():
+        lines.extend(textwrap.wrap(paragraph, line_width) or [""])
+    
+    doc = fitz.open()
+    for start in range(0, len(lines), lines_per_page):
+        page = doc.new_page()
+        page.insert_text((40, 40), "\n".join(lines[start:start + lines_per_page]), fontsize=7)
+    pages = len(doc)
+    doc.save(path)
+    doc.close()
+    return pages
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Return the pct-th percentile (0-100) using linear interpolation"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * pct / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """Summarize latencies in seconds as milliseconds"""
+    return {
+        "count": len(latencies),
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
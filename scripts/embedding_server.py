@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Serve the embedding model to all API workers over a Unix socket
+
+Start it before `uvicorn --workers N` and set EMBEDDING_SERVER_SOCKET to
+the same path; the workers then send texts here instead of each loading
+the model. The model is the one the API would load itself
+(EMBEDDING_MODEL_NAME with EMBEDDING_BACKEND and its options).
+"""
+
+import argparse
+import os
+import sys
+import asyncio
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import app modules
+from app.rag.embeddings import create_embedding_model, embedding_model_key
+from app.rag.embedding_server import EmbeddingServer
+from app.config import settings
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the embedding model over a Unix socket")
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=settings.EMBEDDING_SERVER_SOCKET or os.path.join(settings.DATA_DIR, "embeddings.sock"),
+        help="Unix socket path (EMBEDDING_SERVER_SOCKET)"
+    )
+    parser.add_argument(
+        "--max_batch_size",
+        type=int,
+        default=settings.EMBEDDING_SERVER_MAX_BATCH_SIZE,
+        help="Texts per model call"
+    )
+    parser.add_argument(
+        "--max_wait_ms",
+        type=float,
+        default=settings.EMBEDDING_SERVER_MAX_WAIT_MS,
+        help="How long a text waits for others to fill its batch"
+    )
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    
+    print(f"🔤 Loading embedding model {settings.EMBEDDING_MODEL_NAME} ({settings.EMBEDDING_BACKEND} backend)")
+    model = create_embedding_model(
+        settings.EMBEDDING_MODEL_NAME,
+        settings.EMBEDDING_BACKEND,
+        **settings.embedding_options
+    )
+    # Load lazily initialized parts now rather than on the first request
+    model.embed_documents(["khởi động"])
+    
+    server = EmbeddingServer(
+        model,
+        args.socket,
+        embedding_model_key(settings.EMBEDDING_MODEL_NAME, settings.EMBEDDING_BACKEND, **settings.embedding_options),
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms
+    )
+    asyncio.run(server.serve())
+    print("👋 Embedding server stopped")
+
+if __name__ == "__main__":
+    main()
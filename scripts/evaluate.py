@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Evaluate retrieval quality on a golden question set
+
+Each line of the golden JSONL file is a question with the chunks or the
+articles that should be retrieved for it:
+
+    {"question": "...", "expected_chunk_ids": ["quy_che_chunk_4_..."]}
+    {"question": "...", "expected_articles": [12, 13], "source": "quy_che.pdf"}
+
+For every combination of chunk size and overlap, the PDFs are chunked and
+loaded into a temporary collection, and each question is retrieved once at
+the largest k; recall@k, MRR and nDCG for smaller k are computed from
+prefixes of that ranking. Chunk embeddings are cached by content hash, so
+chunks shared between configurations are only embedded once.
+"""
+
+import argparse
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+from itertools import product
+from typing import List, Dict, Any, Set
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import app modules
+from app.rag.document_processor import DocumentProcessor, ARTICLE_PATTERN
+from app.rag.embeddings import EmbeddingsManager
+from app.rag.retriever import DocumentRetriever
+from app.rag.rag_pipeline import RAGPipeline
+from app.rag.context_builder import ContextBuilder, TokenCounter
+from app.rag.llm import FakeChatModel
+from app.config import settings
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality on a golden question set")
+    parser.add_argument(
+        "--golden",
+        type=str,
+        required=True,
+        help="JSONL file of questions with expected_chunk_ids or expected_articles"
+    )
+    parser.add_argument(
+        "--pdf_dir",
+        type=str,
+        default=settings.RAW_DATA_DIR,
+        help="Directory containing PDF files"
+    )
+    parser.add_argument(
+        "--chunk_sizes",
+        type=str,
+        default=str(settings.CHUNK_SIZE),
+        help="Comma-separated chunk sizes to sweep"
+    )
+    parser.add_argument(
+        "--chunk_overlaps",
+        type=str,
+        default=str(settings.CHUNK_OVERLAP),
+        help="Comma-separated chunk overlaps to sweep"
+    )
+    parser.add_argument(
+        "--k",
+        type=str,
+        default=str(settings.RETRIEVER_K),
+        help="Comma-separated values of k (RETRIEVER_K) to sweep"
+    )
+    parser.add_argument(
+        "--chunking_strategy",
+        type=str,
+        default=settings.CHUNKING_STRATEGY,
+        help="Chunking strategy: 'recursive' or 'regulation'"
+    )
+    parser.add_argument(
+        "--embedding_model",
+        type=str,
+        default=settings.EMBEDDING_MODEL_NAME,
+        help="Embedding model to use"
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=settings.EMBED_BATCH_SIZE,
+        help="Number of chunks embedded per model call"
+    )
+    parser.add_argument(
+        "--token_budget",
+        type=int,
+        default=settings.CONTEXT_TOKEN_BUDGET,
+        help="Context token budget used to count prompt tokens"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes for PDF extraction and chunking"
+    )
+    parser.add_argument(
+        "--json",
+        type=str,
+        help="Write results to this JSON file"
+    )
+    return parser.parse_args()
+
+def parse_ints(value: str) -> List[int]:
+    return sorted({int(item) for item in value.split(",") if item.strip()})
+
+def load_golden(path: str) -> List[Dict[str, Any]]:
+    """Load golden questions, skipping blank lines"""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get("expected_chunk_ids") and not item.get("expected_articles"):
+                raise ValueError(f"{path}:{line_number}: expected_chunk_ids or expected_articles is required")
+            items.append(item)
+    return items
+
+def chunk_articles(doc: Dict[str, Any]) -> Set[int]:
+    """Articles a retrieved chunk belongs to, from metadata or its 'Điều N.' headings"""
+    article = doc["metadata"].get("article")
+    if article is not None:
+        return {int(article)}
+    articles = set()
+    for line in doc["text"].splitlines():
+        match = ARTICLE_PATTERN.match(line.strip())
+        if match:
+            articles.add(int(match.group(1)))
+    return articles
+
+def matched_targets(item: Dict[str, Any], doc: Dict[str, Any]) -> Set[Any]:
+    """Expected chunk IDs or articles of a golden item that a retrieved chunk covers"""
+    if item.get("expected_chunk_ids"):
+        chunk_id = doc["metadata"].get("chunk_id")
+        return {chunk_id} if chunk_id in item["expected_chunk_ids"] else set()
+    if item.get("source") and doc["metadata"].get("source") != item["source"]:
+        return set()
+    return chunk_articles(doc) & set(item["expected_articles"])
+
+def score_ranking(item: Dict[str, Any], documents: List[Dict[str, Any]], k: int) -> Dict[str, float]:
+    """
+    Recall@k, reciprocal rank and nDCG@k of one ranking
+    
+    A chunk is relevant when it covers an expected chunk or article not
+    already covered by a higher-ranked chunk, so several chunks of the same
+    article count once.
+    """
+    targets = set(item.get("expected_chunk_ids") or item["expected_articles"])
+    covered: Set[Any] = set()
+    reciprocal_rank = 0.0
+    dcg = 0.0
+    for rank, doc in enumerate(documents[:k], 1):
+        new = matched_targets(item, doc) - covered
+        if new:
+            covered |= new
+            dcg += 1 / np.log2(rank + 1)
+            if not reciprocal_rank:
+                reciprocal_rank = 1 / rank
+    ideal = sum(1 / np.log2(rank + 1) for rank in range(1, min(len(targets), k) + 1))
+    return {
+        "recall": len(covered) / len(targets),
+        "mrr": reciprocal_rank,
+        "ndcg": dcg / ideal if ideal else 0.0
+    }
+
+class EmbeddingCache:
+    """Chunk embeddings by content hash, shared across chunking configurations"""
+    
+    def __init__(self, embeddings_manager: EmbeddingsManager, batch_size: int):
+        self.embeddings_manager = embeddings_manager
+        self.batch_size = batch_size
+        self.vectors: Dict[str, List[float]] = {}
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    
+    def embed(self, chunks: List[Dict[str, Any]]) -> Dict[str, List[float]]:
+        """Return embeddings by chunk_id, encoding only texts not seen before"""
+        missing = list({
+            self._key(chunk["text"]): chunk["text"]
+            for chunk in chunks
+            if self._key(chunk["text"]) not in self.vectors
+        }.items())
+        self.misses += len(missing)
+        self.hits += len(chunks) - len(missing)
+        
+        model = self.embeddings_manager.embedding_model
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            for (key, _), vector in zip(batch, model.embed_documents([text for _, text in batch])):
+                self.vectors[key] = vector
+        
+        return {chunk["metadata"]["chunk_id"]: self.vectors[self._key(chunk["text"])] for chunk in chunks}
+
+def use_collection(embeddings_manager: EmbeddingsManager, collection_name: str) -> None:
+    """Point the manager at a fresh collection in its vector store directory"""
+    embeddings_manager.collection_name = collection_name
+    embeddings_manager.vector_store = embeddings_manager.get_or_create_vector_store()
+    embeddings_manager.index_version += 1
+
+def evaluate_config(
+    pipeline: RAGPipeline,
+    golden: List[Dict[str, Any]],
+    query_embeddings: List[List[float]],
+    k_values: List[int]
+) -> List[Dict[str, Any]]:
+    """Retrieve every question once at the largest k and score each k on prefixes"""
+    max_k = k_values[-1]
+    rankings = []
+    latencies = []
+    for item, query_embedding in zip(golden, query_embeddings):
+        start = time.perf_counter()
+        rankings.append(pipeline.retriever.retrieve_documents(
+            item["question"],
+            k=max_k,
+            query_embedding=query_embedding,
+            min_score=None,
+            mode="similarity"
+        ))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    
+    results = []
+    for k in k_values:
+        scores = [score_ranking(item, documents, k) for item, documents in zip(golden, rankings)]
+        prompt_tokens = [
+            pipeline._build_prompt(item["question"], documents[:k])[2]["prompt_tokens"]
+            for item, documents in zip(golden, rankings)
+        ]
+        results.append({
+            "k": k,
+            "recall": float(np.mean([score["recall"] for score in scores])),
+            "mrr": float(np.mean([score["mrr"] for score in scores])),
+            "ndcg": float(np.mean([score["ndcg"] for score in scores])),
+            "prompt_tokens": float(np.mean(prompt_tokens)),
+            # Search latency is for the single retrieval at max_k
+            "search_p50_ms": latencies[len(latencies) // 2] * 1000,
+            "search_p95_ms": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000
+        })
+    return results
+
+def main():
+    args = parse_args()
+    golden = load_golden(args.golden)
+    chunk_sizes = parse_ints(args.chunk_sizes)
+    chunk_overlaps = parse_ints(args.chunk_overlaps)
+    k_values = parse_ints(args.k)
+    print(f"📋 Loaded {len(golden)} golden questions from {args.golden}")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"🔤 Initializing embeddings manager with model {args.embedding_model}")
+        embeddings_manager = EmbeddingsManager(
+            embedding_model_name=args.embedding_model,
+            vector_store_path=os.path.join(tmp_dir, "vectorstore")
+        )
+        cache = EmbeddingCache(embeddings_manager, args.batch_size)
+        pipeline = RAGPipeline(
+            retriever=DocumentRetriever(embeddings_manager),
+            llm=FakeChatModel(),
+            context_builder=ContextBuilder(TokenCounter(settings.MODEL_NAME), token_budget=args.token_budget)
+        )
+        
+        # Questions are embedded once for the whole sweep
+        query_embeddings = embeddings_manager.encode_queries([item["question"] for item in golden])
+        
+        results = []
+        for chunk_size, chunk_overlap in product(chunk_sizes, chunk_overlaps):
+            if chunk_overlap >= chunk_size:
+                continue
+            document_processor = DocumentProcessor(
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                raw_dir=args.pdf_dir,
+                processed_dir=os.path.join(tmp_dir, "processed"),
+                chunking_strategy=args.chunking_strategy
+            )
+            all_chunks = document_processor.process_all_pdfs(workers=args.workers)
+            chunks = [chunk for file_chunks in all_chunks.values() for chunk in file_chunks]
+            
+            use_collection(embeddings_manager, f"eval_{chunk_size}_{chunk_overlap}")
+            embeddings_manager.add_documents(chunks, batch_size=args.batch_size, embeddings=cache.embed(chunks))
+            
+            for result in evaluate_config(pipeline, golden, query_embeddings, k_values):
+                results.append({
+                    "chunk_size": chunk_size,
+                    "chunk_overlap": chunk_overlap,
+                    "chunks": len(chunks),
+                    **result
+                })
+        
+        embeddings_manager.executor.shutdown(wait=False)
+    
+    print(f"🧠 Embedded {cache.misses} chunks, reused {cache.hits} cached embeddings")
+    print(
+        f"{'size':>6}{'overlap':>9}{'chunks':>8}{'k':>4}{'recall':>8}{'MRR':>7}{'nDCG':>7}"
+        f"{'tokens':>8}{'p50 ms':>8}{'p95 ms':>8}"
+    )
+    for result in results:
+        print(
+            f"{result['chunk_size']:>6}{result['chunk_overlap']:>9}{result['chunks']:>8}{result['k']:>4}"
+            f"{result['recall']:>8.3f}{result['mrr']:>7.3f}{result['ndcg']:>7.3f}"
+            f"{result['prompt_tokens']:>8.0f}{result['search_p50_ms']:>8.1f}{result['search_p95_ms']:>8.1f}"
+        )
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved results to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Export the embedding model to ONNX for the onnx embedding backend
+
+Writes model.onnx (fp32) and, with --quantize, model.int8.onnx (dynamic
+int8 quantization of the weights) together with the tokenizer and pooling
+settings, then checks that the exported models reproduce the torch
+sentence-transformers embeddings. Exporting needs torch, transformers,
+sentence-transformers and onnx; serving the exported model needs only
+onnxruntime and transformers.
+"""
+
+import argparse
+import os
+import sys
+import glob
+import json
+import time
+from typing import List
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import app modules
+from app.rag.onnx_embeddings import OnnxEmbeddings, MODEL_FILENAME, QUANTIZED_MODEL_FILENAME, CONFIG_FILENAME
+from app.config import settings
+
+SAMPLE_SENTENCES = [
+    "Sinh viên phải hoàn thành tối thiểu 120 tín chỉ để được xét tốt nghiệp.",
+    "Điểm trung bình tích lũy đạt từ 2,00 trở lên theo thang điểm 4.",
+    "Sinh viên được đăng ký học lại các học phần có điểm F.",
+    "Thời gian tối đa hoàn thành khóa học không vượt quá hai lần thời gian thiết kế.",
+    "Phòng Đào tạo xem xét đơn xin nghỉ học tạm thời của sinh viên.",
+    "Kết quả thi được công bố chậm nhất hai tuần sau ngày thi.",
+    "Sinh viên bị cảnh báo học tập nếu điểm trung bình học kỳ dưới 1,00.",
+    "Điều kiện chuyển ngành đào tạo trong cùng một trường.",
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX")
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=settings.EMBEDDING_MODEL_NAME,
+        help="sentence-transformers model to export"
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=settings.ONNX_MODEL_DIR,
+        help="Directory for the ONNX models and tokenizer"
+    )
+    parser.add_argument(
+        "--opset",
+        type=int,
+        default=14,
+        help="ONNX opset version"
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Also write a dynamically int8-quantized model"
+    )
+    parser.add_argument(
+        "--skip_export",
+        action="store_true",
+        help="Only run the parity check against an existing export"
+    )
+    parser.add_argument(
+        "--parity_samples",
+        type=int,
+        default=256,
+        help="Chunks from the processed directory to compare (built-in sentences if none)"
+    )
+    parser.add_argument(
+        "--min_cosine",
+        type=float,
+        default=0.99,
+        help="Fail if any fp32 embedding has a lower cosine similarity to the torch one"
+    )
+    parser.add_argument(
+        "--min_cosine_int8",
+        type=float,
+        default=0.95,
+        help="Fail if any int8 embedding has a lower cosine similarity to the torch one"
+    )
+    return parser.parse_args()
+
+def export(model_name: str, output_dir: str, opset: int) -> None:
+    """Export the transformer of a sentence-transformers model and save its tokenizer and pooling"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model[0].tokenizer
+    pooling = model[1].get_pooling_mode_str()
+    
+    class HiddenStates(torch.nn.Module):
+        """Return only last_hidden_state so pooling happens outside the graph"""
+        
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+        
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.inner(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids
+            ).last_hidden_state
+    
+    sample = tokenizer(SAMPLE_SENTENCES[:2], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    
+    os.makedirs(output_dir, exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            HiddenStates(transformer),
+            tuple(sample[name] for name in input_names),
+            os.path.join(output_dir, MODEL_FILENAME),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+    
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, CONFIG_FILENAME), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "pooling": pooling,
+            "max_length": model.max_seq_length
+        }, f, indent=2)
+    print(f"📦 Exported {model_name} to {os.path.join(output_dir, MODEL_FILENAME)} ({pooling} pooling)")
+
+def quantize(output_dir: str) -> None:
+    """Quantize the weights of the fp32 model to int8"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    
+    quantize_dynamic(
+        os.path.join(output_dir, MODEL_FILENAME),
+        os.path.join(output_dir, QUANTIZED_MODEL_FILENAME),
+        weight_type=QuantType.QInt8
+    )
+    print(f"🗜️ Wrote {os.path.join(output_dir, QUANTIZED_MODEL_FILENAME)}")
+
+def load_samples(count: int) -> List[str]:
+    """Processed chunk texts, so parity is checked on real inputs"""
+    texts = []
+    for path in sorted(glob.glob(os.path.join(settings.PROCESSED_DATA_DIR, "*_chunks.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            texts.extend(chunk["text"] for chunk in json.load(f))
+        if len(texts) >= count:
+            break
+    return texts[:count] or SAMPLE_SENTENCES
+
+def reference_embeddings(model_name: str, texts: List[str]) -> np.ndarray:
+    """Embeddings of the torch backend, normalized as in EmbeddingsManager"""
+    from sentence_transformers import SentenceTransformer
+    
+    return SentenceTransformer(model_name, device="cpu").encode(
+        texts, batch_size=32, normalize_embeddings=True
+    )
+
+def check_parity(
+    reference: np.ndarray,
+    output_dir: str,
+    texts: List[str],
+    quantized: bool,
+    min_cosine: float
+) -> bool:
+    """Compare ONNX embeddings with the torch embeddings of the same texts"""
+    start = time.perf_counter()
+    candidate = np.array(OnnxEmbeddings(output_dir, quantized=quantized).embed_documents(texts))
+    elapsed = time.perf_counter() - start
+    
+    cosine = (reference * candidate).sum(axis=1)
+    
+    # Nearest-neighbour agreement: does each text keep the same top-5 neighbours?
+    k = min(5, len(texts) - 1)
+    agreement = 1.0
+    if k > 0:
+        ref_neighbours = np.argsort(-(reference @ reference.T), axis=1)[:, 1:k + 1]
+        onnx_neighbours = np.argsort(-(candidate @ candidate.T), axis=1)[:, 1:k + 1]
+        agreement = float(np.mean([
+            len(set(a) & set(b)) / k for a, b in zip(ref_neighbours, onnx_neighbours)
+        ]))
+    
+    passed = float(cosine.min()) >= min_cosine
+    print(
+        f"{'✅' if passed else '❌'} {'int8' if quantized else 'fp32'}: cosine min {cosine.min():.4f}, "
+        f"mean {cosine.mean():.4f}, top-{k} neighbour agreement {agreement:.3f} "
+        f"({len(texts)} texts in {elapsed:.1f}s)"
+    )
+    return passed
+
+def main():
+    args = parse_args()
+    
+    if not args.skip_export:
+        export(args.model, args.output_dir, args.opset)
+        if args.quantize:
+            quantize(args.output_dir)
+    
+    texts = load_samples(args.parity_samples)
+    reference = reference_embeddings(args.model, texts)
+    passed = check_parity(reference, args.output_dir, texts, quantized=False, min_cosine=args.min_cosine)
+    if os.path.exists(os.path.join(args.output_dir, QUANTIZED_MODEL_FILENAME)):
+        passed &= check_parity(reference, args.output_dir, texts, quantized=True, min_cosine=args.min_cosine_int8)
+    
+    if not passed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
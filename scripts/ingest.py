@@ -7,6 +7,7 @@ import argparse
 import os
 import sys
 import json
+import time
 from typing import List, Dict, Any, Optional
 
 # Add parent directory to path
@@ -15,6 +16,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 # Import app modules
 from app.rag.document_processor import DocumentProcessor
 from app.rag.embeddings import EmbeddingsManager
+from app.rag.lexical_index import BM25Index
 from app.config import settings
 
 def parse_args():
@@ -49,6 +51,13 @@ def parse_args():
         default=settings.CHUNK_OVERLAP,
         help="Overlap between chunks"
     )
+    parser.add_argument(
+        "--chunking_strategy",
+        type=str,
+        choices=["recursive", "regulation"],
+        default=settings.CHUNKING_STRATEGY,
+        help="Chunking strategy"
+    )
     parser.add_argument(
         "--embedding_model", 
         type=str, 
@@ -60,74 +69,135 @@ def parse_args():
         type=str, 
         help="Process a specific file (optional)"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.INGEST_WORKERS,
+        help="Number of processes for PDF extraction and chunking"
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=settings.EMBED_BATCH_SIZE,
+        help="Number of chunks embedded per batch"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-process files even if unchanged since the last run"
+    )
+    parser.add_argument(
+        "--no_embedding_cache",
+        action="store_true",
+        help="Embed every new chunk with the model instead of reusing cached embeddings"
+    )
     return parser.parse_args()
 
 def main():
     args = parse_args()
+    start_time = time.perf_counter()
     
-    print(f"🔍 Initializing document processor with chunk size {args.chunk_size} and overlap {args.chunk_overlap}")
+    print(
+        f"🔍 Initializing document processor with {args.chunking_strategy} chunking, "
+        f"chunk size {args.chunk_size} and overlap {args.chunk_overlap}"
+    )
     
     # Initialize document processor
     document_processor = DocumentProcessor(
         chunk_size=args.chunk_size,
         chunk_overlap=args.chunk_overlap,
         raw_dir=args.pdf_dir,
-        processed_dir=args.processed_dir
+        processed_dir=args.processed_dir,
+        chunking_strategy=args.chunking_strategy
     )
     
-    print(f"🔤 Initializing embeddings manager with model {args.embedding_model}")
-    
-    # Initialize embeddings manager
-    embeddings_manager = EmbeddingsManager(
-        embedding_model_name=args.embedding_model,
-        vector_store_path=args.vector_store_dir
-    )
-    
-    # Process documents
+    # Select files to process
     if args.file:
         if not os.path.exists(os.path.join(args.pdf_dir, args.file)):
             print(f"❌ File {args.file} not found in {args.pdf_dir}")
             return
-        
-        print(f"📄 Processing file: {args.file}")
-        chunks = document_processor.process_pdf(args.file)
-        
-        if not chunks:
-            print(f"❌ Failed to process {args.file}")
-            return
-        
-        document_processor.save_chunks({args.file: chunks})
-        
-        print(f"✅ Processed {len(chunks)} chunks from {args.file}")
-        print(f"💾 Saved chunks to {args.processed_dir}")
-        
-        print(f"🧠 Adding chunks to vector store")
-        embeddings_manager.add_documents(chunks)
-        
-        print(f"✅ Added {len(chunks)} chunks to vector store")
+        filenames = [args.file]
     else:
-        print(f"📚 Processing all PDF files in {args.pdf_dir}")
-        
-        all_chunks = document_processor.process_all_pdfs()
-        
-        if not all_chunks:
-            print(f"❌ No PDF files found or failed to process files in {args.pdf_dir}")
+        filenames = document_processor.list_pdfs()
+        if not filenames:
+            print(f"❌ No PDF files found in {args.pdf_dir}")
             return
-        
-        document_processor.save_chunks(all_chunks)
-        
-        total_chunks = sum(len(chunks) for chunks in all_chunks.values())
-        print(f"✅ Processed {total_chunks} chunks from {len(all_chunks)} files")
-        print(f"💾 Saved chunks to {args.processed_dir}")
-        
-        print(f"🧠 Adding chunks to vector store")
-        
-        for doc_chunks in all_chunks.values():
-            embeddings_manager.add_documents(doc_chunks)
-        
-        print(f"✅ Added {total_chunks} chunks to vector store")
-    
-    print("🎉 Done!")
+    
+    # Skip files whose content and chunking params are unchanged
+    manifest = document_processor.load_manifest()
+    if not args.force:
+        changed = document_processor.find_changed_pdfs(manifest, filenames)
+        skipped = len(filenames) - len(changed)
+        if skipped:
+            print(f"⏭️  Skipping {skipped} unchanged file(s)")
+        filenames = changed
+    
+    if not filenames:
+        print(f"✅ Nothing to do, all files are up to date ({time.perf_counter() - start_time:.1f}s)")
+        return
+    
+    print(f"📚 Processing {len(filenames)} file(s) with {args.workers} worker(s)")
+    all_chunks = document_processor.process_all_pdfs(filenames=filenames, workers=args.workers)
+    
+    if not all_chunks:
+        print(f"❌ Failed to process files in {args.pdf_dir}")
+        return
+    
+    document_processor.save_chunks(all_chunks)
+    
+    total_chunks = sum(len(chunks) for chunks in all_chunks.values())
+    print(f"✅ Processed {total_chunks} chunks from {len(all_chunks)} files")
+    print(f"💾 Saved chunks to {args.processed_dir}")
+    
+    print(f"🔤 Initializing embeddings manager with model {args.embedding_model} ({settings.EMBEDDING_BACKEND} backend)")
+    
+    # Initialize embeddings manager only when there is something to embed
+    embeddings_manager = EmbeddingsManager(
+        embedding_model_name=args.embedding_model,
+        vector_store_path=args.vector_store_dir,
+        embedding_backend=settings.EMBEDDING_BACKEND,
+        embedding_options=settings.embedding_options,
+        vector_store_backend=settings.VECTOR_STORE_BACKEND,
+        vector_store_options=settings.vector_store_options,
+        chunk_cache_path=None if args.no_embedding_cache else settings.chunk_cache_path,
+        chunk_cache_max_entries=settings.CHUNK_EMBEDDING_CACHE_MAX_ENTRIES,
+        # Running API workers pick up the new chunks
+        index_version_path=settings.INDEX_VERSION_PATH
+    )
+    
+    print(f"🧠 Upserting chunks into vector store in batches of {args.batch_size}")
+    
+    # Embed new chunks across documents in large fixed-size batches;
+    # unchanged chunks keep their stored embeddings
+    counts = embeddings_manager.upsert_documents(
+        [chunk for chunks in all_chunks.values() for chunk in chunks],
+        batch_size=args.batch_size
+    )
+    
+    print(
+        f"✅ Vector store updated: {counts['added']} added, "
+        f"{counts['deleted']} deleted, {counts['unchanged']} unchanged"
+    )
+    
+    if embeddings_manager.chunk_cache is not None:
+        cache_stats = embeddings_manager.chunk_cache.stats()
+        print(
+            f"🗃️  Embedding cache: {cache_stats['hits']} of {cache_stats['hits'] + cache_stats['misses']} "
+            f"unique texts reused ({cache_stats['hit_rate']:.1%} hit rate), {cache_stats['entries']} entries "
+            f"({cache_stats['size_mb']:.1f} MB), {cache_stats['evicted']} evicted"
+        )
+    
+    # Record processed files only once their chunks are in the vector store
+    for filename, chunks in all_chunks.items():
+        manifest[filename] = document_processor.manifest_entry(filename, chunk_count=len(chunks))
+    document_processor.save_manifest(manifest)
+    
+    # Rebuild the lexical index now so API startup can load it directly
+    if args.processed_dir == settings.PROCESSED_DATA_DIR:
+        lexical_index = BM25Index.load_or_build(args.processed_dir, settings.LEXICAL_INDEX_PATH)
+        print(f"🔎 Lexical index rebuilt with {len(lexical_index)} chunks")
+    
+    print(f"🎉 Done in {time.perf_counter() - start_time:.1f}s!")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Copy the stored chunks from one vector store backend to another
+
+Embeddings are copied as stored, so switching VECTOR_STORE_BACKEND does
+not require re-embedding the corpus (or loading the embedding model).
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import app modules
+from app.rag.vector_store import VECTOR_STORE_BACKENDS, create_vector_store
+from app.config import settings
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Copy chunks between vector store backends")
+    parser.add_argument(
+        "--source",
+        type=str,
+        choices=VECTOR_STORE_BACKENDS,
+        default="chroma",
+        help="Backend to read from"
+    )
+    parser.add_argument(
+        "--target",
+        type=str,
+        choices=VECTOR_STORE_BACKENDS,
+        default="numpy",
+        help="Backend to write to"
+    )
+    parser.add_argument(
+        "--vector_store_dir",
+        type=str,
+        default=settings.VECTOR_STORE_DIR,
+        help="Vector store directory"
+    )
+    parser.add_argument(
+        "--collection",
+        type=str,
+        default="university_regulations",
+        help="Collection to copy"
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=5000,
+        help="Chunks per write"
+    )
+    return parser.parse_args()
+
+def backend_options(backend: str):
+    """Configured options apply to the configured backend only; others use their defaults"""
+    return settings.vector_store_options if backend == settings.VECTOR_STORE_BACKEND else {}
+
+def main():
+    args = parse_args()
+    if args.source == args.target:
+        print("❌ Source and target backends are the same")
+        sys.exit(1)
+    
+    start_time = time.perf_counter()
+    source = create_vector_store(
+        args.source, args.vector_store_dir, args.collection, None, **backend_options(args.source)
+    )
+    target = create_vector_store(
+        args.target, args.vector_store_dir, args.collection, None, **backend_options(args.target)
+    )
+    
+    ids = source.get_ids()
+    print(f"📦 Copying {len(ids)} chunks from {args.source} to {args.target}")
+    
+    # One write per batch: each numpy store write creates a new generation
+    for start in range(0, len(ids), args.batch_size):
+        chunks = source.get(ids[start:start + args.batch_size], include_embeddings=True)
+        target.upsert(
+            ids=list(chunks),
+            embeddings=[chunk["embedding"] for chunk in chunks.values()],
+            texts=[chunk["text"] for chunk in chunks.values()],
+            metadatas=[chunk["metadata"] for chunk in chunks.values()]
+        )
+    target.persist()
+    
+    print(f"🎉 {target.count()} chunks in the {args.target} store ({time.perf_counter() - start_time:.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import unicodedata
+
+import numpy as np
+import pytest
+
+from app.rag import cache as cache_module
+from app.rag.cache import AnswerCache, normalize_query
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for TTL tests"""
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+def test_normalize_query():
+    assert normalize_query("  Điều kiện   TỐT NGHIỆP? ") == "điều kiện tốt nghiệp"
+    # NFD input is composed before comparing
+    assert normalize_query("nghiệp") == normalize_query("nghiệp")
+
+def test_exact_hit_matches_normalized_query():
+    cache = AnswerCache()
+    cache.set("Điều kiện tốt nghiệp?", None, 3, 0, unit(1, 0), {"answer": "A"})
+    
+    assert cache.get_exact("điều kiện   tốt nghiệp", None, 3, 0) == {"answer": "A"}
+    assert cache.get_exact("điều kiện tốt nghiệp", "quy_che.pdf", 3, 0) is None
+    assert cache.get_exact("điều kiện tốt nghiệp", None, 5, 0) is None
+    assert cache.stats()["exact_hits"] == 1
+
+def test_returned_result_is_a_copy():
+    cache = AnswerCache()
+    cache.set("q", None, 3, 0, unit(1, 0), {"answer": "A"})
+    cache.get_exact("q", None, 3, 0)["answer"] = "changed"
+    
+    assert cache.get_exact("q", None, 3, 0) == {"answer": "A"}
+
+def test_semantic_hit_above_threshold_only():
+    cache = AnswerCache(similarity_threshold=0.95)
+    cache.set("học phí", None, 3, 0, unit(1, 0, 0), {"answer": "A"})
+    
+    assert cache.get_semantic(unit(1, 0.1, 0), None, 3, 0) == {"answer": "A"}
+    assert cache.get_semantic(unit(1, 1, 0), None, 3, 0) is None
+    stats = cache.stats()
+    assert stats["semantic_hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+def test_semantic_lookup_requires_same_filter_and_k():
+    cache = AnswerCache()
+    cache.set("học phí", "a.pdf", 3, 0, unit(1, 0), {"answer": "A"})
+    
+    assert cache.get_semantic(unit(1, 0), "b.pdf", 3, 0) is None
+    assert cache.get_semantic(unit(1, 0), "a.pdf", 5, 0) is None
+    assert cache.get_semantic(unit(1, 0), "a.pdf", 3, 0) == {"answer": "A"}
+
+def test_entries_expire_after_ttl(clock):
+    cache = AnswerCache(ttl_seconds=60)
+    cache.set("q1", None, 3, 0, unit(1, 0), {"answer": "A"})
+    cache.set("q2", None, 3, 0, unit(0, 1), {"answer": "B"})
+    
+    clock[0] += 59
+    assert cache.get_exact("q1", None, 3, 0) == {"answer": "A"}
+    
+    clock[0] += 2
+    assert cache.get_exact("q1", None, 3, 0) is None
+    assert cache.get_semantic(unit(0, 1), None, 3, 0) is None
+    stats = cache.stats()
+    assert stats["expirations"] == 2
+    assert stats["size"] == 0
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnswerCache(max_size=2)
+    cache.set("q1", None, 3, 0, unit(1, 0, 0), {"answer": "1"})
+    cache.set("q2", None, 3, 0, unit(0, 1, 0), {"answer": "2"})
+    # Using q1 makes q2 the least recently used
+    assert cache.get_exact("q1", None, 3, 0) is not None
+    cache.set("q3", None, 3, 0, unit(0, 0, 1), {"answer": "3"})
+    
+    assert cache.get_exact("q2", None, 3, 0) is None
+    assert cache.get_exact("q1", None, 3, 0) == {"answer": "1"}
+    assert cache.get_exact("q3", None, 3, 0) == {"answer": "3"}
+    assert cache.stats()["evictions"] == 1
+
+def test_index_version_change_drops_entries():
+    cache = AnswerCache()
+    cache.set("q", None, 3, 0, unit(1, 0), {"answer": "A"})
+    
+    assert cache.get_exact("q", None, 3, 1) is None
+    assert cache.get_semantic(unit(1, 0), None, 3, 1) is None
+    stats = cache.stats()
+    assert stats["invalidations"] == 1
+    assert stats["size"] == 0
+
+def test_answer_generated_before_an_index_change_is_not_cached():
+    cache = AnswerCache()
+    cache.get_exact("q", None, 3, 2)
+    cache.set("q", None, 3, 1, unit(1, 0), {"answer": "stale"})
+    
+    assert cache.get_exact("q", None, 3, 2) is None
+    assert cache.stats()["size"] == 0
+
+def test_clear():
+    cache = AnswerCache()
+    cache.set("q", None, 3, 0, unit(1, 0), {"answer": "A"})
+    cache.clear()
+    
+    assert cache.get_exact("q", None, 3, 0) is None
@@ -0,0 +1,105 @@
+import sys
+
+import pytest
+
+from app.rag.context_builder import (
+    CHARS_PER_TOKEN_ESTIMATE,
+    ContextBuilder,
+    TokenCounter,
+    chunk_position,
+    join_chunks,
+)
+
+@pytest.fixture
+def counter(monkeypatch):
+    """TokenCounter on the length estimate, as when tiktoken is not installed"""
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+    return TokenCounter()
+
+def chunk(document_id, index, text, **metadata):
+    metadata = {"chunk_id": f"{document_id}_chunk_{index}", "source": f"{document_id}.pdf", **metadata}
+    return {"text": text, "metadata": metadata}
+
+def test_estimate_without_tiktoken(counter):
+    assert counter.encoding is None
+    assert counter.count("a" * CHARS_PER_TOKEN_ESTIMATE * 4) == 4
+    # Rounds up
+    assert counter.count("a" * (CHARS_PER_TOKEN_ESTIMATE * 4 + 1)) == 5
+    assert counter.truncate("a" * 100, 2) == "a" * CHARS_PER_TOKEN_ESTIMATE * 2
+    assert counter.truncate("abc", 0) == ""
+
+def test_chunk_position():
+    assert chunk_position(chunk("quy_che", 3, "x")) == ("quy_che", 3)
+    assert chunk_position({"text": "x", "metadata": {"chunk_id": "random-id"}}) is None
+
+def test_join_chunks_drops_overlap_and_repeated_heading():
+    assert join_chunks("sinh viên phải đóng học phí đúng hạn", "đóng học phí đúng hạn mỗi học kỳ") == \
+        "sinh viên phải đóng học phí đúng hạn mỗi học kỳ"
+    assert join_chunks("Điều 5. Học phí\n1. Khoản một", "Điều 5. Học phí\n2. Khoản hai") == \
+        "Điều 5. Học phí\n1. Khoản một\n2. Khoản hai"
+
+def test_adjacent_chunks_are_merged_in_document_order(counter):
+    builder = ContextBuilder(token_counter=counter, token_budget=1000)
+    documents = [
+        chunk("a", 2, "đoạn thứ ba của văn bản", page_start=3, page_end=3),
+        chunk("b", 0, "văn bản khác hoàn toàn"),
+        chunk("a", 1, "đoạn thứ hai của văn bản", page_start=2, page_end=2),
+    ]
+    
+    context, used, usage = builder.build(documents)
+    
+    assert [block["text"] for block in used] == [
+        "đoạn thứ hai của văn bản\nđoạn thứ ba của văn bản",
+        "văn bản khác hoàn toàn",
+    ]
+    merged = used[0]["metadata"]
+    assert merged["chunk_ids"] == ["a_chunk_1", "a_chunk_2"]
+    assert (merged["page_start"], merged["page_end"]) == (2, 3)
+    assert context.index("TRÍCH DẪN #1 (Nguồn: a.pdf)") < context.index("TRÍCH DẪN #2 (Nguồn: b.pdf)")
+    assert usage["retrieved_chunks"] == 3
+    assert usage["context_blocks"] == 2
+
+def test_duplicates_are_dropped(counter):
+    builder = ContextBuilder(token_counter=counter, token_budget=1000)
+    documents = [
+        chunk("a", 0, "quy định về điều kiện tốt nghiệp của sinh viên"),
+        chunk("a", 0, "quy định về điều kiện tốt nghiệp của sinh viên"),
+        # Same text from another document, with different whitespace
+        chunk("b", 5, "điều kiện  tốt nghiệp"),
+    ]
+    
+    _, used, _ = builder.build(documents)
+    
+    assert len(used) == 1
+    assert used[0]["metadata"]["chunk_id"] == "a_chunk_0"
+
+def test_context_stays_within_token_budget(counter):
+    builder = ContextBuilder(token_counter=counter, token_budget=100, min_partial_tokens=20)
+    documents = [chunk(f"d{i}", 0, f"văn bản {i} " + "x" * 150) for i in range(4)]
+    
+    context, used, usage = builder.build(documents)
+    
+    assert usage["context_tokens"] <= 100
+    assert counter.count(context) <= 100
+    assert usage["context_blocks"] == len(used) == 2
+    # The second block is cut to the space that was left
+    assert usage["truncated_blocks"] == 1
+    assert used[1]["text"] == documents[1]["text"][:len(used[1]["text"])]
+
+def test_block_is_skipped_when_too_little_budget_is_left(counter):
+    builder = ContextBuilder(token_counter=counter, token_budget=80, min_partial_tokens=30)
+    documents = [chunk("a", 0, "x" * 150), chunk("b", 0, "y" * 150)]
+    
+    _, used, usage = builder.build(documents)
+    
+    assert [block["metadata"]["chunk_id"] for block in used] == ["a_chunk_0"]
+    assert usage["truncated_blocks"] == 0
+
+def test_first_block_is_truncated_rather_than_dropped(counter):
+    builder = ContextBuilder(token_counter=counter, token_budget=40, min_partial_tokens=64)
+    
+    context, used, usage = builder.build([chunk("a", 0, "x" * 1000)])
+    
+    assert len(used) == 1
+    assert usage["truncated_blocks"] == 1
+    assert counter.count(context) <= 40
@@ -0,0 +1,82 @@
+import json
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from app.rag.embedding_server import FRAME_HEADER, RemoteEmbeddings, _frame
+
+def recv_exactly(conn, length):
+    buffer = b""
+    while len(buffer) < length:
+        chunk = conn.recv(length - len(buffer))
+        if not chunk:
+            return None
+        buffer += chunk
+    return buffer
+
+class FakeServer:
+    """Answers info; on_embed(n) tells what to do with the nth embed request: reply, stall or close"""
+    
+    def __init__(self, path, on_embed):
+        self.on_embed = on_embed
+        self.embed_requests = 0
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen()
+        threading.Thread(target=self._accept, daemon=True).start()
+    
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+    
+    def _serve(self, conn):
+        with conn:
+            while True:
+                header = recv_exactly(conn, FRAME_HEADER.size)
+                if header is None:
+                    return
+                request = json.loads(recv_exactly(conn, FRAME_HEADER.unpack(header)[0]))
+                if request["op"] == "info":
+                    conn.sendall(_frame(json.dumps({"model_key": "m"}).encode()))
+                    continue
+                self.embed_requests += 1
+                action = self.on_embed(self.embed_requests)
+                if action == "close":
+                    return
+                if action == "stall":
+                    continue
+                vectors = np.ones((len(request["texts"]), 2), dtype=np.float32)
+                conn.sendall(_frame(json.dumps({"count": len(vectors), "dim": 2}).encode()))
+                conn.sendall(_frame(vectors.tobytes()))
+    
+    def close(self):
+        self.listener.close()
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return str(tmp_path / "embeddings.sock")
+
+def test_request_is_resent_once_after_the_connection_drops(socket_path):
+    server = FakeServer(socket_path, lambda n: "close" if n == 1 else "reply")
+    remote = RemoteEmbeddings(socket_path, model_key="m", timeout=5)
+    
+    assert remote.embed_documents(["a", "b"]) == [[1.0, 1.0], [1.0, 1.0]]
+    assert server.embed_requests == 2
+    server.close()
+
+def test_timed_out_request_is_not_resent(socket_path):
+    server = FakeServer(socket_path, lambda n: "stall" if n == 1 else "reply")
+    remote = RemoteEmbeddings(socket_path, model_key="m", timeout=0.2)
+    
+    with pytest.raises(socket.timeout):
+        remote.embed_documents(["a"])
+    assert server.embed_requests == 1
+    # The next request uses a new connection, not the one with the late reply
+    assert remote.embed_documents(["b"]) == [[1.0, 1.0]]
+    server.close()
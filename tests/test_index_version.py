@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import threading
+
+from app.rag.embeddings import EmbeddingsManager
+from app.rag.index_version import IndexVersion
+
+def bump_in_another_process(path):
+    subprocess.run(
+        [sys.executable, "-c", f"from app.rag.index_version import IndexVersion; IndexVersion({path!r}).bump()"],
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+
+def test_bump_is_seen_by_other_readers(tmp_path):
+    path = str(tmp_path / "index_version")
+    reader = IndexVersion(path)
+    assert reader.value == 0
+    
+    assert IndexVersion(path).bump() == 1
+    assert reader.value == 1
+    bump_in_another_process(path)
+    assert reader.value == 2
+    assert reader.bump() == 3
+
+def manager_sharing(path):
+    """EmbeddingsManager with only its change tracking, without a model or vector store"""
+    manager = EmbeddingsManager.__new__(EmbeddingsManager)
+    manager.shared_index_version = IndexVersion(path)
+    manager._local_index_version = 0
+    manager._seen_index_version = manager.shared_index_version.value
+    manager._index_version_lock = threading.Lock()
+    manager.listeners = []
+    return manager
+
+def test_change_in_another_process_notifies_reload_once(tmp_path):
+    path = str(tmp_path / "index_version")
+    writer, reader = manager_sharing(path), manager_sharing(path)
+    writer_events, reader_events = [], []
+    writer.add_listener(lambda event, payload: writer_events.append(event))
+    reader.add_listener(lambda event, payload: reader_events.append(event))
+    
+    writer._notify("add", [])
+    assert writer.index_version == 1
+    assert writer_events == ["add"]
+    
+    assert reader.index_version == 1
+    assert reader.index_version == 1
+    assert reader_events == ["reload"]
+    
+    bump_in_another_process(path)
+    assert writer.index_version == 2
+    assert writer_events == ["add", "reload"]
@@ -0,0 +1,203 @@
+import os
+import subprocess
+import sys
+import time
+
+import fitz
+import pytest
+
+from app.rag.document_processor import DocumentProcessor
+from app.rag.job_queue import JobQueue, IngestionWorker, _init_worker
+
+@pytest.fixture
+def jobs(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite"))
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+def test_job_moves_through_states(jobs):
+    job = jobs.enqueue("a.pdf", "a", sha256="abc")
+    assert job["state"] == "queued"
+    assert jobs.find_pending("abc")["id"] == job["id"]
+    
+    claimed = jobs.claim_next()
+    assert claimed["id"] == job["id"]
+    assert claimed["state"] == "extracting"
+    assert claimed["attempts"] == 1
+    assert claimed["owner_pid"] == os.getpid()
+    assert jobs.claim_next() is None
+    
+    jobs.update(job["id"], state="embedding", timings={"extract_s": 1.0})
+    jobs.update(job["id"], state="done", progress=1.0, timings={"embed_s": 2.0})
+    done = jobs.get(job["id"])
+    assert done["state"] == "done"
+    assert done["timings"] == {"extract_s": 1.0, "embed_s": 2.0}
+    assert jobs.find_pending("abc") is None
+    assert jobs.counts()["done"] == 1
+
+def test_jobs_are_claimed_oldest_first(jobs):
+    first = jobs.enqueue("a.pdf", "a")
+    second = jobs.enqueue("b.pdf", "b")
+    
+    assert jobs.claim_next()["id"] == first["id"]
+    assert jobs.claim_next()["id"] == second["id"]
+
+def test_latest_by_document(jobs):
+    jobs.enqueue("a.pdf", "a")
+    latest = jobs.enqueue("a.pdf", "a")
+    jobs.enqueue("b.pdf", "b")
+    
+    by_document = jobs.latest_by_document()
+    assert set(by_document) == {"a", "b"}
+    assert by_document["a"]["id"] == latest["id"]
+
+def test_running_job_of_a_live_process_is_not_requeued(jobs):
+    job = jobs.enqueue("a.pdf", "a")
+    jobs.claim_next()
+    # Another live API worker with a fresh heartbeat
+    jobs.update(job["id"], owner_pid=os.getppid())
+    
+    assert jobs.requeue_interrupted(lease_seconds=60) == 0
+    assert jobs.get(job["id"])["state"] == "extracting"
+
+def test_job_of_this_process_is_kept_while_running(jobs):
+    job = jobs.enqueue("a.pdf", "a")
+    jobs.claim_next()
+    
+    assert jobs.requeue_interrupted(lease_seconds=60, running=[job["id"]]) == 0
+    # Not running here: left by an earlier process that had the same pid
+    assert jobs.requeue_interrupted(lease_seconds=60, running=[]) == 1
+
+def test_job_of_a_dead_process_is_requeued(jobs):
+    job = jobs.enqueue("a.pdf", "a")
+    jobs.claim_next()
+    jobs.update(job["id"], owner_pid=dead_pid())
+    
+    assert jobs.requeue_interrupted(lease_seconds=60) == 1
+    requeued = jobs.get(job["id"])
+    assert requeued["state"] == "queued"
+    assert requeued["owner_pid"] is None
+    assert jobs.claim_next()["attempts"] == 2
+
+def test_expired_lease_is_requeued_and_heartbeat_renews_it(jobs):
+    job = jobs.enqueue("a.pdf", "a")
+    jobs.claim_next()
+    jobs.update(job["id"], heartbeat_at=time.time() - 120)
+    
+    jobs.heartbeat([job["id"]])
+    assert jobs.requeue_interrupted(lease_seconds=60, running=[job["id"]]) == 0
+    
+    jobs.update(job["id"], owner_pid=os.getppid(), heartbeat_at=time.time() - 120)
+    assert jobs.requeue_interrupted(lease_seconds=60) == 1
+
+def test_finished_jobs_are_never_requeued(jobs):
+    job = jobs.enqueue("a.pdf", "a")
+    jobs.claim_next()
+    jobs.update(job["id"], state="failed", owner_pid=dead_pid())
+    
+    assert jobs.requeue_interrupted(lease_seconds=0) == 0
+    assert jobs.get(job["id"])["state"] == "failed"
+
+class FakeTorch:
+    def __init__(self):
+        self.threads = None
+    
+    def set_num_threads(self, threads):
+        self.threads = threads
+
+@pytest.mark.parametrize("backend, imports_torch", [("torch", True), ("onnx", False), ("remote", False)])
+def test_worker_init_only_touches_torch_for_the_torch_backend(monkeypatch, backend, imports_torch):
+    torch = FakeTorch()
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    
+    _init_worker({"model_name": "m", "backend": backend}, torch_threads=2, nice=0)
+    
+    assert torch.threads == (2 if imports_torch else None)
+
+class FakeChunkCache:
+    """Every text is cached, so no embedding worker is needed"""
+    
+    def __init__(self):
+        self.lookups = []
+    
+    def get_many(self, texts):
+        self.lookups.extend(texts)
+        return {text: [1.0, 0.0] for text in texts}
+    
+    def put_many(self, embeddings):
+        pass
+
+class FakeEmbeddingsManager:
+    def __init__(self, processed_dir):
+        self.processed_dir = processed_dir
+        self.chunk_cache = FakeChunkCache()
+        self.upserts = []
+    
+    def embedding_config(self):
+        return {"model_name": "unused", "backend": "torch"}
+    
+    def get_document_chunk_ids(self, document_id):
+        return []
+    
+    def upsert_documents(self, chunks, batch_size=None, embeddings=None):
+        # The chunk file must already exist for the lexical index fingerprint
+        chunk_files = [name for name in os.listdir(self.processed_dir) if name.endswith("_chunks.json")]
+        self.upserts.append((chunks, embeddings, chunk_files))
+
+def write_pdf(path: str) -> None:
+    document = fitz.open()
+    page = document.new_page()
+    page.insert_text((72, 72), "Dieu 1. Pham vi dieu chinh")
+    page.insert_text((72, 96), "Quy che nay ap dung cho sinh vien dai hoc chinh quy.")
+    document.save(path)
+
+def wait_for(jobs, job_id, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job["state"] in ("done", "failed"):
+            return job
+        time.sleep(0.1)
+    raise TimeoutError(f"Job {job_id} did not finish")
+
+@pytest.fixture
+def worker(tmp_path, jobs):
+    processor = DocumentProcessor(
+        chunk_size=500,
+        chunk_overlap=50,
+        raw_dir=str(tmp_path / "raw"),
+        processed_dir=str(tmp_path / "processed")
+    )
+    embeddings_manager = FakeEmbeddingsManager(processor.processed_dir)
+    worker = IngestionWorker(jobs, processor, embeddings_manager, max_workers=1, nice=0, poll_interval=0.1)
+    worker.start()
+    yield worker
+    worker.stop()
+
+def test_worker_ingests_a_pdf(worker, jobs):
+    write_pdf(os.path.join(worker.document_processor.raw_dir, "quy_che.pdf"))
+    job = jobs.enqueue("quy_che.pdf", "quy_che")
+    worker.notify()
+    
+    done = wait_for(jobs, job["id"])
+    assert done["state"] == "done", done["error"]
+    assert done["chunk_count"] >= 1
+    assert {"extract_s", "embed_s", "index_s", "total_s"} <= set(done["timings"])
+    
+    chunks, embeddings, chunk_files = worker.embeddings_manager.upserts[0]
+    assert chunk_files == ["quy_che_chunks.json"]
+    assert set(embeddings) == {chunk["metadata"]["chunk_id"] for chunk in chunks}
+    assert "quy_che.pdf" in worker.document_processor.load_manifest()
+
+def test_worker_marks_failed_jobs(worker, jobs):
+    job = jobs.enqueue("missing.pdf", "missing")
+    worker.notify()
+    
+    failed = wait_for(jobs, job["id"])
+    assert failed["state"] == "failed"
+    assert failed["error"]
+    assert failed["finished_at"] is not None
+    assert worker.embeddings_manager.upserts == []
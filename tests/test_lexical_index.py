@@ -0,0 +1,129 @@
+import json
+import os
+import time
+
+from app.rag.lexical_index import BM25Index, strip_diacritics, tokenize_vietnamese
+
+def chunk(chunk_id, text, source="quy_che.pdf"):
+    return {"text": text, "metadata": {"chunk_id": chunk_id, "source": source}}
+
+CHUNKS = [
+    chunk("c1", "Điều kiện xét tốt nghiệp đối với sinh viên"),
+    chunk("c2", "Học phí được đóng theo từng học kỳ"),
+    chunk("c3", "Sinh viên bị cảnh báo học tập khi điểm trung bình thấp", source="canh_bao.pdf"),
+]
+
+def write_chunks(directory, name, chunks):
+    with open(os.path.join(directory, f"{name}_chunks.json"), "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False)
+
+def test_tokenize_adds_bigrams_and_unaccented_syllables():
+    tokens = tokenize_vietnamese("Tốt nghiệp")
+    
+    assert tokens[:2] == ["tốt", "nghiệp"]
+    assert "tốt_nghiệp" in tokens
+    assert "tot" in tokens and "nghiep" in tokens
+    assert strip_diacritics("đào tạo") == "dao tao"
+
+def test_search_ranks_matching_chunk_first():
+    index = BM25Index()
+    index.add(CHUNKS)
+    
+    hits = index.search("điều kiện tốt nghiệp", k=3)
+    assert hits[0][0] == "c1"
+    assert all(score > 0 for _, score in hits)
+    # Queries typed without accents still match
+    assert index.search("hoc phi", k=1)[0][0] == "c2"
+    assert index.search("không có từ nào khớp", k=3) == []
+
+def test_search_with_source_filter():
+    index = BM25Index()
+    index.add(CHUNKS)
+    
+    assert [chunk_id for chunk_id, _ in index.search("sinh viên", k=3, source="canh_bao.pdf")] == ["c3"]
+    assert index.search("sinh viên", k=3, source="unknown.pdf") == []
+
+def test_add_replaces_chunk_with_same_id_and_remove_tombstones():
+    index = BM25Index()
+    index.add(CHUNKS)
+    index.add([chunk("c2", "Lịch thi cuối kỳ")])
+    
+    assert len(index) == 3
+    assert "c2" not in [chunk_id for chunk_id, _ in index.search("học phí", k=3)]
+    assert index.search("lịch thi", k=1)[0][0] == "c2"
+    
+    index.remove(["c1", "missing"])
+    assert len(index) == 2
+    assert "c1" not in [chunk_id for chunk_id, _ in index.search("sinh viên", k=3)]
+
+def test_compaction_keeps_results():
+    index = BM25Index()
+    index.add([chunk(f"c{i}", f"văn bản số {i} về học phí") for i in range(8)])
+    before = {chunk_id for chunk_id, _ in index.search("học phí", k=8)}
+    # Removing more than a quarter of the slots compacts the postings
+    index.remove(["c0", "c1", "c2"])
+    
+    assert len(index.chunk_ids) == 5
+    assert {chunk_id for chunk_id, _ in index.search("học phí", k=8)} == before - {"c0", "c1", "c2"}
+
+def test_load_or_build_reuses_index_until_chunk_files_change(tmp_path):
+    processed_dir, index_path = str(tmp_path), str(tmp_path / "lexical_index.pkl")
+    write_chunks(processed_dir, "a", CHUNKS[:2])
+    built = BM25Index.load_or_build(processed_dir, index_path)
+    assert len(built) == 2
+    
+    # Unchanged files: the saved copy is loaded as is
+    with open(index_path, "rb") as f:
+        saved = f.read()
+    reloaded = BM25Index.load_or_build(processed_dir, index_path)
+    assert reloaded.fingerprint == built.fingerprint
+    with open(index_path, "rb") as f:
+        assert f.read() == saved
+    
+    write_chunks(processed_dir, "b", CHUNKS[2:])
+    assert len(BM25Index.load_or_build(processed_dir, index_path)) == 3
+
+def test_listener_saves_once_after_a_burst_of_changes(tmp_path):
+    processed_dir, index_path = str(tmp_path), str(tmp_path / "lexical_index.pkl")
+    write_chunks(processed_dir, "a", CHUNKS[:1])
+    index = BM25Index.load_or_build(processed_dir, index_path, save_delay=0.2)
+    saved_at = os.stat(index_path).st_mtime_ns
+    
+    write_chunks(processed_dir, "b", CHUNKS[1:])
+    index.on_vector_store_change("add", CHUNKS[1:2])
+    index.on_vector_store_change("add", CHUNKS[2:])
+    # Nothing is written on the calling thread
+    assert os.stat(index_path).st_mtime_ns == saved_at
+    
+    deadline = time.monotonic() + 5
+    while os.stat(index_path).st_mtime_ns == saved_at and time.monotonic() < deadline:
+        time.sleep(0.05)
+    reloaded = BM25Index.load(index_path)
+    assert len(reloaded) == 3
+    # The saved fingerprint covers the new chunk file, so the next startup does not rebuild
+    assert reloaded.fingerprint == BM25Index.directory_fingerprint(processed_dir)
+
+def test_flush_saves_pending_changes(tmp_path):
+    processed_dir, index_path = str(tmp_path), str(tmp_path / "lexical_index.pkl")
+    write_chunks(processed_dir, "a", CHUNKS)
+    index = BM25Index.load_or_build(processed_dir, index_path, save_delay=60)
+    
+    index.on_vector_store_change("delete", ["c1"])
+    index.flush()
+    
+    assert len(BM25Index.load(index_path)) == 2
+
+def test_reload_picks_up_chunks_added_by_another_process(tmp_path):
+    processed_dir, index_path = str(tmp_path), str(tmp_path / "lexical_index.pkl")
+    write_chunks(processed_dir, "a", CHUNKS[:1])
+    writer = BM25Index.load_or_build(processed_dir, index_path, save_delay=60)
+    reader = BM25Index.load_or_build(processed_dir, index_path)
+    
+    write_chunks(processed_dir, "b", CHUNKS[1:])
+    writer.on_vector_store_change("add", CHUNKS[1:])
+    assert reader.search("học phí", k=1) == []
+    
+    # The writer's save is still pending; the reader rebuilds from the chunk files
+    reader.on_vector_store_change("reload", [])
+    assert reader.search("học phí", k=1)[0][0] == "c2"
+    assert len(reader) == 3
@@ -0,0 +1,57 @@
+from app.rag.embeddings import EmbeddingsManager
+from app.rag.query_encoder import QueryEmbeddingCache
+
+class RecordingModel:
+    def __init__(self):
+        self.calls = []
+    
+    def embed_documents(self, texts):
+        self.calls.append(texts)
+        return [[float(len(text)), 0.0] for text in texts]
+
+def manager_with(model):
+    """EmbeddingsManager with only its query cache, without a vector store"""
+    manager = EmbeddingsManager.__new__(EmbeddingsManager)
+    manager.embedding_model = model
+    manager.query_cache = QueryEmbeddingCache("model")
+    return manager
+
+def test_evicted_entries_are_spilled_and_promoted(tmp_path):
+    cache = QueryEmbeddingCache("model", max_size=1, spill_path=str(tmp_path / "spill.sqlite"))
+    cache.put("q1", [1.0, 0.0])
+    cache.put("q2", [0.0, 1.0])
+    
+    assert cache.get_memory("q1") is None
+    assert cache.get_spilled("q1") == [1.0, 0.0]
+    assert cache.get_memory("q1") == [1.0, 0.0]
+    assert cache.stats()["disk_hits"] == 1
+
+def test_flush_keeps_the_working_set_across_restarts(tmp_path):
+    path = str(tmp_path / "spill.sqlite")
+    cache = QueryEmbeddingCache("model", max_size=10, spill_path=path)
+    cache.put("q1", [1.0, 0.0])
+    cache.flush()
+    
+    reopened = QueryEmbeddingCache("model", max_size=10, spill_path=path)
+    assert reopened.get("q1") == [1.0, 0.0]
+    # Entries of another model are not shared
+    assert QueryEmbeddingCache("other", spill_path=path).get("q1") is None
+
+def test_memory_lookup_does_not_count_misses():
+    cache = QueryEmbeddingCache("model")
+    
+    assert cache.get_memory("q") is None
+    assert cache.stats()["misses"] == 0
+    assert cache.get("q") is None
+    assert cache.stats()["misses"] == 1
+
+def test_model_sees_the_query_as_asked_and_the_cache_key_is_normalized():
+    model = RecordingModel()
+    manager = manager_with(model)
+    
+    first = manager.embed_query("Điều kiện TỐT NGHIỆP?")
+    assert model.calls == [["Điều kiện TỐT NGHIỆP?"]]
+    assert manager.embed_query("điều kiện tốt nghiệp") == first
+    
+    assert manager.embed_queries(["Học phí?", "học phí", "Điều kiện tốt nghiệp"]) == [[8.0, 0.0], [8.0, 0.0], first]
+    assert model.calls[1:] == [["Học phí?"]]
@@ -0,0 +1,58 @@
+from app.rag.document_processor import RegulationTextSplitter
+
+def regulation_pages():
+    long_clause = "2. " + " ".join(f"sinh viên phải hoàn thành học phần thứ {i};" for i in range(60))
+    text = "\n".join([
+        "Chương I",
+        "QUY ĐỊNH CHUNG",
+        "Điều 1. Phạm vi điều chỉnh",
+        "Quy chế này áp dụng cho sinh viên đại học chính quy.",
+        "Điều 2. Điều kiện xét tốt nghiệp của sinh viên hệ chính quy",
+        "1. Tích lũy đủ số tín chỉ của chương trình đào tạo.",
+        long_clause,
+        "3. Không bị truy cứu trách nhiệm hình sự.",
+    ])
+    return [(1, text)]
+
+def test_short_article_is_one_chunk_with_structure_metadata():
+    splitter = RegulationTextSplitter(chunk_size=300, chunk_overlap=50)
+    chunks = list(splitter.iter_chunks(regulation_pages(), {"source": "quy_che.pdf"}))
+    
+    first = chunks[0]
+    assert first["text"].startswith("Điều 1.")
+    assert first["metadata"]["article"] == 1
+    assert first["metadata"]["chapter"] == "I"
+    assert first["metadata"]["chapter_title"] == "QUY ĐỊNH CHUNG"
+    assert first["metadata"]["source"] == "quy_che.pdf"
+
+def test_pieces_of_a_long_clause_fit_in_chunk_size_with_the_heading():
+    splitter = RegulationTextSplitter(chunk_size=300, chunk_overlap=50)
+    chunks = [chunk for chunk in splitter.iter_chunks(regulation_pages()) if chunk["metadata"].get("article") == 2]
+    heading = "Điều 2. Điều kiện xét tốt nghiệp của sinh viên hệ chính quy\n"
+    
+    assert len(chunks) > 3
+    for chunk in chunks:
+        assert len(chunk["text"]) <= 300
+        assert chunk["text"].startswith(heading)
+    long_pieces = [chunk for chunk in chunks if chunk["metadata"].get("clause_start") == 2]
+    assert len(long_pieces) > 1
+    assert all(chunk["metadata"]["clause_end"] == 2 for chunk in long_pieces)
+
+def test_pieces_of_a_long_clause_cite_their_own_pages():
+    pages = [(4, "Điều 7. Học phí\n2. " + "sinh viên nộp học phí đúng hạn; " * 8 + "\n")]
+    pages += [(page, "đợt thứ %d phải nộp trước ngày mười lăm; " % page * 8 + "\n") for page in (5, 6)]
+    splitter = RegulationTextSplitter(chunk_size=300, chunk_overlap=50)
+    
+    pieces = list(splitter.iter_chunks(pages))
+    ranges = [(chunk["metadata"]["page_start"], chunk["metadata"]["page_end"]) for chunk in pieces]
+    
+    assert len(pieces) > 3
+    assert ranges[0][0] == 4 and ranges[-1] == (6, 6)
+    assert ranges == sorted(ranges)
+    assert all(end - start <= 1 for start, end in ranges)
+    # start_index points at the piece in the document text
+    document = "".join(text for _, text in pages)
+    for chunk in pieces:
+        body = chunk["text"][len("Điều 7. Học phí\n"):]
+        start = chunk["metadata"]["start_index"]
+        assert document[start:start + len(body)] == body
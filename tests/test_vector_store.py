@@ -0,0 +1,172 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from app.rag.vector_store import NumpyVectorStore
+
+DIM = 16
+
+def random_vectors(n, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+def add(store, start, vectors, source="a.pdf"):
+    ids = [f"c{start + i}" for i in range(len(vectors))]
+    store.upsert(
+        ids=ids,
+        embeddings=vectors.tolist(),
+        texts=[f"text {chunk_id}" for chunk_id in ids],
+        metadatas=[
+            {"chunk_id": chunk_id, "source": source, "document_id": source[:-4], "article": i % 3}
+            for i, chunk_id in enumerate(ids)
+        ]
+    )
+    return ids
+
+def hit_ids(results):
+    return [[hit["metadata"]["chunk_id"] for hit in hits] for hits in results]
+
+@pytest.fixture
+def store(tmp_path):
+    return NumpyVectorStore(str(tmp_path / "store"))
+
+def test_upsert_get_and_replace(store):
+    vectors = random_vectors(3)
+    add(store, 0, vectors)
+    
+    assert store.count() == 3
+    chunk = store.get(["c1", "missing"], include_embeddings=True)
+    assert list(chunk) == ["c1"]
+    assert chunk["c1"]["text"] == "text c1"
+    assert chunk["c1"]["metadata"]["source"] == "a.pdf"
+    assert np.allclose(chunk["c1"]["embedding"], vectors[1] / np.linalg.norm(vectors[1]), atol=1e-6)
+    
+    store.upsert(["c1"], [vectors[2].tolist()], ["new text"], [{"chunk_id": "c1", "source": "b.pdf"}])
+    assert store.count() == 3
+    assert store.get(["c1"])["c1"]["text"] == "new text"
+    assert store.query([vectors[2].tolist()], k=2)[0][0]["score"] == pytest.approx(1.0, abs=1e-5)
+
+def test_delete(store):
+    vectors = random_vectors(4)
+    add(store, 0, vectors)
+    store.delete(["c0", "missing"])
+    
+    assert store.count() == 3
+    assert store.get(["c0"]) == {}
+    assert sorted(store.get_ids()) == ["c1", "c2", "c3"]
+    assert "c0" not in hit_ids(store.query([vectors[0].tolist()], k=3))[0]
+
+def test_filtered_search(store):
+    add(store, 0, random_vectors(6, seed=1), source="a.pdf")
+    add(store, 6, random_vectors(6, seed=2), source="b.pdf")
+    query = random_vectors(1, seed=3).tolist()
+    
+    hits = store.query(query, k=10, where={"source": "b.pdf"})[0]
+    assert len(hits) == 6
+    assert {hit["metadata"]["source"] for hit in hits} == {"b.pdf"}
+    assert [hit["score"] for hit in hits] == sorted((hit["score"] for hit in hits), reverse=True)
+    
+    # Fields without an in-memory mask are filtered through the row table
+    assert sorted(store.get_ids(where={"document_id": "a", "article": 0})) == ["c0", "c3"]
+    assert store.get_ids(where={"source": "unknown.pdf"}) == []
+    with pytest.raises(ValueError):
+        store.query(query, where={"article": {"$gt": 1}})
+
+def test_writes_append_to_the_vectors_file(store):
+    add(store, 0, random_vectors(4))
+    vectors_path = os.path.join(store.directory, "vectors-1.f32")
+    inode = os.stat(vectors_path).st_ino
+    
+    add(store, 4, random_vectors(2, seed=1))
+    
+    assert os.stat(vectors_path).st_ino == inode
+    assert os.path.getsize(vectors_path) == 6 * DIM * 4
+    assert [name for name in os.listdir(store.directory) if name.startswith("vectors-")] == ["vectors-1.f32"]
+
+def test_another_instance_sees_new_generations(store):
+    reader = NumpyVectorStore(store.directory)
+    vectors = random_vectors(8)
+    add(store, 0, vectors[:4])
+    assert reader.count() == 4
+    
+    add(store, 4, vectors[4:])
+    store.delete(["c1"])
+    assert reader.count() == 7
+    assert reader.get(["c1"]) == {}
+    assert hit_ids(reader.query([vectors[5].tolist()], k=1)) == [["c5"]]
+    assert reader.get_ids(where={"source": "a.pdf"}) == [f"c{i}" for i in range(8) if i != 1]
+
+def test_compaction_moves_live_rows_to_a_new_epoch(store):
+    reader = NumpyVectorStore(store.directory)
+    vectors = random_vectors(8)
+    add(store, 0, vectors)
+    assert reader.count() == 8
+    
+    store.delete(["c0", "c1", "c2"])
+    
+    files = os.listdir(store.directory)
+    assert "vectors-2.f32" in files and "vectors-1.f32" not in files
+    assert os.path.getsize(os.path.join(store.directory, "vectors-2.f32")) == 5 * DIM * 4
+    assert reader.count() == 5
+    assert hit_ids(reader.query([vectors[6].tolist()], k=1)) == [["c6"]]
+    assert sorted(NumpyVectorStore(store.directory).get_ids()) == ["c3", "c4", "c5", "c6", "c7"]
+
+def test_rows_of_a_write_that_crashed_are_ignored(store):
+    vectors = random_vectors(6)
+    add(store, 0, vectors[:3])
+    manifest_path = os.path.join(store.directory, "manifest.json")
+    shutil.copy(manifest_path, manifest_path + ".bak")
+    add(store, 3, vectors[3:])
+    store.delete(["c0"])
+    # As if the process died before replacing the manifest
+    shutil.copy(manifest_path + ".bak", manifest_path)
+    
+    reopened = NumpyVectorStore(store.directory)
+    assert sorted(reopened.get_ids()) == ["c0", "c1", "c2"]
+    
+    add(reopened, 10, vectors[5:])
+    assert sorted(NumpyVectorStore(store.directory).get_ids()) == ["c0", "c1", "c10", "c2"]
+    assert os.path.getsize(os.path.join(store.directory, "vectors-1.f32")) == 4 * DIM * 4
+
+def test_hnsw_matches_exact_search(tmp_path):
+    vectors = random_vectors(400)
+    queries = random_vectors(20, seed=1).tolist()
+    exact = NumpyVectorStore(str(tmp_path / "exact"))
+    graph = NumpyVectorStore(str(tmp_path / "hnsw"), hnsw_threshold=100, hnsw_ef_search=200)
+    for store in (exact, graph):
+        add(store, 0, vectors)
+        store.persist()
+    assert graph._refresh().hnsw is not None
+    
+    expected, found = hit_ids(exact.query(queries, k=5)), hit_ids(graph.query(queries, k=5))
+    recall = np.mean([len(set(a) & set(b)) / 5 for a, b in zip(expected, found)])
+    assert recall >= 0.95
+    
+    # Rows written after the graph are searched exactly, deleted rows are skipped
+    for store in (exact, graph):
+        store.delete(["c0", "c1"])
+        add(store, 1000, vectors[:2] * 2)
+    assert graph._refresh().hnsw_rows == 400
+    found = hit_ids(graph.query(vectors[:2].tolist(), k=5))
+    assert [hits[0] for hits in found] == ["c1000", "c1001"]
+    assert not {"c0", "c1"} & {chunk_id for hits in found for chunk_id in hits}
+    assert len(graph.get_ids()) == 400
+    
+    # persist() extends the graph with the new rows
+    graph.persist()
+    state = graph._refresh()
+    assert state.hnsw_rows == 402 and state.hnsw_unmarked == 0
+    assert [hits[0] for hits in hit_ids(graph.query(vectors[:2].tolist(), k=5))] == ["c1000", "c1001"]
+    expected, found = hit_ids(exact.query(queries, k=5)), hit_ids(graph.query(queries, k=5))
+    assert np.mean([len(set(a) & set(b)) / 5 for a, b in zip(expected, found)]) >= 0.95
+
+def test_unknown_format_is_rejected(tmp_path):
+    directory = str(tmp_path / "store")
+    os.makedirs(directory)
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"format": 1, "generation": 4, "dim": DIM, "rows": 3}, f)
+    
+    with pytest.raises(ValueError, match="Unsupported vector store format"):
+        NumpyVectorStore(directory)
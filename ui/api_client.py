@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+import httpx
+
+# API settings
+API_URL = os.getenv("API_URL", "http://localhost:8051")
+API_PREFIX = os.getenv("API_PREFIX", "/api/v1")
+
+# Connection pool shared by every chat session of this UI process
+MAX_CONNECTIONS = int(os.getenv("UI_HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UI_HTTP_MAX_KEEPALIVE", "20"))
+CONNECT_RETRIES = int(os.getenv("UI_HTTP_RETRIES", "2"))
+
+# Short calls such as /documents
+DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+
+# Streaming chat: no read timeout between tokens, but fail fast on connect
+CHAT_STREAM_TIMEOUT = httpx.Timeout(None, connect=5.0)
+
+# Uploads stream the file from disk, which can take a while for large PDFs
+UPLOAD_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+
+# How long the document list is served without asking the API again
+DOCUMENTS_CACHE_TTL = float(os.getenv("DOCUMENTS_CACHE_TTL", "10"))
+
+_client: Optional[httpx.AsyncClient] = None
+
+def api_url(path: str) -> str:
+    return f"{API_URL}{API_PREFIX}{path}"
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide async HTTP client
+    
+    Keep-alive connections are reused across requests and sessions instead
+    of opening a new TCP connection per call. Failed connection attempts are
+    retried by the transport; requests that reached the API are not, so
+    uploads and chats are never sent twice.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=DEFAULT_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=CONNECT_RETRIES)
+        )
+    return _client
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def describe_http_error(error: Exception) -> str:
+    """User-facing message for a failed request to the API"""
+    if isinstance(error, httpx.PoolTimeout):
+        return "Hệ thống đang quá tải (hết kết nối tới API), vui lòng thử lại sau."
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+        return f"Không kết nối được tới API tại {API_URL} sau {CONNECT_RETRIES + 1} lần thử."
+    if isinstance(error, httpx.TimeoutException):
+        return "API không phản hồi kịp, vui lòng thử lại."
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"API trả về lỗi {error.response.status_code}."
+    return str(error) or type(error).__name__
+
+async def upload_pdf(path: str, document_id: str) -> Dict[str, Any]:
+    """Upload a PDF from disk and return the API response, or an error entry"""
+    # Gửi file từ đĩa theo từng phần thay vì đọc toàn bộ vào bộ nhớ
+    with open(path, "rb") as f:
+        response = await get_client().post(
+            api_url("/upload"),
+            files={"file": (Path(path).name, f, "application/pdf")},
+            data={"document_id": document_id},
+            timeout=UPLOAD_TIMEOUT
+        )
+    
+    if response.status_code == 200:
+        return response.json()
+    return {"error": f"Failed to upload file. Status: {response.status_code}, Message: {response.text}"}
+
+class DocumentListCache:
+    """
+    Document list shared by all sessions
+    
+    A fresh copy (younger than ttl seconds) is returned without a request.
+    Once stale, the list is revalidated with its ETag, so an unchanged list
+    costs a 304 with no body. Concurrent callers share one request.
+    """
+    
+    def __init__(self, ttl: float = DOCUMENTS_CACHE_TTL):
+        self.ttl = ttl
+        self.documents: Optional[List[Dict[str, Any]]] = None
+        self.etag: Optional[str] = None
+        self.fetched_at = 0.0
+        self._lock = asyncio.Lock()
+    
+    def invalidate(self) -> None:
+        """Force the next get() to revalidate, e.g. after an upload"""
+        self.fetched_at = 0.0
+    
+    def _is_fresh(self) -> bool:
+        return self.documents is not None and time.monotonic() - self.fetched_at < self.ttl
+    
+    async def get(self) -> List[Dict[str, Any]]:
+        if self._is_fresh():
+            return self.documents
+        async with self._lock:
+            if self._is_fresh():
+                return self.documents
+            
+            headers = {"If-None-Match": self.etag} if self.etag and self.documents is not None else {}
+            response = await get_client().get(api_url("/documents"), headers=headers)
+            if response.status_code == 304:
+                self.fetched_at = time.monotonic()
+                return self.documents
+            response.raise_for_status()
+            
+            self.documents = response.json()
+            self.etag = response.headers.get("etag")
+            self.fetched_at = time.monotonic()
+            return self.documents
+
+document_list = DocumentListCache()
@@ -1,16 +1,19 @@
 from pathlib import Path
 import os
-import requests
+import sys
+import asyncio
+import httpx
 import chainlit as cl
 # from chainlit.playground.config import PlaygroundConfig
 # from chainlit.playground.providers.openai import OpenAISettings
 from chainlit.element import Element
 import json
-from typing import Dict, List, Any
+from typing import Dict, List, Any, AsyncIterator, Tuple
 
-# API settings
-API_URL = os.getenv("API_URL", "http://localhost:8051")
-API_PREFIX = os.getenv("API_PREFIX", "/api/v1")
+# Add this directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from api_client import get_client, close_client, api_url, upload_pdf, document_list, describe_http_error, CHAT_STREAM_TIMEOUT
 
 # Customize UI
 
@@ -60,42 +63,53 @@ async def setup_agent(settings):
 
 # Message handler
 
-def process_message_element(element):
+async def process_message_element(element):
     extension = Path(element.path).suffix.lower()
     if extension == ".pdf":
-        # Đọc file PDF dưới dạng nhị phân
-        with open(element.path, "rb") as f:
-            pdf_content = f.read()
-
-        # Chuẩn bị dữ liệu gửi
-        files_data = {
-            "file": (Path(element.path).name, pdf_content, "application/pdf")
-        }
-        data = {
-            "document_id": element.name  # Gửi document_id trong form-data
-        }
-
-        # Gửi request đến API
-        response = requests.post(
-            f"{API_URL}{API_PREFIX}/upload",
-            files=files_data,
-            data=data
-        )
-
-        # Kiểm tra phản hồi từ server
-        if response.status_code == 200:
-            return response.json()  # Trả về dữ liệu JSON từ server
-        else:
-            return {"error": f"Failed to upload file. Status: {response.status_code}, Message: {response.text}"}
-
+        # document_id được gửi trong form-data
+        return await upload_pdf(element.path, element.name)
     else:
         return {"error": "Unsupported file format"}
+
+
+async def upload_and_report(element):
+    """Upload one PDF and post the outcome as its own message"""
+    try:
+        result = await process_message_element(element)
+    except httpx.HTTPError as e:
+        result = {"error": describe_http_error(e)}
+    if "error" in result:
+        content = f"Lỗi khi tải lên file `{element.name}`: {result['error']}"
+    elif result.get("status") == "processed":
+        content = f"File `{element.name}` đã có trong hệ thống (`{result['filename']}`), không cần xử lý lại."
+    else:
+        content = f"Đã tải lên file `{element.name}` thành công. Hệ thống đang xử lý..."
+        document_list.invalidate()
+    await cl.Message(content=content, author="System").send()
+
+
+async def iter_sse(response: httpx.Response) -> AsyncIterator[Tuple[str, Any]]:
+    """Parse a server-sent event stream into (event, data) pairs"""
+    event, data_lines = "message", []
+    async for line in response.aiter_lines():
+        if line == "":
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+
 @cl.on_message
 async def on_message(message: cl.Message):
     # Set up loading message
     msg = cl.Message(content="", author="Chatbot")
     await msg.send()
 
+    # PDFs are uploaded concurrently, while the answer streams
+    uploads = []
     try:
         elements = message.elements
         for element in elements:
@@ -103,71 +117,76 @@ async def on_message(message: cl.Message):
                 extension = Path(element.path).suffix.lower()
                 if extension == ".pdf":
                     # Handle PDF file
-                    pdf_content = process_message_element(element)
-                    await cl.Message(
-                        content=f"Đã tải lên file `{element.name}` thành công. Hệ thống đang xử lý...",
-                        author="System"
-                    )
+                    uploads.append(asyncio.create_task(upload_and_report(element)))
                 else:
                     await cl.Message(
                         content=f"Chỉ chấp nhận file PDF. {element.name} không phải là file PDF.",
                         author="System"
-                    )
-            
-        # Send request to API
-        response = requests.post(
-            f"{API_URL}{API_PREFIX}/chat",
-            json={"message": message.content}
-        )
-
-        if response.status_code != 200:
-            error_msg = "Lỗi không xác định"
-            try:
-                error_data = response.json()
-                error_msg = error_data.get("detail", error_msg)
-            except:
-                pass
+                    ).send()
             
-            await cl.Message(
-                content=f"Lỗi khi gửi câu hỏi: {error_msg}",
-                author="System"
-            ).send()
-            return
-
-        result = response.json()
+        # Stream answer from API: sources first, then tokens
+        async with get_client().stream(
+            "POST",
+            api_url("/chat/stream"),
+            json={"message": message.content},
+            timeout=CHAT_STREAM_TIMEOUT
+        ) as response:
+            if response.status_code != 200:
+                error_msg = "Lỗi không xác định"
+                try:
+                    await response.aread()
+                    error_data = response.json()
+                    error_msg = error_data.get("detail", error_msg)
+                except:
+                    pass
 
-        # Create response with sources
-        response_text = result["response"]
-        sources = result.get("sources", [])
+                await cl.Message(
+                    content=f"Lỗi khi gửi câu hỏi: {error_msg}",
+                    author="System"
+                ).send()
+                return
+
+            async for event, data in iter_sse(response):
+                if event == "sources":
+                    # Attach source elements as soon as retrieval is done
+                    for i, source in enumerate(data):
+                        source_name = source["metadata"].get("source", "Unknown")
+                        source_element = Element(
+                            name=f"source_{i}",
+                            type="text",
+                            content=f"Nguồn: {source_name}\n\n{source['text']}",
+                            display="side"
+                        )
+                        await source_element.send(for_id=msg.id)
+                elif event == "token":
+                    await msg.stream_token(data)
+                elif event == "error":
+                    await cl.Message(
+                        content=f"Lỗi khi gửi câu hỏi: {data.get('detail', 'Lỗi không xác định')}",
+                        author="System"
+                    ).send()
 
-        # Update message with response
         await msg.update()
 
-        # Add source elements if available
-        if sources:
-            elements = []
-            for i, source in enumerate(sources):
-                source_text = source["text"]
-                metadata = source["metadata"]
-                source_name = metadata.get("source", "Unknown")
-
-                # Create element for source
-                source_element = Element(
-                    name=f"source_{i}",
-                    type="text",
-                    content=f"Nguồn: {source_name}\n\n{source_text}",
-                    display="side"
-                )
-                elements.append(source_element)
-
-            await cl.Message(
-                content=response_text,
-                author="Chatbot",
-                elements=elements
-            ).send()
+    except httpx.HTTPError as e:
+        # Pool timeouts and exhausted connection retries from the shared client
+        await msg.update()
+        await cl.Message(
+            content=f"Lỗi khi gửi câu hỏi: {describe_http_error(e)}",
+            author="System"
+        ).send()
 
     except Exception as e:
         await msg.update()
+        await cl.Message(
+            content=f"Lỗi khi gửi câu hỏi: {str(e) or type(e).__name__}",
+            author="System"
+        ).send()
+
+    finally:
+        # Report every upload before the handler returns
+        if uploads:
+            await asyncio.gather(*uploads, return_exceptions=True)
 
 # Startup message
 
@@ -194,25 +213,31 @@ Hãy bắt đầu bằng cách tải lên file quy chế đào tạo!
         author="System"
     ).send()
 
-    # Get list of available documents
+    # Get list of available documents (cached across sessions)
     try:
-        response = requests.get(f"{API_URL}{API_PREFIX}/documents")
-        if response.status_code == 200:
-            documents = response.json()
-            if documents:
-                doc_list = "\n".join(
-                    [f"- {doc['filename']}" for doc in documents])
-                await cl.Message(
-                    content=f"Các tài liệu sẵn có trong hệ thống:\n{doc_list}",
-                    author="System"
-                ).send()
-            else:
-                await cl.Message(
-                    content="Hiện chưa có tài liệu nào trong hệ thống. Vui lòng tải lên file PDF quy chế đào tạo.",
-                    author="System"
-                ).send()
+        documents = await document_list.get()
+        if documents:
+            doc_list = "\n".join(
+                [f"- {doc['filename']}" for doc in documents])
+            await cl.Message(
+                content=f"Các tài liệu sẵn có trong hệ thống:\n{doc_list}",
+                author="System"
+            ).send()
+        else:
+            await cl.Message(
+                content="Hiện chưa có tài liệu nào trong hệ thống. Vui lòng tải lên file PDF quy chế đào tạo.",
+                author="System"
+            ).send()
     except Exception as e:
-        print(f"Error fetching documents: {str(e)}")
+        await cl.Message(
+            content=f"Không lấy được danh sách tài liệu: {describe_http_error(e)}",
+            author="System"
+        ).send()
+
+# The pooled client is shared by all sessions, so it is closed with the app,
+# not when a chat ends. Chainlit releases without app hooks drop it on exit.
+if hasattr(cl, "on_app_shutdown"):
+    cl.on_app_shutdown(close_client)
 
 if __name__ == "__main__":
     cl.run()